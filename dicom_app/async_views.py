@@ -0,0 +1,192 @@
+"""Vues DICOMweb asynchrones (WADO, QIDO, STOW) servies par l'application ASGI.
+
+Contrairement aux APIView de dicom_web.py, ces vues ne bloquent pas de thread
+pendant l'aller-retour vers Orthanc : un seul processus peut ainsi relayer des
+centaines de requêtes du viewer en parallèle. QIDO est servi, comme QIDOView,
+par le moteur QIDO-RS local (qido.py), restreint aux études de l'utilisateur.
+STOW passe par la même ingestion locale que POST /dicom-web/studies
+(store_instances, stow.py), exécutée hors de la boucle d'événements.
+"""
+import httpx
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+
+from .dicom_web import (
+    WADO_CHUNK_SIZE, DicomJSONRenderer, RangeNotSatisfiable, accessible_studies, chunk_window,
+    plan_streaming_response, range_not_satisfiable_response, store_instances,
+)
+from .orthanc import get_async_orthanc_client
+from .qido import STUDY, QueryError, UnsupportedQuery, search as qido_search
+
+
+def _authenticate(request):
+    """Applique les authentificateurs DRF configurés (JWT) à une requête Django."""
+    for authenticator_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authenticator_class().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return None
+        if result is not None:
+            return result[0]
+    return None
+
+
+async def authenticate(request):
+    return await sync_to_async(_authenticate)(request)
+
+
+def error_response(message, status_code):
+    return JsonResponse({'error': message}, status=status_code)
+
+
+async def aiter_orthanc_content(response, start=0, end=None):
+    """Version asynchrone de dicom_web.iter_orthanc_content."""
+    position = 0
+    try:
+        async for chunk in response.aiter_bytes(chunk_size=WADO_CHUNK_SIZE):
+            if end is not None and position > end:
+                break
+            window = chunk_window(position, len(chunk), start, end)
+            if window:
+                yield chunk[window[0]:window[1]]
+            position += len(chunk)
+    finally:
+        await response.aclose()
+
+
+async def wado(request):
+    user = await authenticate(request)
+    if user is None:
+        return error_response('Authentication required', status.HTTP_401_UNAUTHORIZED)
+
+    study_instance_uid = request.GET.get('studyUID')
+    series_instance_uid = request.GET.get('seriesUID')
+    object_instance_uid = request.GET.get('objectUID')
+    if not all([study_instance_uid, series_instance_uid, object_instance_uid]):
+        return error_response('Missing required parameters', status.HTTP_400_BAD_REQUEST)
+
+    params = {
+        'studyUID': study_instance_uid,
+        'seriesUID': series_instance_uid,
+        'objectUID': object_instance_uid,
+        'requestType': 'WADO',
+        'contentType': 'application/dicom'
+    }
+    range_header = request.META.get('HTTP_RANGE')
+    headers = {'Accept-Encoding': 'identity'}
+    if range_header:
+        headers['Range'] = range_header
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        headers['If-None-Match'] = request.META['HTTP_IF_NONE_MATCH']
+
+    try:
+        response = await get_async_orthanc_client().get(
+            '/wado', params=params, headers=headers, stream=True
+        )
+    except httpx.TimeoutException:
+        return error_response('Orthanc timeout', status.HTTP_504_GATEWAY_TIMEOUT)
+    except httpx.HTTPError as e:
+        return error_response(str(e), status.HTTP_502_BAD_GATEWAY)
+
+    if response.status_code not in (200, 206):
+        try:
+            if response.status_code == 304:
+                not_modified = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+                if 'ETag' in response.headers:
+                    not_modified['ETag'] = response.headers['ETag']
+                return not_modified
+            await response.aread()
+            return error_response(f'Orthanc error: {response.text}', response.status_code)
+        finally:
+            await response.aclose()
+
+    try:
+        status_code, headers, start, end = plan_streaming_response(response, range_header)
+    except RangeNotSatisfiable as e:
+        await response.aclose()
+        return range_not_satisfiable_response(e.total_length)
+
+    streaming = StreamingHttpResponse(
+        aiter_orthanc_content(response, start, end),
+        status=status_code,
+    )
+    for name, value in headers.items():
+        streaming[name] = value
+    return streaming
+
+
+def search_studies(user, params):
+    """Recherche QIDO-RS dans l'index local, limitée aux études de l'utilisateur."""
+    return qido_search(STUDY, params, accessible_studies(user))
+
+
+async def search_orthanc(user, params):
+    """Attributs non indexés : recherche Orthanc, filtrée sur les études accessibles."""
+    response = await get_async_orthanc_client().get(
+        '/dicom-web/studies', params=params, headers={'Accept': 'application/dicom+json'}
+    )
+    if response.status_code == 204:
+        return response, []
+    if response.status_code != 200:
+        return response, None
+    results = response.json()
+    uids = {r.get('0020000D', {}).get('Value', [None])[0] for r in results}
+    allowed = await sync_to_async(lambda: set(
+        accessible_studies(user).filter(study_instance_uid__in=uids).values_list('study_instance_uid', flat=True)
+    ))()
+    return response, [r for r in results if r.get('0020000D', {}).get('Value', [None])[0] in allowed]
+
+
+async def qido(request):
+    """Ancien point d'entrée QIDO (?StudyInstanceUID=...), servi comme QIDOView par le moteur QIDO-RS."""
+    user = await authenticate(request)
+    if user is None:
+        return error_response('Authentication required', status.HTTP_401_UNAUTHORIZED)
+
+    study_instance_uid = request.GET.get('StudyInstanceUID')
+    if not study_instance_uid:
+        return error_response('Missing StudyInstanceUID parameter', status.HTTP_400_BAD_REQUEST)
+
+    try:
+        results = await sync_to_async(search_studies)(user, request.GET)
+    except QueryError as e:
+        return error_response(str(e), status.HTTP_400_BAD_REQUEST)
+    except UnsupportedQuery:
+        try:
+            response, results = await search_orthanc(user, request.GET)
+        except httpx.TimeoutException:
+            return error_response('Orthanc timeout', status.HTTP_504_GATEWAY_TIMEOUT)
+        except httpx.HTTPError as e:
+            return error_response(str(e), status.HTTP_502_BAD_GATEWAY)
+        if results is None:
+            return error_response(f'Orthanc error: {response.text}', response.status_code)
+    return JsonResponse(results, safe=False, content_type='application/dicom+json')
+
+
+async def stow(request):
+    """
+    STOW-RS : un corps multipart/related; type="application/dicom" est
+    ingéré localement (indexation, déduplication, rattachement au patient
+    ?patient=) puis relayé à Orthanc, comme par POST /dicom-web/studies.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return error_response('Authentication required', status.HTTP_401_UNAUTHORIZED)
+    # Seuls les médecins peuvent envoyer des images DICOM (cf. CanUploadDicom)
+    if user.role != 'DOCTOR':
+        return error_response('Permission denied', status.HTTP_403_FORBIDDEN)
+    if request.method != 'POST':
+        return error_response('Method not allowed', status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    # Lecture du corps, ORM et écriture des fichiers sont synchrones
+    status_code, body = await sync_to_async(store_instances)(request, user, request)
+    if 'error' in body:
+        return error_response(body['error'], status_code)
+    return JsonResponse(body, status=status_code, content_type=DicomJSONRenderer.media_type)
+
+
+# Authentification par jeton : pas de cookie de session, donc pas de CSRF
+# (équivalent du csrf_exempt appliqué par les APIView DRF).
+stow.csrf_exempt = True
@@ -0,0 +1,200 @@
+"""Scénarios de charge des principaux endpoints et comparaison entre exécutions.
+
+Chaque scénario envoie ses requêtes à travers toute la pile Django
+(middlewares, authentification JWT, permissions, sérialisation) avec le
+client de test, au nom d'un médecin du jeu de données synthétique, et
+mesure la latence et le nombre de requêtes SQL de chacune. Les résultats
+sont des dictionnaires sérialisables en JSON ; compare() les confronte à
+une exécution de référence.
+"""
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from pydicom.uid import generate_uid
+from rest_framework_simplejwt.tokens import AccessToken
+
+from medical.models import MedicalRecord
+from pycrafted.middleware import QueryCounter
+from .models import DicomStudy, DicomSeries, DicomInstance
+from .synthetic import CT_IMAGE_STORAGE, dicom_bytes, dicom_dataset
+
+# Valeurs distinctes parcourues par les scénarios de détail
+SAMPLE_SIZE = 100
+# Instances envoyées dans une même étude par le scénario d'upload
+UPLOADS_PER_STUDY = 10
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 2)
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round((len(latencies) + errors) / elapsed, 1) if elapsed else None,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+class Scenario:
+    """
+    Une requête répétée. `path` et `data` sont des valeurs ou des fonctions
+    de l'élément courant de `values` (parcouru en boucle) ; sans `values`,
+    de l'indice de l'itération. Une liste `values` vide désactive le
+    scénario (données absentes).
+    """
+
+    def __init__(self, name, path, data=None, method='get', values=None):
+        self.name = name
+        self.path = path
+        self.data = data
+        self.method = method
+        self.values = values
+
+    @property
+    def available(self):
+        return self.values is None or len(self.values) > 0
+
+    def request(self, iteration):
+        value = iteration if self.values is None else self.values[iteration % len(self.values)]
+        path = self.path(value) if callable(self.path) else self.path
+        data = self.data(value) if callable(self.data) else self.data
+        return path, data
+
+
+def upload_data(patient_id, seed):
+    def data(iteration):
+        study = iteration // UPLOADS_PER_STUDY
+        content = dicom_bytes(dicom_dataset(
+            CT_IMAGE_STORAGE, 'CT',
+            generate_uid(entropy_srcs=['benchmark', str(seed), 'study', str(study)]),
+            generate_uid(entropy_srcs=['benchmark', str(seed), 'series', str(study)]),
+            generate_uid(entropy_srcs=['benchmark', str(seed), 'instance', str(iteration)]),
+            iteration % UPLOADS_PER_STUDY + 1,
+        ))
+        return {
+            'file': SimpleUploadedFile('benchmark.dcm', content, content_type='application/dicom'),
+            'patient': patient_id,
+        }
+    return data
+
+
+def endpoint_scenarios(doctor, seed=0):
+    """Listes, détails, upload, QIDO-RS, WADO-RS et WADO vus par le médecin `doctor`."""
+    patient = doctor.patients.values_list('patient_id', 'patient__username').first()
+    record_ids = list(MedicalRecord.objects.filter(doctor=doctor).values_list('pk', flat=True)[:SAMPLE_SIZE])
+    study_ids = list(DicomStudy.objects.filter(doctor=doctor).values_list('pk', flat=True)[:SAMPLE_SIZE])
+    series = list(DicomSeries.objects.filter(study__doctor=doctor).values_list(
+        'study__study_instance_uid', 'series_instance_uid'
+    )[:SAMPLE_SIZE])
+    instances = list(DicomInstance.objects.filter(series__study__doctor=doctor).values_list(
+        'series__study__study_instance_uid', 'series__series_instance_uid', 'sop_instance_uid'
+    )[:SAMPLE_SIZE])
+
+    return [
+        Scenario('hospitals-list', '/api/hospitals/'),
+        Scenario('users-me', '/api/users/me/'),
+        Scenario('appointments-list', '/api/appointments/'),
+        Scenario('medical-records-list', '/api/medical-records/'),
+        Scenario('medical-record-detail', '/api/medical-records/{}/'.format, values=record_ids),
+        Scenario('dicom-studies-list', '/api/dicom/studies/', {'view': 'summary'}),
+        Scenario('dicom-study-detail', '/api/dicom/studies/{}/'.format, values=study_ids),
+        Scenario('qido-studies', '/api/dicom/dicom-web/studies', {'PatientID': patient[1]} if patient else None,
+                 values=None if patient else []),
+        Scenario('qido-series-instances',
+                 lambda s: f'/api/dicom/dicom-web/studies/{s[0]}/series/{s[1]}/instances', values=series),
+        Scenario('wado-rs-series',
+                 lambda s: f'/api/dicom/dicom-web/studies/{s[0]}/series/{s[1]}', values=series),
+        Scenario('wado-rs-series-metadata',
+                 lambda s: f'/api/dicom/dicom-web/studies/{s[0]}/series/{s[1]}/metadata', values=series),
+        Scenario('wado', '/api/dicom/wado/',
+                 lambda i: {'studyUID': i[0], 'seriesUID': i[1], 'objectUID': i[2]}, values=instances),
+        Scenario('dicom-upload', '/api/dicom/studies/upload_dicom/',
+                 upload_data(patient[0], seed) if patient else None, method='post',
+                 values=None if patient else []),
+    ]
+
+
+def run_scenario(client, scenario, iterations, warmup=0):
+    """Exécute `scenario` (après `warmup` requêtes non mesurées) et résume les mesures."""
+    def send(iteration):
+        path, data = scenario.request(iteration)
+        response = getattr(client, scenario.method)(path, data)
+        # Le client de test ferme lui-même la réponse ; un close() ici
+        # fermerait la connexion à la base au milieu de la transaction
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    for iteration in range(warmup):
+        send(iteration)
+
+    latencies, queries, statuses = [], [], {}
+    errors = 0
+    start = time.perf_counter()
+    for iteration in range(warmup, warmup + iterations):
+        counter = QueryCounter()
+        request_start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = send(iteration)
+        duration = time.perf_counter() - request_start
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            errors += 1
+        else:
+            latencies.append(duration)
+    result = summarize(latencies, errors, time.perf_counter() - start)
+    result.update({
+        'method': scenario.method.upper(),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+        'queries_max': max(queries, default=None),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    })
+    return result
+
+
+def run_scenarios(user, scenarios, iterations, warmup=0, only=None):
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    results = {}
+    for scenario in scenarios:
+        if only and scenario.name not in only:
+            continue
+        if not scenario.available:
+            results[scenario.name] = {'skipped': "Aucune donnée pour ce scénario"}
+            continue
+        results[scenario.name] = run_scenario(client, scenario, iterations, warmup)
+    return results
+
+
+def compare(results, baseline, max_regression=0.2):
+    """
+    Régressions de `results` par rapport à `baseline` (même format) :
+    plus de requêtes SQL ou d'erreurs, ou une latence médiane plus de
+    `max_regression` fois supérieure. Les scénarios absents d'un des deux
+    côtés sont ignorés.
+    """
+    regressions = []
+    previous_scenarios = baseline.get('scenarios', {})
+    for name, current in results['scenarios'].items():
+        previous = previous_scenarios.get(name)
+        if not previous or 'skipped' in current or 'skipped' in previous:
+            continue
+        if (current['queries_max'] or 0) > (previous['queries_max'] or 0):
+            regressions.append(
+                f"{name} : {previous['queries_max']} -> {current['queries_max']} requêtes SQL"
+            )
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name} : {previous['errors']} -> {current['errors']} erreurs")
+        if previous['p50_ms'] and current['p50_ms'] and current['p50_ms'] > previous['p50_ms'] * (1 + max_regression):
+            regressions.append(f"{name} : p50 {previous['p50_ms']} -> {current['p50_ms']} ms")
+    return regressions
@@ -0,0 +1,158 @@
+"""Suppression d'études, de séries et d'instances : Orthanc, base de données et stockage.
+
+1. Orthanc est adressé par ses propres identifiants (orthanc_ids.py :
+   champ `orthanc_id`, ou /tools/lookup à défaut). Les DELETE sont envoyés
+   en parallèle, au plus DICOM_DELETE_WORKERS à la fois. Un objet
+   qu'Orthanc refuse de supprimer est conservé en base.
+2. En base, une transaction et une requête DELETE par table (instances,
+   documents de métadonnées, séries, études), sans passer par le collecteur
+   de Django qui chargerait chaque instance.
+3. Après le commit, les fichiers qui ne sont plus référencés par aucune
+   instance (stockage adressé par contenu) sont supprimés en tâche de fond.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import DicomInstance, DicomSeries, DicomSeriesMetadata, DicomStudy
+from .orthanc import get_orthanc_client
+from .orthanc_ids import LEVELS, get_orthanc_id_cache, resolve_objects
+from .storage import get_dicom_storage
+
+logger = logging.getLogger(__name__)
+
+
+class OrthancDeletionError(Exception):
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_cleanup_executor = None
+_lock = threading.Lock()
+
+
+def delete_remote(level, uid, orthanc_ids):
+    """Supprime la ressource d'Orthanc ; une ressource déjà absente n'est pas une erreur."""
+    try:
+        for orthanc_id in orthanc_ids:
+            response = get_orthanc_client().delete(f'/{level}/{orthanc_id}')
+            if response.status_code not in (200, 404):
+                logger.warning("Erreur Orthanc %s: %s", response.status_code, response.text)
+                raise OrthancDeletionError(
+                    f"Suppression de {uid} refusée par Orthanc ({response.status_code})",
+                    status_code=403 if response.status_code == 403 else 502,
+                )
+    except requests.exceptions.RequestException as e:
+        raise OrthancDeletionError(f"Orthanc injoignable : {e}")
+    get_orthanc_id_cache().discard((level, uid))
+    if not orthanc_ids:
+        logger.info("%s absent d'Orthanc, suppression de la base uniquement", uid)
+
+
+def delete_from_orthanc(level, objects):
+    """
+    Supprime d'Orthanc les ressources correspondant à `objects`, en
+    parallèle. Retourne {clé primaire: OrthancDeletionError} pour les
+    suppressions en échec.
+    """
+    uid_field = LEVELS[level][2]
+    resolved, lookup_failures = resolve_objects(level, objects)
+    failures = {pk: OrthancDeletionError(str(error)) for pk, error in lookup_failures.items()}
+
+    def delete(obj):
+        try:
+            delete_remote(level, getattr(obj, uid_field), resolved[obj.pk])
+        except OrthancDeletionError as e:
+            return obj.pk, e
+        return obj.pk, None
+
+    pending = [obj for obj in objects if obj.pk in resolved]
+    if len(pending) <= 1:
+        results = map(delete, pending)
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(settings.DICOM_DELETE_WORKERS, len(pending)), thread_name_prefix='orthanc-delete'
+        ) as executor:
+            results = list(executor.map(delete, pending))
+    failures.update((pk, error) for pk, error in results if error is not None)
+    return failures
+
+
+def delete_rows(level, pks):
+    """
+    Supprime les lignes du niveau `level` et tout ce qui en dépend, une
+    requête par table. Retourne les clés de stockage des instances supprimées.
+    """
+    if level == 'studies':
+        instances = DicomInstance.objects.filter(series__study_id__in=pks)
+        documents = DicomSeriesMetadata.objects.filter(series__study_id__in=pks)
+        parents = [DicomSeries.objects.filter(study_id__in=pks), DicomStudy.objects.filter(pk__in=pks)]
+    elif level == 'series':
+        instances = DicomInstance.objects.filter(series_id__in=pks)
+        documents = DicomSeriesMetadata.objects.filter(series_id__in=pks)
+        parents = [DicomSeries.objects.filter(pk__in=pks)]
+    else:
+        instances = DicomInstance.objects.filter(pk__in=pks)
+        # Les séries restent : leur document de métadonnées est à reconstruire
+        series_ids = set(instances.values_list('series_id', flat=True))
+        documents = DicomSeriesMetadata.objects.filter(series_id__in=series_ids)
+        parents = []
+
+    with transaction.atomic():
+        keys = set(instances.exclude(file_path='').values_list('file_path', flat=True))
+        for queryset in [instances, documents] + parents:
+            # Aucune des tables n'a de signal ni de dépendance hors de cette liste
+            queryset._raw_delete(queryset.db)
+        transaction.on_commit(lambda: remove_unreferenced_files(keys))
+    return keys
+
+
+def delete_objects(level, objects):
+    """
+    Supprime d'Orthanc puis de la base les objets `objects` (études, séries
+    ou instances selon `level`). Retourne (clés primaires supprimées,
+    {clé primaire: OrthancDeletionError}) ; les objets en échec sont conservés.
+    """
+    failures = delete_from_orthanc(level, objects)
+    deleted = [obj.pk for obj in objects if obj.pk not in failures]
+    if deleted:
+        delete_rows(level, deleted)
+        logger.info("%d objet(s) DICOM supprimé(s) (%s)", len(deleted), level)
+    return deleted, failures
+
+
+def remove_unreferenced_files(keys):
+    """Planifie la suppression des fichiers `keys` qui ne sont plus référencés."""
+    global _cleanup_executor
+    if not keys:
+        return
+    with _lock:
+        if _cleanup_executor is None:
+            _cleanup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dicom-file-cleanup')
+    _cleanup_executor.submit(remove_files, keys)
+
+
+def delete_unreferenced_files(keys):
+    """Supprime du stockage les fichiers `keys` qu'aucune instance ne référence."""
+    # Un même contenu peut être partagé par une instance d'un autre patient
+    referenced = set(DicomInstance.objects.filter(file_path__in=keys).values_list('file_path', flat=True))
+    storage = get_dicom_storage()
+    for key in set(keys) - referenced:
+        try:
+            storage.delete(key)
+        except Exception as e:
+            logger.warning("Fichier DICOM %s non supprimé : %s", key, e)
+
+
+def remove_files(keys):
+    try:
+        delete_unreferenced_files(keys)
+    except Exception:
+        logger.exception("Échec du nettoyage des fichiers DICOM supprimés")
+    finally:
+        connections.close_all()
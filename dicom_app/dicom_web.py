@@ -1,8 +1,148 @@
+import gzip
+import json
+import logging
+import re
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 import requests
+from medical.relations import filter_by_doctor_patients
+from . import multipart, qido, series_metadata, stow, wado_rs
+from .models import DicomStudy, DicomSeries
+from .orthanc import get_orthanc_client
+from .permissions import CanUploadDicom, upload_patient_error
+
+logger = logging.getLogger(__name__)
+
+# Taille des blocs lus depuis Orthanc et renvoyés au client
+WADO_CHUNK_SIZE = 64 * 1024
+
+# En-têtes d'Orthanc recopiés tels quels dans la réponse
+WADO_PASSTHROUGH_HEADERS = ('Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range_header(range_header, total_length):
+    """Convertit un en-tête Range (plage unique) en bornes (début, fin) inclusives.
+
+    Retourne None si l'en-tête est absent ou non géré (plages multiples),
+    et lève ValueError si la plage n'est pas satisfiable.
+    """
+    if not range_header:
+        return None
+    match = RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffixe : les N derniers octets
+        length = int(end)
+        if length == 0:
+            raise ValueError('Unsatisfiable range')
+        start = max(total_length - length, 0)
+        end = total_length - 1
+    else:
+        start = int(start)
+        end = min(int(end), total_length - 1) if end else total_length - 1
+    if start >= total_length or start > end:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+class RangeNotSatisfiable(Exception):
+    def __init__(self, total_length):
+        super().__init__('Unsatisfiable range')
+        self.total_length = total_length
+
+
+def chunk_window(position, length, start=0, end=None):
+    """Retourne la portion (début, fin) d'un bloc situé à `position` à conserver pour [start, end].
+
+    Retourne None si le bloc précède la plage ; l'appelant s'arrête quand
+    `position` dépasse `end`.
+    """
+    if position + length <= start:
+        return None
+    lower = max(start - position, 0)
+    upper = length if end is None else min(length, end - position + 1)
+    return lower, upper
+
+
+def iter_orthanc_content(response, start=0, end=None):
+    """Relaie le corps d'une réponse Orthanc par blocs, en ne gardant que [start, end]."""
+    position = 0
+    try:
+        for chunk in response.iter_content(chunk_size=WADO_CHUNK_SIZE):
+            if end is not None and position > end:
+                break
+            window = chunk_window(position, len(chunk), start, end)
+            if window:
+                yield chunk[window[0]:window[1]]
+            position += len(chunk)
+    finally:
+        response.close()
+
+
+def plan_streaming_response(response, range_header=None):
+    """Calcule le statut, les en-têtes et la plage [start, end] à relayer pour une réponse Orthanc.
+
+    Si Orthanc a déjà traité la plage (206), la réponse est relayée telle quelle ;
+    sinon la plage demandée est appliquée localement quand la taille est connue.
+    Lève RangeNotSatisfiable si la plage demandée dépasse l'objet.
+    """
+    headers = {
+        name: response.headers[name]
+        for name in WADO_PASSTHROUGH_HEADERS
+        if name in response.headers
+    }
+    headers.setdefault('Accept-Ranges', 'bytes')
+    headers['Content-Type'] = response.headers.get('Content-Type', 'application/dicom')
+
+    total_length = response.headers.get('Content-Length')
+    if response.status_code == 200 and range_header and total_length is not None:
+        total_length = int(total_length)
+        try:
+            byte_range = parse_range_header(range_header, total_length)
+        except ValueError:
+            raise RangeNotSatisfiable(total_length)
+        if byte_range:
+            start, end = byte_range
+            headers['Content-Length'] = str(end - start + 1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{total_length}'
+            return status.HTTP_206_PARTIAL_CONTENT, headers, start, end
+
+    return response.status_code, headers, 0, None
+
+
+def range_not_satisfiable_response(total_length):
+    response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+    response['Content-Range'] = f'bytes */{total_length}'
+    return response
+
+
+def build_streaming_response(response, range_header=None):
+    """Construit une StreamingHttpResponse à partir d'une réponse Orthanc ouverte en stream."""
+    try:
+        status_code, headers, start, end = plan_streaming_response(response, range_header)
+    except RangeNotSatisfiable as e:
+        response.close()
+        return range_not_satisfiable_response(e.total_length)
+
+    streaming = StreamingHttpResponse(
+        iter_orthanc_content(response, start, end),
+        status=status_code,
+    )
+    for name, value in headers.items():
+        streaming[name] = value
+    return streaming
+
 
 class WADOView(APIView):
     def get(self, request):
@@ -18,8 +158,6 @@ class WADOView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Construire l'URL Orthanc
-            orthanc_url = f'http://localhost:8042/wado'
             params = {
                 'studyUID': study_instance_uid,
                 'seriesUID': series_instance_uid,
@@ -28,57 +166,326 @@ class WADOView(APIView):
                 'contentType': 'application/dicom'
             }
 
-            # Faire la requête à Orthanc
-            response = requests.get(orthanc_url, params=params)
-            
-            if response.status_code == 200:
-                return Response(
-                    response.content,
-                    content_type='application/dicom'
-                )
+            # Relayer les en-têtes conditionnels et de plage du client
+            range_header = request.META.get('HTTP_RANGE')
+            headers = {'Accept-Encoding': 'identity'}
+            if range_header:
+                headers['Range'] = range_header
+            if request.META.get('HTTP_IF_NONE_MATCH'):
+                headers['If-None-Match'] = request.META['HTTP_IF_NONE_MATCH']
+
+            # Faire la requête à Orthanc sans charger le corps en mémoire
+            response = get_orthanc_client().get('/wado', params=params, headers=headers, stream=True)
+
+            if response.status_code in (200, 206):
+                return build_streaming_response(response, range_header)
+            elif response.status_code == 304:
+                response.close()
+                not_modified = Response(status=status.HTTP_304_NOT_MODIFIED)
+                if 'ETag' in response.headers:
+                    not_modified['ETag'] = response.headers['ETag']
+                return not_modified
             else:
-                return Response(
-                    {'error': f'Orthanc error: {response.text}'},
-                    status=response.status_code
-                )
+                try:
+                    return Response(
+                        {'error': f'Orthanc error: {response.text}'},
+                        status=response.status_code
+                    )
+                finally:
+                    response.close()
 
+        except requests.exceptions.Timeout:
+            return Response(
+                {'error': 'Orthanc timeout'},
+                status=status.HTTP_504_GATEWAY_TIMEOUT
+            )
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class QIDOView(APIView):
-    def get(self, request):
-        try:
-            # Récupérer les paramètres de la requête
-            study_instance_uid = request.GET.get('StudyInstanceUID')
-            
-            if not study_instance_uid:
-                return Response(
-                    {'error': 'Missing StudyInstanceUID parameter'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+class DicomJSONRenderer(JSONRenderer):
+    media_type = 'application/dicom+json'
 
-            # Construire l'URL Orthanc
-            orthanc_url = f'http://localhost:8042/dicom-web/qido'
-            params = {
-                'StudyInstanceUID': study_instance_uid
-            }
 
-            # Faire la requête à Orthanc
-            response = requests.get(orthanc_url, params=params)
-            
-            if response.status_code == 200:
-                return Response(response.json())
-            else:
-                return Response(
-                    {'error': f'Orthanc error: {response.text}'},
-                    status=response.status_code
-                )
+def accessible_studies(user):
+    """Études visibles par l'utilisateur (mêmes règles que DicomStudyViewSet)."""
+    if user.role == 'PATIENT':
+        return DicomStudy.objects.filter(patient=user)
+    elif user.role == 'DOCTOR':
+        return filter_by_doctor_patients(DicomStudy.objects.filter(doctor=user), user)
+    return DicomStudy.objects.none()
 
-        except Exception as e:
+
+class QidoRSView(APIView):
+    """
+    QIDO-RS : /dicom-web/studies, /dicom-web/studies/{study}/series,
+    /dicom-web/studies/{study}/series/{series}/instances, etc.
+    Réponse depuis l'index local ; les requêtes sur des attributs non
+    indexés sont relayées au plugin DICOMweb d'Orthanc.
+    """
+    level = qido.STUDY
+    renderer_classes = [DicomJSONRenderer, JSONRenderer]
+
+    def get(self, request, study_uid=None, series_uid=None):
+        studies = accessible_studies(request.user)
+        try:
+            results = qido.search(self.level, request.GET, studies, study_uid, series_uid)
+        except qido.QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except qido.UnsupportedQuery:
+            return self.search_orthanc(request, studies)
+        return Response(results)
+
+    def search_orthanc(self, request, studies):
+        path = request.path.split('/dicom-web', 1)[1]
+        try:
+            response = get_orthanc_client().get(
+                f'/dicom-web{path}', params=request.GET, headers={'Accept': 'application/dicom+json'}
+            )
+        except requests.exceptions.Timeout:
+            return Response(
+                {'error': 'Orthanc timeout'},
+                status=status.HTTP_504_GATEWAY_TIMEOUT
+            )
+        except requests.exceptions.RequestException as e:
             return Response(
                 {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            ) 
\ No newline at end of file
+                status=status.HTTP_502_BAD_GATEWAY
+            )
+        if response.status_code == 204:
+            return Response([])
+        if response.status_code != 200:
+            return Response(
+                {'error': f'Orthanc error: {response.text}'},
+                status=response.status_code
+            )
+        # Orthanc ne connaît pas les droits : on ne garde que les études accessibles
+        results = response.json()
+        uids = {r.get('0020000D', {}).get('Value', [None])[0] for r in results}
+        allowed = set(studies.filter(study_instance_uid__in=uids).values_list('study_instance_uid', flat=True))
+        return Response([r for r in results if r.get('0020000D', {}).get('Value', [None])[0] in allowed])
+
+
+class StudiesQidoView(QidoRSView):
+    level = qido.STUDY
+
+
+class SeriesQidoView(QidoRSView):
+    level = qido.SERIES
+
+
+class InstancesQidoView(QidoRSView):
+    level = qido.INSTANCE
+
+
+class QIDOView(StudiesQidoView):
+    """Ancien point d'entrée (?StudyInstanceUID=...), servi par le moteur QIDO-RS."""
+
+    def get(self, request):
+        if not request.GET.get('StudyInstanceUID'):
+            return Response(
+                {'error': 'Missing StudyInstanceUID parameter'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().get(request)
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """
+    Les réponses WADO-RS sont construites par la vue (multipart/related) ;
+    l'en-tête Accept des visionneuses ne doit pas provoquer de 406. Les
+    erreurs restent en JSON.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def dicomweb_url(request, ref, *suffix):
+    """URL absolue d'une instance (ou d'une de ses sous-ressources) dans l'API DICOMweb."""
+    root = request.path.split('/dicom-web', 1)[0]
+    path = '/'.join((
+        f'{root}/dicom-web/studies', ref.study_uid, 'series', ref.series_uid, 'instances', ref.sop_uid
+    ) + suffix)
+    return request.build_absolute_uri(path)
+
+
+class WadoRSView(APIView):
+    """
+    WADO-RS : /dicom-web/studies/{study}[/series/{series}[/instances/{instance}]]
+    Toutes les instances désignées dans une seule réponse multipart/related,
+    relayées par blocs depuis le stockage (ou Orthanc) à mesure de l'envoi.
+    """
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, study_uid, series_uid=None, instance_uid=None):
+        refs = wado_rs.select_instances(accessible_studies(request.user), study_uid, series_uid, instance_uid)
+        if not refs:
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        boundary = multipart.new_boundary()
+        return StreamingHttpResponse(
+            multipart.iter_multipart(
+                wado_rs.instance_parts(refs, lambda ref: dicomweb_url(request, ref)), boundary
+            ),
+            content_type=multipart.content_type(boundary, 'application/dicom'),
+        )
+
+
+class FramesRSView(APIView):
+    """WADO-RS : .../instances/{instance}/frames/{1,2,3}, frames telles qu'encodées."""
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, study_uid, series_uid, instance_uid, frames):
+        try:
+            numbers = wado_rs.parse_frame_list(frames)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        refs = wado_rs.select_instances(accessible_studies(request.user), study_uid, series_uid, instance_uid)
+        if not refs:
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            part_type, media_type, data = wado_rs.read_frames(refs[0], numbers)
+        except wado_rs.FrameNotFound as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except wado_rs.InstanceUnavailable as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        boundary = multipart.new_boundary()
+        location = dicomweb_url(request, refs[0], 'frames')
+        parts = (
+            (media_type, {'Content-Location': f'{location}/{number}'}, [frame])
+            for number, frame in zip(numbers, data)
+        )
+        return StreamingHttpResponse(
+            multipart.iter_multipart(parts, boundary),
+            content_type=multipart.content_type(boundary, part_type),
+        )
+
+
+class MetadataRSView(APIView):
+    """
+    WADO-RS : .../metadata d'une étude, d'une série ou d'une instance (DICOM
+    JSON, sans pixels). Études et séries sont servies depuis le document
+    précalculé de chaque série (series_metadata.py).
+    """
+    renderer_classes = [DicomJSONRenderer, JSONRenderer]
+
+    def get(self, request, study_uid, series_uid=None, instance_uid=None):
+        studies = accessible_studies(request.user)
+        if instance_uid:
+            return self.instance_metadata(studies, study_uid, series_uid, instance_uid)
+
+        series = DicomSeries.objects.filter(
+            study__in=studies, study__study_instance_uid=study_uid
+        ).select_related('study').order_by('series_number', 'id')
+        if series_uid:
+            series = series.filter(series_instance_uid=series_uid)
+        series = list(series)
+        if not series:
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        if series_uid:
+            return self.document_response(request, series_metadata.series_document(series[0]))
+        results = []
+        for item in series:
+            results.extend(series_metadata.decompress(series_metadata.series_document(item)))
+        return Response(results)
+
+    def instance_metadata(self, studies, study_uid, series_uid, instance_uid):
+        refs = wado_rs.select_instances(studies, study_uid, series_uid, instance_uid)
+        if not refs:
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return Response([wado_rs.instance_metadata(refs[0])])
+        except wado_rs.InstanceUnavailable as e:
+            return Response({'error': str(e)}, status=e.status_code)
+
+    def document_response(self, request, document):
+        """Document gzip relayé sans décompression quand le client l'accepte."""
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(document, content_type=DicomJSONRenderer.media_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(document), content_type=DicomJSONRenderer.media_type)
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+def store_instances(request, user, stream, study_uid=None):
+    """
+    STOW-RS, commun aux vues synchrone (StowRSMixin) et asynchrone :
+    contrôle du corps et du patient, ingestion au fil de la lecture de
+    `stream` (stow.py) puis dataset de réponse. Retourne (code HTTP, corps) :
+    {'error': ...} si l'envoi est refusé, le dataset DICOM JSON sinon.
+    """
+    media_type, params = multipart.parse_content_type(request.META.get('CONTENT_TYPE'))
+    if media_type != 'multipart/related' or params.get('type', stow.DICOM_MEDIA_TYPE) != stow.DICOM_MEDIA_TYPE:
+        return status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, {
+            'error': 'Expected multipart/related; type="application/dicom" content'
+        }
+
+    patient_id = request.GET.get('patient')
+    if study_uid:
+        study = DicomStudy.objects.filter(study_instance_uid=study_uid).first()
+        if study is not None:
+            if study.doctor_id != user.pk:
+                return status.HTTP_403_FORBIDDEN, {'error': 'Permission denied'}
+            patient_id = patient_id or study.patient_id
+    refusal = upload_patient_error(user, patient_id)
+    if refusal:
+        return refusal[1], {'error': refusal[0]}
+    if stream is None:
+        return status.HTTP_400_BAD_REQUEST, {'error': 'Empty request body'}
+
+    try:
+        results = stow.receive(stream, params.get('boundary'), patient_id, user, study_uid)
+    except multipart.MultipartError as e:
+        return status.HTTP_400_BAD_REQUEST, {'error': str(e)}
+    if not results:
+        return status.HTTP_400_BAD_REQUEST, {'error': 'No DICOM instance in request body'}
+
+    # RetrieveURL de l'étude : celle de l'URL, ou l'unique étude reçue
+    study_uids = {report['study_instance_uid'] for report in results if 'study_instance_uid' in report}
+    if not study_uid and len(study_uids) == 1:
+        study_uid = study_uids.pop()
+    dataset, stored, failed = stow.response_dataset(
+        results,
+        lambda report: request.build_absolute_uri(wado_rs.instance_uri(
+            report['study_instance_uid'], report['series_instance_uid'], report['sop_instance_uid']
+        )),
+        request.build_absolute_uri(reverse('wado-rs-study', kwargs={'study_uid': study_uid})) if study_uid else None,
+    )
+    logger.info("STOW-RS : %d instance(s) acceptée(s), %d en échec", stored, failed)
+    if not failed:
+        return status.HTTP_200_OK, dataset
+    if stored:
+        return status.HTTP_202_ACCEPTED, dataset
+    return status.HTTP_409_CONFLICT, dataset
+
+
+class StowRSMixin:
+    """
+    STOW-RS : POST /dicom-web/studies[/{study}] d'un corps
+    multipart/related; type="application/dicom". Les instances sont
+    ingérées à mesure de la réception (stow.py) et rattachées au patient
+    ?patient=, ou à celui de l'étude désignée dans l'URL.
+    """
+
+    def post(self, request, study_uid=None):
+        if not CanUploadDicom().has_permission(request, self):
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        status_code, body = store_instances(request, request.user, request.stream, study_uid)
+        if 'error' in body:
+            return Response(body, status=status_code)
+        return HttpResponse(json.dumps(body), status=status_code, content_type=DicomJSONRenderer.media_type)
+
+
+class StudiesRSView(StowRSMixin, StudiesQidoView):
+    """/dicom-web/studies : recherche QIDO-RS (GET) et envoi STOW-RS (POST)."""
+
+
+class StudyRSView(StowRSMixin, WadoRSView):
+    """/dicom-web/studies/{study} : récupération WADO-RS (GET) et envoi STOW-RS (POST)."""
@@ -0,0 +1,644 @@
+"""Orthanc factice, pour les benchmarks, les tests de charge et le développement hors ligne.
+
+Implémente le sous-ensemble de l'API Orthanc utilisé par dicom_app :
+- REST : POST /instances, GET/DELETE /instances/{id}, GET /instances/{id}/file,
+  GET/DELETE /studies/{id} et /series/{id}, POST /tools/lookup,
+  GET /statistics, GET /system ;
+- WADO-URI : GET /wado ;
+- DICOMweb : QIDO-RS (/dicom-web/studies, .../series, .../instances),
+  WADO-RS (instances, métadonnées, frames) et STOW-RS (POST /dicom-web/studies).
+
+Les instances reçues sont écrites dans un répertoire (temporaire par
+défaut) ; au démarrage, les fichiers .dcm déjà présents sont indexés. Les
+identifiants sont ceux d'Orthanc (SHA-1 des UIDs, voir orthanc_id) ; les
+ressources /studies, /series et /instances acceptent aussi directement les
+UIDs DICOM.
+
+Latence, taux d'erreur (avec une graine pour des séquences
+reproductibles) et débit des réponses en flux sont configurables.
+"""
+import fnmatch
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+import pydicom
+from pydicom.errors import InvalidDicomError
+
+STUDY_TAGS = ('StudyInstanceUID', 'StudyDate', 'StudyTime', 'StudyID', 'StudyDescription',
+              'AccessionNumber', 'ReferringPhysicianName')
+PATIENT_TAGS = ('PatientName', 'PatientID', 'PatientBirthDate', 'PatientSex')
+SERIES_TAGS = ('SeriesInstanceUID', 'Modality', 'SeriesNumber', 'SeriesDescription')
+INSTANCE_TAGS = ('SOPClassUID', 'SOPInstanceUID', 'InstanceNumber', 'Rows', 'Columns', 'NumberOfFrames')
+
+QIDO_LEVELS = {
+    'studies': PATIENT_TAGS + STUDY_TAGS,
+    'series': PATIENT_TAGS + STUDY_TAGS + SERIES_TAGS,
+    'instances': PATIENT_TAGS + STUDY_TAGS + SERIES_TAGS + INSTANCE_TAGS,
+}
+QIDO_RESERVED = {'limit', 'offset', 'includefield', 'fuzzymatching'}
+# Niveau REST -> champ Type des réponses de /tools/lookup
+LOOKUP_TYPES = (('studies', 'Study'), ('series', 'Series'), ('instances', 'Instance'))
+
+
+def orthanc_id(*uids):
+    """Identifiant Orthanc d'une ressource : SHA-1 de ses UIDs et de ceux de ses parents.
+
+    (PatientID,) pour un patient, (PatientID, StudyInstanceUID) pour une
+    étude, etc. ; même format que les identifiants d'Orthanc.
+    """
+    digest = hashlib.sha1('|'.join(uids).encode()).hexdigest()
+    return '-'.join(digest[i:i + 8] for i in range(0, 40, 8))
+
+
+def main_tags(ds, keywords):
+    return {keyword: str(ds.get(keyword, '')) for keyword in keywords if keyword in ds}
+
+
+def dicom_json(ds, keywords):
+    """Attributs `keywords` de `ds` en DICOM JSON (PS3.18 F.2)."""
+    result = {}
+    for keyword in keywords:
+        if keyword in ds:
+            element = ds[keyword]
+            result[f'{element.tag:08X}'] = element.to_json_dict(None, 0)
+    return result
+
+
+class FakeOrthancStore:
+    """Index en mémoire des instances stockées dans `root`, protégé par un verrou."""
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.RLock()
+        self.instances = {}
+        self.series = {}
+        self.studies = {}
+        # UID DICOM -> identifiant Orthanc, pour les trois niveaux
+        self.uids = {}
+        os.makedirs(root, exist_ok=True)
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith('.dcm'):
+                    try:
+                        self.index(os.path.join(directory, name))
+                    except (InvalidDicomError, AttributeError, OSError):
+                        continue
+
+    def index(self, path):
+        ds = pydicom.dcmread(path, stop_before_pixels=True)
+        patient_id = str(ds.get('PatientID', ''))
+        study_uid, series_uid, sop_uid = str(ds.StudyInstanceUID), str(ds.SeriesInstanceUID), str(ds.SOPInstanceUID)
+        study_id = orthanc_id(patient_id, study_uid)
+        series_id = orthanc_id(patient_id, study_uid, series_uid)
+        instance_id = orthanc_id(patient_id, study_uid, series_uid, sop_uid)
+        with self.lock:
+            already_stored = instance_id in self.instances
+            self.uids.update({study_uid: study_id, series_uid: series_id, sop_uid: instance_id})
+            self.instances[instance_id] = {
+                'ID': instance_id,
+                'Path': path,
+                'ParentSeries': series_id,
+                'ParentStudy': study_id,
+                'ParentPatient': orthanc_id(patient_id),
+                'FileSize': os.path.getsize(path),
+                'MainDicomTags': main_tags(ds, INSTANCE_TAGS),
+                'QidoTags': dicom_json(ds, QIDO_LEVELS['instances']),
+                'Metadata': ds.to_json_dict(),
+            }
+            self.series.setdefault(series_id, {
+                'ID': series_id, 'ParentStudy': study_id, 'Instances': set(),
+                'MainDicomTags': main_tags(ds, SERIES_TAGS),
+                'QidoTags': dicom_json(ds, QIDO_LEVELS['series']),
+            })['Instances'].add(instance_id)
+            self.studies.setdefault(study_id, {
+                'ID': study_id, 'ParentPatient': orthanc_id(patient_id), 'Series': set(),
+                'MainDicomTags': main_tags(ds, STUDY_TAGS),
+                'PatientMainDicomTags': main_tags(ds, PATIENT_TAGS),
+                'QidoTags': dicom_json(ds, QIDO_LEVELS['studies']),
+            })['Series'].add(series_id)
+        return self.instances[instance_id], already_stored
+
+    def store(self, content):
+        """Enregistre une instance reçue ; lève InvalidDicomError si ce n'est pas du DICOM."""
+        ds = pydicom.dcmread(BytesIO(content), stop_before_pixels=True)
+        instance_id = orthanc_id(
+            str(ds.get('PatientID', '')), str(ds.StudyInstanceUID), str(ds.SeriesInstanceUID), str(ds.SOPInstanceUID)
+        )
+        path = os.path.join(self.root, f'{instance_id}.dcm')
+        with self.lock:
+            if instance_id in self.instances:
+                return self.instances[instance_id], True
+            temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(content)
+            os.replace(temporary, path)
+            return self.index(path)
+
+    def find(self, level, identifier):
+        """Ressource désignée par son identifiant Orthanc ou par son UID DICOM."""
+        resources = getattr(self, level)
+        with self.lock:
+            return resources.get(identifier) or resources.get(self.uids.get(identifier))
+
+    def study_instances(self, study):
+        with self.lock:
+            return [self.instances[i] for s in study['Series'] for i in self.series[s]['Instances']]
+
+    def series_instances(self, series):
+        with self.lock:
+            return [self.instances[i] for i in series['Instances']]
+
+    def delete_instance(self, instance):
+        with self.lock:
+            self.instances.pop(instance['ID'], None)
+            self.uids.pop(instance['MainDicomTags'].get('SOPInstanceUID'), None)
+            series = self.series.get(instance['ParentSeries'])
+            if series is not None:
+                series['Instances'].discard(instance['ID'])
+                if not series['Instances']:
+                    del self.series[series['ID']]
+                    self.uids.pop(series['MainDicomTags'].get('SeriesInstanceUID'), None)
+                    study = self.studies.get(series['ParentStudy'])
+                    if study is not None:
+                        study['Series'].discard(series['ID'])
+                        if not study['Series']:
+                            del self.studies[study['ID']]
+                            self.uids.pop(study['MainDicomTags'].get('StudyInstanceUID'), None)
+        try:
+            os.unlink(instance['Path'])
+        except FileNotFoundError:
+            pass
+
+    def statistics(self):
+        with self.lock:
+            return {
+                'CountPatients': len({s['ParentPatient'] for s in self.studies.values()}),
+                'CountStudies': len(self.studies),
+                'CountSeries': len(self.series),
+                'CountInstances': len(self.instances),
+                'TotalDiskSize': str(sum(i['FileSize'] for i in self.instances.values())),
+            }
+
+
+def qido_matches(tags, filters):
+    """Correspondance QIDO-RS simplifiée : valeur exacte, jokers * et ?, listes séparées par des virgules."""
+    for tag, pattern in filters.items():
+        element = tags.get(tag)
+        if element is None:
+            return False
+        values = element.get('Value') or ['']
+        values = [v.get('Alphabetic', '') if isinstance(v, dict) else str(v) for v in values]
+        candidates = pattern.split(',')
+        if not any(fnmatch.fnmatchcase(value, candidate) for value in values for candidate in candidates):
+            return False
+    return True
+
+
+def qido_filters(query):
+    filters = {}
+    for name, values in query.items():
+        if name in QIDO_RESERVED:
+            continue
+        if re.fullmatch(r'[0-9A-Fa-f]{8}', name):
+            tag = name.upper()
+        else:
+            tag = pydicom.datadict.tag_for_keyword(name)
+            if tag is None:
+                continue
+            tag = f'{tag:08X}'
+        filters[tag] = values[-1]
+    return filters
+
+
+class FakeOrthancHandler(BaseHTTPRequestHandler):
+    """Gestionnaire HTTP imitant le sous-ensemble de l'API Orthanc utilisé par dicom_app."""
+
+    protocol_version = 'HTTP/1.1'
+    # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, chaque
+    # réponse subit le délai d'ACK retardé (~40 ms) du client.
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ('GET', r'/system', 'system'),
+        ('GET', r'/statistics', 'statistics'),
+        ('GET', r'/wado', 'wado_uri'),
+        ('POST', r'/instances', 'post_instance'),
+        ('POST', r'/tools/lookup', 'lookup'),
+        ('GET', r'/instances/(?P<identifier>[^/]+)', 'get_resource'),
+        ('GET', r'/instances/(?P<identifier>[^/]+)/file', 'get_instance_file'),
+        ('DELETE', r'/(?P<level>studies|series|instances)/(?P<identifier>[^/]+)', 'delete_resource'),
+        ('GET', r'/(?P<level>studies|series)/(?P<identifier>[^/]+)', 'get_resource'),
+        # QIDO-RS (/dicom-web/qido : ancien point d'entrée des vues asynchrones)
+        ('GET', r'/dicom-web/(?P<level>qido)', 'qido'),
+        ('GET', r'/dicom-web/(?P<level>studies|series|instances)', 'qido'),
+        ('GET', r'/dicom-web/studies/(?P<study>[^/]+)/(?P<level>series|instances)', 'qido'),
+        ('GET', r'/dicom-web/studies/(?P<study>[^/]+)/series/(?P<series>[^/]+)/(?P<level>instances)', 'qido'),
+        # WADO-RS
+        ('GET', r'/dicom-web/studies/(?P<study>[^/]+)(?:/series/(?P<series>[^/]+)'
+                r'(?:/instances/(?P<instance>[^/]+))?)?', 'wado_rs'),
+        ('GET', r'/dicom-web/studies/(?P<study>[^/]+)(?:/series/(?P<series>[^/]+)'
+                r'(?:/instances/(?P<instance>[^/]+))?)?/metadata', 'wado_rs_metadata'),
+        ('GET', r'/dicom-web/studies/(?P<study>[^/]+)/series/(?P<series>[^/]+)'
+                r'/instances/(?P<instance>[^/]+)/frames/(?P<frames>[0-9,]+)', 'wado_rs_frames'),
+        # STOW-RS
+        ('POST', r'/dicom-web/studies', 'stow_rs'),
+    ]
+
+    def log_message(self, format, *args):
+        # Pas de journalisation par requête : le serveur sert aux mesures de charge
+        pass
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            return bytes(body)
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def send_bytes(self, status_code, body, content_type, extra_headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        chunk_size, delay = self.server.stream_chunk_size, self.server.stream_chunk_delay
+        if not delay:
+            self.wfile.write(body)
+            return
+        # Débit limité : teste la relecture en flux côté proxy
+        for offset in range(0, len(body), chunk_size):
+            self.wfile.write(body[offset:offset + chunk_size])
+            self.wfile.flush()
+            time.sleep(delay)
+
+    def send_json(self, status_code, payload, content_type='application/json'):
+        self.send_bytes(status_code, json.dumps(payload).encode(), content_type)
+
+    def send_not_found(self):
+        self.send_json(404, {'Message': 'Unknown resource'})
+
+    def send_multipart(self, parts, content_type):
+        boundary = uuid.uuid4().hex
+        body = bytearray()
+        for part in parts:
+            body += f'--{boundary}\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+            body += part
+            body += b'\r\n'
+        body += f'--{boundary}--\r\n'.encode()
+        self.send_bytes(
+            200, bytes(body), f'multipart/related; type="{content_type}"; boundary={boundary}'
+        )
+
+    def dispatch(self, method):
+        body = self.read_body() if method == 'POST' else b''
+        self.server.record(method, self.path)
+        self.server.simulate_latency()
+        if self.server.inject_error():
+            self.send_json(self.server.error_status, {'Message': 'Injected error'})
+            return
+        url = urlparse(self.path)
+        self.query = parse_qs(url.query)
+        for route_method, pattern, handler in self.ROUTES:
+            if route_method != method:
+                continue
+            match = re.fullmatch(pattern, url.path)
+            if match:
+                kwargs = {name: value for name, value in match.groupdict().items() if value is not None}
+                if method == 'POST':
+                    kwargs['body'] = body
+                getattr(self, handler)(**kwargs)
+                return
+        self.send_not_found()
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    # REST
+
+    def system(self):
+        self.send_json(200, {'Name': 'FakeOrthanc', 'Version': 'fake', 'ApiVersion': 0})
+
+    def statistics(self):
+        self.send_json(200, {**self.store.statistics(), 'FakeRequests': self.server.request_counts()})
+
+    def post_instance(self, body):
+        try:
+            instance, already_stored = self.store.store(body)
+        except (InvalidDicomError, AttributeError):
+            self.send_json(400, {'Message': 'Bad file format'})
+            return
+        self.send_json(200, {
+            'ID': instance['ID'],
+            'ParentPatient': instance['ParentPatient'],
+            'ParentStudy': instance['ParentStudy'],
+            'ParentSeries': instance['ParentSeries'],
+            'Path': f"/instances/{instance['ID']}",
+            'Status': 'AlreadyStored' if already_stored else 'Success',
+        })
+
+    def get_resource(self, identifier, level='instances'):
+        resource = self.store.find(level, identifier)
+        if resource is None:
+            self.send_not_found()
+            return
+        payload = {
+            key: sorted(value) if isinstance(value, set) else value
+            for key, value in resource.items()
+            if key not in ('Path', 'QidoTags', 'Metadata')
+        }
+        payload['Type'] = {'studies': 'Study', 'series': 'Series', 'instances': 'Instance'}[level]
+        self.send_json(200, payload)
+
+    def get_instance_file(self, identifier):
+        instance = self.store.find('instances', identifier)
+        if instance is None:
+            self.send_not_found()
+            return
+        self.send_file(instance)
+
+    def delete_resource(self, level, identifier):
+        resource = self.store.find(level, identifier)
+        if resource is None:
+            self.send_not_found()
+            return
+        if level == 'studies':
+            instances = self.store.study_instances(resource)
+        elif level == 'series':
+            instances = self.store.series_instances(resource)
+        else:
+            instances = [resource]
+        for instance in instances:
+            self.store.delete_instance(instance)
+        self.send_json(200, {'RemainingAncestor': None})
+
+    def lookup(self, body):
+        """Ressources désignées par un UID DICOM (corps de la requête)."""
+        uid = body.decode('latin-1').strip()
+        matches = []
+        with self.store.lock:
+            identifier = self.store.uids.get(uid)
+            for level, resource_type in LOOKUP_TYPES:
+                if identifier in getattr(self.store, level):
+                    matches.append({'ID': identifier, 'Path': f'/{level}/{identifier}', 'Type': resource_type})
+        self.send_json(200, matches)
+
+    # WADO-URI
+
+    def send_file(self, instance, content_type='application/dicom'):
+        etag = f'"{instance["ID"]}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_bytes(304, b'', content_type, {'ETag': etag})
+            return
+        with open(instance['Path'], 'rb') as f:
+            self.send_bytes(200, f.read(), content_type, {'ETag': etag})
+
+    def wado_uri(self):
+        uid = (self.query.get('objectUID') or [''])[0]
+        instance = self.store.find('instances', uid) if uid else None
+        if instance is not None:
+            self.send_file(instance)
+        elif self.server.payload:
+            # Objet inconnu : contenu synthétique de taille fixe (mesures de débit)
+            self.send_bytes(200, self.server.payload, 'application/dicom', {'ETag': '"fake-orthanc"'})
+        else:
+            self.send_not_found()
+
+    # DICOMweb
+
+    def qido(self, level, study=None, series=None):
+        if level == 'qido':
+            level = 'studies'
+        filters = qido_filters(self.query)
+        if study:
+            filters['0020000D'] = study
+        if series:
+            filters['0020000E'] = series
+        resources = {'studies': self.store.studies, 'series': self.store.series,
+                     'instances': self.store.instances}[level]
+        with self.store.lock:
+            results = [r['QidoTags'] for r in resources.values() if qido_matches(r['QidoTags'], filters)]
+        offset = int((self.query.get('offset') or ['0'])[0])
+        limit = self.query.get('limit')
+        results = results[offset:offset + int(limit[0])] if limit else results[offset:]
+        self.send_json(200, results, 'application/dicom+json')
+
+    def select_instances(self, study, series=None, instance=None):
+        resource = self.store.find('studies', study)
+        if resource is None:
+            return None
+        instances = self.store.study_instances(resource)
+        if series:
+            instances = [i for i in instances if i['QidoTags'].get('0020000E', {}).get('Value') == [series]]
+        if instance:
+            instances = [i for i in instances if i['MainDicomTags'].get('SOPInstanceUID') == instance]
+        return instances or None
+
+    def wado_rs(self, study, series=None, instance=None):
+        instances = self.select_instances(study, series, instance)
+        if instances is None:
+            self.send_not_found()
+            return
+        parts = []
+        for i in instances:
+            with open(i['Path'], 'rb') as f:
+                parts.append(f.read())
+        self.send_multipart(parts, 'application/dicom')
+
+    def wado_rs_metadata(self, study, series=None, instance=None):
+        instances = self.select_instances(study, series, instance)
+        if instances is None:
+            self.send_not_found()
+            return
+        self.send_json(200, [i['Metadata'] for i in instances], 'application/dicom+json')
+
+    def wado_rs_frames(self, study, series, instance, frames):
+        instances = self.select_instances(study, series, instance)
+        if instances is None:
+            self.send_not_found()
+            return
+        ds = pydicom.dcmread(instances[0]['Path'])
+        frame_size = ds.Rows * ds.Columns * ds.get('SamplesPerPixel', 1) * ds.BitsAllocated // 8
+        count = int(ds.get('NumberOfFrames', 1) or 1)
+        numbers = [int(n) for n in frames.split(',')]
+        if 'PixelData' not in ds or any(n < 1 or n > count for n in numbers):
+            self.send_not_found()
+            return
+        pixels = ds.PixelData
+        self.send_multipart(
+            [pixels[(n - 1) * frame_size:n * frame_size] for n in numbers], 'application/octet-stream'
+        )
+
+    def stow_rs(self, body):
+        match = re.search(r'boundary="?([^";]+)"?', self.headers.get('Content-Type', ''))
+        if not match:
+            self.send_json(415, {'Message': 'Expected multipart/related'})
+            return
+        delimiter = b'--' + match.group(1).encode()
+        contents = []
+        for part in body.split(delimiter)[1:]:
+            if part.startswith(b'--'):
+                break
+            _, _, content = part.partition(b'\r\n\r\n')
+            contents.append(content[:-2] if content.endswith(b'\r\n') else content)
+        stored, failed = [], []
+        for content in contents:
+            try:
+                instance, _ = self.store.store(content)
+            except (InvalidDicomError, AttributeError):
+                failed.append({})
+                continue
+            stored.append({
+                '00081150': {'vr': 'UI', 'Value': [instance['MainDicomTags'].get('SOPClassUID', '')]},
+                '00081155': {'vr': 'UI', 'Value': [instance['MainDicomTags'].get('SOPInstanceUID', '')]},
+            })
+        payload = {'00081199': {'vr': 'SQ', 'Value': stored}}
+        if failed:
+            payload['00081198'] = {'vr': 'SQ', 'Value': failed}
+        self.send_json(200 if not failed else (202 if stored else 409), payload, 'application/dicom+json')
+
+
+class FakeOrthancServer(ThreadingHTTPServer):
+    """
+    Serveur Orthanc factice en processus.
+
+    `latency` (secondes) est ajoutée à chaque requête ; une fraction
+    `error_rate` des requêtes reçoit `error_status` au lieu de la réponse
+    (tirage reproductible avec `seed`). Avec `stream_chunk_delay`, les
+    corps sont envoyés par blocs de `stream_chunk_size` octets espacés de
+    ce délai. `payload_size` octets synthétiques sont servis par /wado pour
+    les objets inconnus (0 : 404).
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, payload_size=512 * 1024, storage_dir=None,
+                 error_rate=0.0, error_status=503, seed=None, stream_chunk_size=64 * 1024,
+                 stream_chunk_delay=0.0):
+        super().__init__((host, port), FakeOrthancHandler)
+        self.latency = latency
+        self.payload = b'\0' * payload_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_chunk_delay = stream_chunk_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._temporary_storage = storage_dir is None
+        self.store = FakeOrthancStore(storage_dir or tempfile.mkdtemp(prefix='fake-orthanc-'))
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def inject_error(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def record(self, method, path):
+        resource = urlparse(path).path.strip('/').split('/', 1)[0]
+        key = f'{method} /{resource}'
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def request_counts(self):
+        with self._lock:
+            return dict(self._requests)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def server_close(self):
+        super().server_close()
+        if self._temporary_storage:
+            shutil.rmtree(self.store.root, ignore_errors=True)
+
+
+def _serve(queue, kwargs):
+    # terminate() : sortie propre, pour supprimer le stockage temporaire
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    server = FakeOrthancServer(**kwargs)
+    queue.put(server.url)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class FakeOrthancProcess:
+    """Lance FakeOrthancServer dans un processus séparé.
+
+    Le serveur ne partage ainsi pas le GIL avec le client mesuré, ce qui
+    fausserait les résultats à forte concurrence.
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.process = None
+        self.url = None
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        self.process = context.Process(target=_serve, args=(queue, self.kwargs), daemon=True)
+        self.process.start()
+        self.url = queue.get(timeout=30)
+        return self
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.join()
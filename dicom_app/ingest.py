@@ -0,0 +1,288 @@
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import series_metadata
+from .deletion import delete_unreferenced_files
+from .metadata import extract_metadata_batch
+from .models import DicomStudy, DicomSeries, DicomInstance
+from .orthanc import get_orthanc_client
+from .orthanc_ids import record_stored
+from .rendering import prewarm_thumbnails
+from .storage import get_dicom_storage
+
+logger = logging.getLogger(__name__)
+
+# Statuts par fichier du rapport d'ingestion
+STORED = 'stored'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+
+
+def spool_uploads(uploaded_files, directory):
+    """Écrit les fichiers reçus (DICOM isolés ou archives ZIP) dans `directory`.
+
+    Retourne une liste de (nom d'origine, chemin local). Les noms des entrées
+    ZIP ne servent jamais à construire de chemin sur le disque.
+    """
+    spooled = []
+    for uploaded in uploaded_files:
+        if zipfile.is_zipfile(uploaded):
+            uploaded.seek(0)
+            with zipfile.ZipFile(uploaded) as archive:
+                for entry in archive.infolist():
+                    name = entry.filename
+                    if entry.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).upper() == 'DICOMDIR':
+                        continue
+                    path = os.path.join(directory, str(len(spooled)))
+                    with archive.open(entry) as source, open(path, 'wb') as target:
+                        shutil.copyfileobj(source, target, 1024 * 1024)
+                    spooled.append((f'{uploaded.name}/{name}', path))
+        else:
+            uploaded.seek(0)
+            path = os.path.join(directory, str(len(spooled)))
+            with open(path, 'wb') as target:
+                for chunk in uploaded.chunks():
+                    target.write(chunk)
+            spooled.append((uploaded.name, path))
+    return spooled
+
+
+def parse_study_date(value):
+    try:
+        return datetime.strptime(str(value), '%Y%m%d').date()
+    except (TypeError, ValueError):
+        return date.today()
+
+
+def read_headers(files, workers=None):
+    """Lit les en-têtes DICOM de `files` [(nom, chemin)] et hache les fichiers.
+
+    Pool de processus de metadata.extract_metadata_batch, ou processus
+    courant pour un petit lot. Retourne, dans le même ordre, le dictionnaire
+    de métadonnées (avec `content_hash`) ou l'exception levée.
+    """
+    return extract_metadata_batch(
+        [path for _, path in files], processes=workers or settings.DICOM_INGEST_WORKERS, content_hash=True
+    )
+
+
+def store_file(source_path, instance):
+    """Range le fichier ingéré sous la clé de son contenu ; retourne cette clé.
+
+    `instance.content_hash` doit être renseigné. Si un fichier identique est
+    déjà stocké, la source est simplement supprimée.
+    """
+    return get_dicom_storage().save(instance.get_storage_path(), source_path)
+
+
+def push_to_orthanc(keys, workers=None):
+    """Envoie les fichiers stockés à Orthanc en parallèle sur le pool de connexions partagé.
+
+    Les identifiants Orthanc renvoyés sont enregistrés sur les instances,
+    séries et études correspondantes (orthanc_ids.record_stored).
+    Retourne {clé de stockage: code HTTP ou message d'erreur}.
+    """
+    client = get_orthanc_client()
+    storage = get_dicom_storage()
+    payloads = {}
+
+    def push(key):
+        try:
+            with storage.open(key) as f:
+                response = client.post('/instances', data=f)
+            if response.status_code == 200:
+                payloads[key] = response.json()
+            return key, response.status_code
+        except Exception as e:
+            logger.warning("Envoi à Orthanc impossible pour %s: %s", key, e)
+            return key, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers or client.pool_size) as pool:
+        results = dict(pool.map(push, keys))
+    record_stored(payloads)
+    return results
+
+
+def ingest_series(study, series_uid, items, report, checkpoint=None):
+    """Crée la série et ses instances en une transaction ; retourne les clés stockées.
+
+    Une instance déjà connue (même SOP Instance UID ou même contenu) est
+    signalée comme doublon sans être réécrite ni renvoyée à Orthanc, ou
+    refusée si elle appartient à l'étude d'un autre patient. Si la
+    transaction échoue, les fichiers déjà rangés dans le stockage sont supprimés.
+    `checkpoint` reçoit les entrées du rapport de la série dans la même transaction.
+    """
+    first = items[0][2]
+    stored_keys = []
+    try:
+        with transaction.atomic():
+            series, _ = DicomSeries.objects.get_or_create(
+                study=study,
+                series_instance_uid=series_uid,
+                defaults={
+                    'series_number': first['series_number'],
+                    'series_description': first['series_description'],
+                    'modality': first['modality'],
+                    'number_of_instances': 0,
+                }
+            )
+            sop_uids = [metadata['sop_instance_uid'] for _, _, metadata in items]
+            hashes = [metadata['content_hash'] for _, _, metadata in items]
+            # SOP Instance UID ou empreinte déjà connus -> patient de l'instance existante
+            owners = {}
+            for sop_uid, content_hash, owner_id in DicomInstance.objects.filter(
+                Q(sop_instance_uid__in=sop_uids) | Q(content_hash__in=hashes)
+            ).values_list('sop_instance_uid', 'content_hash', 'series__study__patient_id'):
+                owners.update({sop_uid: owner_id, content_hash: owner_id})
+
+            instances = []
+            metadata_entries = []
+            for index, path, metadata in items:
+                sop_uid = metadata['sop_instance_uid']
+                content_hash = metadata['content_hash']
+                owner_id = owners.get(sop_uid, owners.get(content_hash))
+                if owner_id is not None:
+                    if owner_id == study.patient_id:
+                        report[index].update(status=DUPLICATE, sop_instance_uid=sop_uid)
+                    else:
+                        # L'instance existante n'est pas rattachée à ce patient
+                        report[index].update(
+                            status=FAILED, sop_instance_uid=sop_uid,
+                            error="Instance déjà rattachée à un autre patient",
+                        )
+                    continue
+                owners.update({sop_uid: study.patient_id, content_hash: study.patient_id})
+                instance = DicomInstance(
+                    series=series,
+                    sop_instance_uid=sop_uid,
+                    sop_class_uid=metadata['sop_class_uid'],
+                    instance_number=metadata['instance_number'],
+                    file_size=os.path.getsize(path),
+                    content_hash=content_hash,
+                )
+                metadata_entries.append(series_metadata.file_entry(path, study.study_instance_uid, series_uid, sop_uid))
+                instance.file_path = store_file(path, instance)
+                instances.append(instance)
+                stored_keys.append((index, instance.file_path))
+                report[index].update(status=STORED, sop_instance_uid=sop_uid)
+
+            DicomInstance.objects.bulk_create(instances)
+            if instances:
+                series.number_of_instances = series.instances.count()
+                series.save(update_fields=['number_of_instances', 'updated_at'])
+                series_metadata.add_instances(series, metadata_entries)
+            if checkpoint:
+                checkpoint({index: report[index] for index, _, _ in items})
+    except Exception:
+        # Transaction annulée : les fichiers déjà rangés resteraient orphelins
+        delete_unreferenced_files({key for _, key in stored_keys})
+        raise
+    return stored_keys
+
+
+def ingest_files(files, patient_id, doctor, workers=None, forward=True, checkpoint=None, expected_study_uid=None):
+    """Ingestion groupée : en-têtes lus en parallèle, écriture par série, envoi à Orthanc.
+
+    `files` est une liste de (nom, chemin local) ; les fichiers stockés sont
+    confiés au stockage DICOM (storage.py). Avec forward=False l'envoi à Orthanc est
+    laissé à l'appelant. `checkpoint`, s'il est fourni, reçoit {indice: entrée
+    du rapport} dès que des entrées sont définitives (hors envoi à Orthanc) ;
+    pour une série stockée, dans sa transaction. Avec `expected_study_uid`, les
+    fichiers d'une autre étude sont refusés (STOW-RS sur /studies/{uid}).
+    Retourne un rapport par fichier, avec les UID des fichiers lisibles.
+    """
+    report = [{'file': name, 'status': FAILED} for name, _ in files]
+
+    def finish(indices):
+        if checkpoint and indices:
+            checkpoint({index: report[index] for index in indices})
+
+    headers = read_headers(files, workers)
+    rejected = []
+
+    # Regroupement étude -> série -> [(index, chemin, métadonnées)]
+    studies = defaultdict(lambda: defaultdict(list))
+    study_metadata = {}
+    for index, ((name, path), metadata) in enumerate(zip(files, headers)):
+        if isinstance(metadata, Exception):
+            report[index]['error'] = str(metadata)
+            rejected.append(index)
+            continue
+        report[index].update({
+            key: metadata[key]
+            for key in ('study_instance_uid', 'series_instance_uid', 'sop_instance_uid', 'sop_class_uid')
+        })
+        if expected_study_uid and metadata['study_instance_uid'] != expected_study_uid:
+            report[index]['error'] = f"StudyInstanceUID différent de {expected_study_uid}"
+            rejected.append(index)
+            continue
+        study_uid = metadata['study_instance_uid']
+        studies[study_uid][metadata['series_instance_uid']].append((index, path, metadata))
+        study_metadata.setdefault(study_uid, metadata)
+    finish(rejected)
+
+    stored = []
+    for study_uid, series_map in studies.items():
+        metadata = study_metadata[study_uid]
+        try:
+            study, _ = DicomStudy.objects.get_or_create(
+                study_instance_uid=study_uid,
+                defaults={
+                    'patient_id': patient_id,
+                    'doctor': doctor,
+                    'study_date': parse_study_date(metadata['study_date']),
+                    'study_description': metadata['study_description'],
+                    'study_id': metadata['study_id'],
+                    'accession_number': metadata['accession_number'],
+                    'patient_name': metadata['patient_name'],
+                    'dicom_patient_id': metadata['dicom_patient_id'],
+                }
+            )
+            if str(study.patient_id) != str(patient_id):
+                raise ValueError(f"Étude {study_uid} déjà rattachée à un autre patient")
+        except Exception as e:
+            # Une étude refusée n'interrompt pas l'ingestion des autres
+            logger.warning("Étude %s non ingérée : %s", study_uid, e)
+            items = [item for series_items in series_map.values() for item in series_items]
+            for index, _, _ in items:
+                report[index].update(status=FAILED, error=str(e))
+            finish([index for index, _, _ in items])
+            continue
+        for series_uid, items in series_map.items():
+            try:
+                series_stored = ingest_series(study, series_uid, items, report, checkpoint)
+            except Exception as e:
+                logger.exception("Échec de l'ingestion de la série %s", series_uid)
+                for index, _, _ in items:
+                    report[index].update(status=FAILED, error=str(e))
+                finish([index for index, _, _ in items])
+                continue
+            stored.extend(series_stored)
+
+    prewarm_thumbnails([path for _, path in stored])
+
+    if forward:
+        orthanc_results = push_to_orthanc([path for _, path in stored])
+        for index, path in stored:
+            report[index]['orthanc'] = orthanc_results.get(path)
+    return report
+
+
+def ingest_uploads(uploaded_files, patient_id, doctor, workers=None):
+    """Point d'entrée des vues : dépose les fichiers reçus puis les ingère."""
+    directory = tempfile.mkdtemp(prefix='dicom-ingest-')
+    try:
+        files = spool_uploads(uploaded_files, directory)
+        return ingest_files(files, patient_id, doctor, workers)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
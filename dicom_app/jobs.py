@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .ingest import FAILED, STORED, ingest_files, push_to_orthanc, spool_uploads
+from .models import INGEST_CLAIMABLE_STATUSES, DicomInstance, IngestJob
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+# Instances transmises à Orthanc entre deux enregistrements du rapport
+FORWARD_BATCH_SIZE = 64
+# Valeur `orthanc` d'une entrée dont l'instance a été supprimée depuis l'ingestion
+SKIPPED = 'skipped'
+
+
+def enqueue_ingest_job(uploaded_files, patient_id, user):
+    """Dépose les fichiers reçus dans un répertoire dédié et crée la tâche correspondante."""
+    directory = os.path.join(settings.DICOM_INGEST_SPOOL_ROOT, uuid.uuid4().hex)
+    os.makedirs(directory)
+    try:
+        files = spool_uploads(uploaded_files, directory)
+        with open(os.path.join(directory, MANIFEST_NAME), 'w') as manifest:
+            json.dump(files, manifest)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return IngestJob.objects.create(
+        created_by=user,
+        patient_id=patient_id,
+        spool_directory=directory,
+        files_total=len(files),
+    )
+
+
+def claimable_jobs(now):
+    """Tâches réservables à `now`, dans l'ordre de prise en charge.
+
+    Le filtre explicite sur CLAIMABLE_STATUSES reprend la condition de
+    l'index partiel ingestjob_claim_idx, qui ne couvre que ces tâches.
+    """
+    lease_expired = now - timedelta(seconds=settings.DICOM_INGEST_LEASE_SECONDS)
+    return (
+        IngestJob.objects
+        .filter(status__in=INGEST_CLAIMABLE_STATUSES)
+        .filter(
+            Q(status__in=[IngestJob.Status.PENDING, IngestJob.Status.RETRY], available_at__lte=now) |
+            Q(status=IngestJob.Status.RUNNING, locked_at__lt=lease_expired)
+        )
+        .order_by('available_at')
+    )
+
+
+def claim_next_job():
+    """Réserve la prochaine tâche disponible, ou None.
+
+    Une tâche RUNNING dont le bail a expiré (worker arrêté brutalement) est
+    de nouveau réservable. SKIP LOCKED évite que deux workers se bloquent
+    sur la même ligne.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = claimable_jobs(now).select_for_update(skip_locked=True).first()
+        if job is None:
+            return None
+        job.status = IngestJob.Status.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'locked_at', 'attempts', 'updated_at'])
+    return job
+
+
+def make_progress(job):
+    """Retourne un rappel qui incrémente les compteurs de la tâche en base."""
+    def progress(**increments):
+        fields = {f'files_{name}': F(f'files_{name}') + count for name, count in increments.items() if count}
+        if fields:
+            IngestJob.objects.filter(pk=job.pk).update(locked_at=timezone.now(), **fields)
+    return progress
+
+
+def save_report(job, report):
+    """Enregistre le rapport, éventuellement partiel, et les compteurs qui s'en déduisent."""
+    entries = [entry for entry in report if entry is not None]
+    job.report = report
+    IngestJob.objects.filter(pk=job.pk).update(
+        report=report,
+        files_parsed=sum(1 for entry in entries if 'sop_instance_uid' in entry),
+        files_stored=sum(1 for entry in entries if entry['status'] == STORED),
+        files_failed=sum(1 for entry in entries if entry['status'] == FAILED),
+        locked_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+def ingest_pending(job):
+    """Ingère les fichiers du manifeste qui n'ont pas encore d'entrée dans le rapport.
+
+    Le rapport est enregistré au fil de l'ingestion (None pour un fichier
+    pas encore traité), l'entrée d'une série stockée dans la même
+    transaction que ses instances : une tâche reprise après l'arrêt d'un
+    worker ne retraite pas les fichiers déjà déplacés vers le stockage.
+    """
+    with open(os.path.join(job.spool_directory, MANIFEST_NAME)) as manifest:
+        files = [tuple(item) for item in json.load(manifest)]
+    report = list(job.report) or [None] * len(files)
+    pending = [index for index, entry in enumerate(report) if entry is None]
+
+    def checkpoint(entries):
+        for index, entry in entries.items():
+            report[pending[index]] = entry
+        save_report(job, report)
+
+    ingest_files([files[index] for index in pending], job.patient_id, job.created_by,
+                 forward=False, checkpoint=checkpoint)
+
+
+def forward_pending(job, progress):
+    """Transmet à Orthanc les instances stockées qui ne l'ont pas encore été.
+
+    L'envoi se fait par lots de FORWARD_BATCH_SIZE instances ; le rapport
+    est enregistré après chaque lot, ce qui renouvelle le bail de la tâche
+    (locked_at) pendant un long envoi. Une instance supprimée depuis son
+    ingestion est marquée SKIPPED et n'est plus retentée.
+    Retourne le nombre d'envois encore en échec.
+    """
+    pending = {
+        entry['sop_instance_uid']: entry
+        for entry in job.report
+        if entry['status'] == STORED and entry.get('orthanc') not in (200, SKIPPED)
+    }
+    paths = dict(
+        DicomInstance.objects.filter(sop_instance_uid__in=pending)
+        .values_list('sop_instance_uid', 'file_path')
+    )
+    for uid in set(pending) - set(paths):
+        pending.pop(uid)['orthanc'] = SKIPPED
+
+    uids = list(pending)
+    failures = 0
+    for start in range(0, len(uids), FORWARD_BATCH_SIZE):
+        batch = {paths[uid]: uid for uid in uids[start:start + FORWARD_BATCH_SIZE]}
+        results = push_to_orthanc(list(batch))
+        for key, result in results.items():
+            pending[batch[key]]['orthanc'] = result
+        forwarded = sum(1 for result in results.values() if result == 200)
+        failures += len(batch) - forwarded
+        save_report(job, job.report)
+        progress(forwarded=forwarded)
+    return failures
+
+
+def run_job(job):
+    """Exécute une tâche réservée : ingestion (une seule fois par fichier) puis envoi à Orthanc avec reprise."""
+    try:
+        if not job.report or None in job.report:
+            ingest_pending(job)
+
+        remaining = forward_pending(job, make_progress(job))
+    except Exception as e:
+        logger.exception("Échec de la tâche d'ingestion %s", job.pk)
+        job.refresh_from_db(fields=['files_parsed', 'files_stored', 'files_forwarded', 'files_failed'])
+        job.status = IngestJob.Status.FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save()
+        shutil.rmtree(job.spool_directory, ignore_errors=True)
+        return job
+
+    job.refresh_from_db(fields=['files_parsed', 'files_stored', 'files_forwarded', 'files_failed'])
+    if remaining and job.attempts < settings.DICOM_FORWARD_MAX_ATTEMPTS:
+        # Orthanc indisponible : nouvel essai avec un délai exponentiel
+        delay = settings.DICOM_FORWARD_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+        job.status = IngestJob.Status.RETRY
+        job.available_at = timezone.now() + timedelta(seconds=delay)
+        job.error = f"{remaining} fichier(s) non transmis à Orthanc, nouvel essai dans {delay} s"
+    else:
+        job.status = IngestJob.Status.SUCCEEDED
+        job.error = f"{remaining} fichier(s) non transmis à Orthanc" if remaining else ''
+        job.finished_at = timezone.now()
+        shutil.rmtree(job.spool_directory, ignore_errors=True)
+    job.locked_at = None
+    job.save()
+    return job
+
+
+def process_next_job():
+    """Réserve et exécute une tâche ; retourne la tâche traitée ou None si la file est vide."""
+    job = claim_next_job()
+    if job is None:
+        return None
+    return run_job(job)
+
+
+def work(poll_interval=1.0, burst=False):
+    """Boucle d'un worker. En mode `burst`, s'arrête dès que la file est vide."""
+    while True:
+        close_old_connections()
+        job = process_next_job()
+        if job is not None:
+            logger.info("Tâche d'ingestion %s : %s", job.pk, job.status)
+            continue
+        if burst:
+            return
+        time.sleep(poll_interval)
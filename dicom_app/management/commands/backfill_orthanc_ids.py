@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from dicom_app.orthanc_ids import LEVELS, backfill
+
+
+class Command(BaseCommand):
+    help = "Renseigne l'identifiant Orthanc des études, séries et instances qui n'en ont pas (/tools/lookup)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--level', choices=sorted(LEVELS), action='append',
+                            help="Niveau à compléter (répétable) ; tous par défaut")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Lignes résolues par lot")
+
+    def handle(self, *args, **options):
+        for level in options['level'] or LEVELS:
+            resolved, unmatched, failed = backfill(level, options['batch_size'])
+            self.stdout.write(
+                f"{level} : {resolved} résolu(s), {unmatched} absent(s) d'Orthanc ou ambigu(s), {failed} échec(s)"
+            )
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from pydicom.uid import generate_uid
+
+from dicom_app import async_views, multipart
+from dicom_app.benchmark import summarize
+from dicom_app.deletion import delete_rows
+from dicom_app.dicom_web import QIDOView, StudiesRSView, WADOView
+from dicom_app.fake_orthanc import FakeOrthancProcess
+from dicom_app.models import DicomStudy
+from dicom_app.orthanc import reset_orthanc_clients
+from dicom_app.storage import reset_dicom_storage
+from dicom_app.synthetic import CT_IMAGE_STORAGE, dicom_bytes, dicom_dataset
+from medical.models import PatientDoctor
+
+User = get_user_model()
+
+WADO_PARAMS = {'studyUID': '1.2.3', 'seriesUID': '1.2.3.4', 'objectUID': '1.2.3.4.5'}
+QIDO_PARAMS = {'StudyInstanceUID': '1.2.3'}
+
+SYNC_VIEWS = {'wado': WADOView, 'qido': QIDOView, 'stow': StudiesRSView}
+SYNC_PATHS = {'wado': '/api/dicom/wado/', 'qido': '/api/dicom/qido/', 'stow': '/api/dicom/dicom-web/studies'}
+ASYNC_VIEWS = {'wado': async_views.wado, 'qido': async_views.qido, 'stow': async_views.stow}
+ASYNC_PATHS = {'wado': '/api/dicom/async/wado/', 'qido': '/api/dicom/async/qido/', 'stow': '/api/dicom/async/studies/'}
+
+
+class Command(BaseCommand):
+    help = "Compare les proxys DICOMweb synchrones et asynchrones face à un Orthanc factice"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=['wado', 'qido', 'stow'], default='wado')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=100,
+                            help="Requêtes simultanées côté asynchrone")
+        parser.add_argument('--sync-workers', type=int, default=16,
+                            help="Threads simulant les workers WSGI côté synchrone")
+        parser.add_argument('--latency-ms', type=float, default=50.0,
+                            help="Latence injectée par l'Orthanc factice")
+        parser.add_argument('--payload-kb', type=int, default=512)
+        parser.add_argument('--json', action='store_true', help="Sortie JSON uniquement")
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(
+            username='bench_doctor', defaults={'role': 'DOCTOR'}
+        )
+        self.auth_header = f'Bearer {AccessToken.for_user(user)}'
+        endpoint = options['endpoint']
+        if endpoint == 'stow':
+            # Une instance distincte par requête, rattachée à un patient du médecin
+            self.patient, _ = User.objects.get_or_create(
+                username='bench_patient', defaults={'role': 'PATIENT'}
+            )
+            PatientDoctor.objects.get_or_create(patient=self.patient, doctor=user)
+
+        server = FakeOrthancProcess(
+            latency=options['latency_ms'] / 1000,
+            payload_size=options['payload_kb'] * 1024,
+        ).start()
+        storage_root = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        try:
+            with override_settings(ORTHANC_URL=server.url,
+                                   ORTHANC_ASYNC_POOL_SIZE=options['concurrency'],
+                                   DICOM_STORAGE_ROOT=storage_root.name,
+                                   DICOM_STORAGE_BACKEND='local'):
+                reset_orthanc_clients()
+                reset_dicom_storage()
+                results = {
+                    'endpoint': endpoint,
+                    'orthanc_latency_ms': options['latency_ms'],
+                    'sync': self.run_sync(endpoint, options),
+                    'async': asyncio.run(self.run_async(endpoint, options)),
+                }
+        finally:
+            if endpoint == 'stow':
+                delete_rows('studies', list(
+                    DicomStudy.objects.filter(patient=self.patient).values_list('pk', flat=True)
+                ))
+            reset_orthanc_clients()
+            reset_dicom_storage()
+            server.stop()
+            storage_root.cleanup()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for mode in ('sync', 'async'):
+            r = results[mode]
+            self.stdout.write(
+                f"{mode:>5}: {r['throughput_rps']} req/s, p50 {r['p50_ms']} ms, "
+                f"p99 {r['p99_ms']} ms, {r['errors']} erreurs / {r['requests']}"
+            )
+
+    def stow_body(self):
+        """Corps STOW-RS d'une instance aux UIDs jamais envoyés (pas de doublon)."""
+        ds = dicom_dataset(CT_IMAGE_STORAGE, 'CT', generate_uid(), generate_uid(), generate_uid(), 1)
+        boundary = multipart.new_boundary()
+        body = b''.join(multipart.iter_multipart([('application/dicom', {}, [dicom_bytes(ds)])], boundary))
+        return body, multipart.content_type(boundary, 'application/dicom')
+
+    def make_request(self, factory, endpoint, path):
+        headers = {'Authorization': self.auth_header}
+        if endpoint == 'stow':
+            body, content_type = self.stow_body()
+            return factory.post(f'{path}?patient={self.patient.pk}', data=body,
+                                content_type=content_type, headers=headers)
+        return factory.get(path, WADO_PARAMS if endpoint == 'wado' else QIDO_PARAMS, headers=headers)
+
+    def run_sync(self, endpoint, options):
+        factory = RequestFactory()
+        view = SYNC_VIEWS[endpoint].as_view()
+        latencies, errors = [], []
+
+        def one(_):
+            request = self.make_request(factory, endpoint, SYNC_PATHS[endpoint])
+            start = time.perf_counter()
+            response = view(request)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elif hasattr(response, 'render'):
+                response.render()
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['sync_workers']) as pool:
+            list(pool.map(one, range(options['requests'])))
+        return summarize(latencies, len(errors), time.perf_counter() - start)
+
+    async def run_async(self, endpoint, options):
+        factory = AsyncRequestFactory()
+        view = ASYNC_VIEWS[endpoint]
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies, errors = [], []
+
+        async def one():
+            async with semaphore:
+                request = self.make_request(factory, endpoint, ASYNC_PATHS[endpoint])
+                start = time.perf_counter()
+                response = await view(request)
+                if response.streaming:
+                    async for _ in response.streaming_content:
+                        pass
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+                else:
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(options['requests'])))
+        return summarize(latencies, len(errors), time.perf_counter() - start)
@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pydicom
+from django.core.management.base import BaseCommand
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from dicom_app.metadata import dataset_metadata, extract_metadata, extract_metadata_batch
+
+CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2'
+ENHANCED_MR_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.4.1'
+
+
+def legacy_extract(path):
+    """Ancienne utils.extract_dicom_metadata : lecture complète, pixels compris."""
+    return dataset_metadata(pydicom.dcmread(path))
+
+
+def make_dataset(sop_class_uid, modality, rows, frames, study_uid, series_uid, number):
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = sop_class_uid
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.preamble = b'\0' * 128
+    ds.SOPClassUID = sop_class_uid
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = modality
+    ds.StudyDate = '20240101'
+    ds.StudyDescription = 'Benchmark'
+    ds.SeriesDescription = modality
+    ds.SeriesNumber = 1
+    ds.InstanceNumber = number
+    ds.StudyID = '1'
+    ds.AccessionNumber = 'BENCH'
+    ds.PatientName = 'Bench^Patient'
+    ds.PatientID = 'BENCH'
+    ds.Rows = rows
+    ds.Columns = rows
+    ds.NumberOfFrames = frames
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 16
+    ds.BitsStored = 12
+    ds.HighBit = 11
+    ds.PixelRepresentation = 0
+    return ds
+
+
+def make_multiframe(path, rows, frames, study_uid, series_uid, number):
+    ds = make_dataset(CT_IMAGE_STORAGE, 'CT', rows, frames, study_uid, series_uid, number)
+    ds.PixelData = b'\0' * (rows * rows * 2 * frames)
+    ds.save_as(path, enforce_file_format=True)
+
+
+def make_enhanced_mr(path, rows, frames, study_uid, series_uid, number):
+    """MR « enhanced » : une séquence fonctionnelle par image, entre l'en-tête et les pixels."""
+    ds = make_dataset(ENHANCED_MR_IMAGE_STORAGE, 'MR', rows, frames, study_uid, series_uid, number)
+    shared = Dataset()
+    measures = Dataset()
+    measures.PixelSpacing = [0.5, 0.5]
+    measures.SliceThickness = 1.0
+    shared.PixelMeasuresSequence = [measures]
+    ds.SharedFunctionalGroupsSequence = [shared]
+    per_frame = []
+    for index in range(frames):
+        item = Dataset()
+        content = Dataset()
+        content.StackID = '1'
+        content.InStackPositionNumber = index + 1
+        content.DimensionIndexValues = [1, index + 1]
+        item.FrameContentSequence = [content]
+        position = Dataset()
+        position.ImagePositionPatient = [0.0, 0.0, float(index)]
+        item.PlanePositionSequence = [position]
+        orientation = Dataset()
+        orientation.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+        item.PlaneOrientationSequence = [orientation]
+        per_frame.append(item)
+    ds.PerFrameFunctionalGroupsSequence = per_frame
+    ds.PixelData = b'\0' * (rows * rows * 2 * frames)
+    ds.save_as(path, enforce_file_format=True)
+
+
+class Command(BaseCommand):
+    help = "Compare l'extraction de métadonnées complète et limitée à l'en-tête"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=20, help="Fichiers générés par type")
+        parser.add_argument('--rows', type=int, default=256)
+        parser.add_argument('--frames', type=int, default=100)
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Processus du pool pour l'API groupée (défaut : nombre de CPU)")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON uniquement")
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='bench-metadata-')
+        try:
+            results = {}
+            for kind, factory in (('multiframe', make_multiframe), ('enhanced_mr', make_enhanced_mr)):
+                paths = self.generate(directory, kind, factory, options)
+                results[kind] = self.measure(paths, options['processes'])
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for kind, r in results.items():
+            self.stdout.write(
+                f"{kind:>12} ({r['file_mb']} Mo/fichier) : complet {r['legacy_ms']} ms, "
+                f"en-tête {r['header_ms']} ms ({r['speedup']}x), "
+                f"groupé {r['batch_ms']} ms par fichier"
+            )
+
+    def generate(self, directory, kind, factory, options):
+        study_uid, series_uid = generate_uid(), generate_uid()
+        paths = []
+        for number in range(1, options['files'] + 1):
+            path = os.path.join(directory, f'{kind}-{number}.dcm')
+            factory(path, options['rows'], options['frames'], study_uid, series_uid, number)
+            paths.append(path)
+        return paths
+
+    def measure(self, paths, processes):
+        def per_file_ms(function):
+            start = time.perf_counter()
+            function()
+            return round((time.perf_counter() - start) / len(paths) * 1000, 3)
+
+        legacy = [legacy_extract(path) for path in paths]
+        if [extract_metadata(path) for path in paths] != legacy:
+            raise AssertionError("Métadonnées différentes entre les deux extracteurs")
+
+        legacy_ms = per_file_ms(lambda: [legacy_extract(path) for path in paths])
+        header_ms = per_file_ms(lambda: [extract_metadata(path) for path in paths])
+        batch_ms = per_file_ms(lambda: extract_metadata_batch(paths, processes=processes))
+        return {
+            'files': len(paths),
+            'file_mb': round(os.path.getsize(paths[0]) / 1024 / 1024, 1),
+            'legacy_ms': legacy_ms,
+            'header_ms': header_ms,
+            'batch_ms': batch_ms,
+            'speedup': round(legacy_ms / header_ms, 1) if header_ms else None,
+        }
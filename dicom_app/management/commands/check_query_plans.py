@@ -0,0 +1,208 @@
+import re
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from dicom_app.jobs import claimable_jobs
+from dicom_app.models import DicomStudy, DicomSeries, DicomInstance, IngestJob
+from dicom_app.pagination import InstanceCursorPagination
+from dicom_app.views import DicomStudyViewSet, DicomSeriesViewSet, DicomInstanceViewSet, IngestJobViewSet
+from medical.models import (
+    Hospital, User, PatientDoctor, Appointment, MedicalRecord, MedicalHistory, Treatment, Examination
+)
+from medical.views import (
+    AppointmentViewSet, MedicalRecordViewSet, MedicalHistoryViewSet, TreatmentViewSet,
+    ExaminationViewSet, PatientDoctorViewSet
+)
+
+# Lecture complète d'une table, sans index, dans le plan selon la base. Le
+# parcours ordonné d'un index (SCAN ... USING INDEX) reste admis : avec LIMIT,
+# il s'arrête dès la page remplie.
+FULL_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)$', re.MULTILINE),
+}
+
+# SQLite n'emploie pas d'index partiel lorsque la condition arrive en paramètre
+PARTIAL_INDEX = 'partial'
+
+# Tables volumineuses : aucune liste ne doit les lire en entier
+HOT_MODELS = [
+    Appointment, MedicalRecord, MedicalHistory, Treatment, Examination, PatientDoctor,
+    DicomStudy, DicomSeries, DicomInstance, IngestJob,
+]
+
+
+def list_queryset(viewset_class, user, params=None, **initkwargs):
+    """Requête de l'action `list` d'un viewset, filtres et tri par défaut compris."""
+    request = Request(APIRequestFactory().get('/', params or {}))
+    request.user = user
+    view = viewset_class(request=request, action='list', format_kwarg=None, args=(), kwargs={}, **initkwargs)
+    return view.filter_queryset(view.get_queryset())
+
+
+class Command(BaseCommand):
+    help = (
+        "Peuple la base d'un jeu de données, puis vérifie par EXPLAIN qu'aucune "
+        "liste filtrée par rôle ne parcourt une table volumineuse en entier"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1,
+                            help="Multiplicateur du volume de données générées (1 : 1000 patients)")
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--keep', action='store_true',
+                            help="Conserve les données générées (annulées par défaut)")
+        parser.add_argument('--show-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f"Base non gérée : {connection.vendor}")
+
+        with transaction.atomic():
+            users = self.seed(options['scale'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            failures = self.check_plans(users, pattern, options)
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(
+                f"{len(failures)} requête(s) avec parcours complet : " + ', '.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS("Aucun parcours complet sur les tables volumineuses"))
+
+    def hot_queries(self, users):
+        doctor, patient, secretary = users['doctor'], users['patient'], users['secretary']
+        series = DicomSeries.objects.filter(study__doctor=doctor).first()
+        return [
+            ('appointments/doctor', list_queryset(AppointmentViewSet, doctor)),
+            ('appointments/patient', list_queryset(AppointmentViewSet, patient)),
+            ('appointments/secretary', list_queryset(AppointmentViewSet, secretary)),
+            ('patient-doctors/doctor', list_queryset(PatientDoctorViewSet, doctor)),
+            ('medical-records/doctor', list_queryset(MedicalRecordViewSet, doctor)),
+            ('medical-records/patient', list_queryset(MedicalRecordViewSet, patient)),
+            ('medical-records/doctor?is_active',
+             list_queryset(MedicalRecordViewSet, doctor, {'is_active': 'true'}), PARTIAL_INDEX),
+            ('medical-histories/patient', list_queryset(MedicalHistoryViewSet, patient)),
+            ('treatments/patient', list_queryset(TreatmentViewSet, patient)),
+            ('examinations/patient', list_queryset(ExaminationViewSet, patient)),
+            ('dicom-studies/doctor', list_queryset(DicomStudyViewSet, doctor, {'view': 'summary'})),
+            ('dicom-studies/patient', list_queryset(DicomStudyViewSet, patient, {'view': 'summary'})),
+            ('dicom-series/doctor', list_queryset(DicomSeriesViewSet, doctor, {'view': 'summary'})),
+            ('dicom-instances/doctor', list_queryset(DicomInstanceViewSet, doctor, {'view': 'summary'})),
+            ('dicom-series/instances', series.instances.order_by(*InstanceCursorPagination.ordering)),
+            ('ingest-jobs/doctor', list_queryset(IngestJobViewSet, doctor)),
+            ('ingest-jobs/claim', claimable_jobs(timezone.now()), PARTIAL_INDEX),
+        ]
+
+    def check_plans(self, users, pattern, options):
+        hot_tables = {model._meta.db_table for model in HOT_MODELS}
+        failures = []
+        for label, queryset, *flags in self.hot_queries(users):
+            if PARTIAL_INDEX in flags and connection.vendor != 'postgresql':
+                self.stdout.write(f"--    {label} (index partiel, vérifié sous PostgreSQL uniquement)")
+                continue
+            plan = queryset[:options['page_size']].explain()
+            scanned = sorted(set(pattern.findall(plan)) & hot_tables)
+            if scanned:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f"ÉCHEC {label} : parcours complet de {', '.join(scanned)}"))
+            else:
+                self.stdout.write(f"ok    {label}")
+            if options['show_plans'] or scanned:
+                self.stdout.write(plan + '\n')
+        return failures
+
+    def seed(self, scale):
+        """Jeu de données réaliste : quelques médecins, beaucoup de patients et d'images."""
+        def count(n):
+            return max(1, round(n * scale))
+
+        hospitals = Hospital.objects.bulk_create([
+            Hospital(name=f'Hôpital {i}', address='-', phone='-', email=f'h{i}@example.org')
+            for i in range(5)
+        ])
+
+        def users(role, count, prefix):
+            return User.objects.bulk_create([
+                User(username=f'plan_{prefix}_{i}', role=role, hospital=hospitals[i % len(hospitals)], password='!')
+                for i in range(count)
+            ], batch_size=1000)
+
+        doctors = users(User.Role.DOCTOR, count(50), 'doctor')
+        patients = users(User.Role.PATIENT, count(1000), 'patient')
+        secretaries = users(User.Role.SECRETARY, len(hospitals), 'secretary')
+
+        PatientDoctor.objects.bulk_create([
+            PatientDoctor(patient=patient, doctor=doctors[(i + k) % len(doctors)])
+            for i, patient in enumerate(patients) for k in range(min(2, len(doctors)))
+        ], batch_size=5000)
+
+        now = timezone.now()
+        Appointment.objects.bulk_create([
+            Appointment(patient=patient, doctor=doctors[(i + k) % len(doctors)], date=now - timedelta(days=k))
+            for i, patient in enumerate(patients) for k in range(20)
+        ], batch_size=5000)
+
+        today = date.today()
+        records = MedicalRecord.objects.bulk_create([
+            MedicalRecord(
+                patient=patient, doctor=doctors[(i + k) % len(doctors)],
+                record_date=today - timedelta(days=k), chief_complaint='-', diagnosis='-',
+                treatment_plan='-', is_active=k % 5 != 0,
+            )
+            for i, patient in enumerate(patients) for k in range(10)
+        ], batch_size=5000)
+        MedicalHistory.objects.bulk_create([
+            MedicalHistory(medical_record=record, condition='-', description='-', start_date=record.record_date)
+            for record in records
+        ], batch_size=5000)
+        Treatment.objects.bulk_create([
+            Treatment(medical_record=record, medication='-', dosage='-', frequency='-',
+                      start_date=record.record_date, is_active=record.is_active)
+            for record in records
+        ], batch_size=5000)
+        Examination.objects.bulk_create([
+            Examination(medical_record=record, exam_type='-', result='-', exam_date=record.record_date)
+            for record in records
+        ], batch_size=5000)
+
+        studies = DicomStudy.objects.bulk_create([
+            DicomStudy(
+                patient=patient, doctor=doctors[(i + k) % len(doctors)],
+                study_instance_uid=f'2.25.1{i}{k:03d}', study_date=today - timedelta(days=k),
+                study_description='-', study_id=str(k),
+            )
+            for i, patient in enumerate(patients) for k in range(3)
+        ], batch_size=5000)
+        series = DicomSeries.objects.bulk_create([
+            DicomSeries(
+                study=study, series_instance_uid=f'{study.study_instance_uid}.{k}',
+                series_number=k, series_description='-', modality='CT', number_of_instances=10,
+            )
+            for study in studies for k in range(4)
+        ], batch_size=5000)
+        DicomInstance.objects.bulk_create([
+            DicomInstance(
+                series=s, sop_instance_uid=f'{s.series_instance_uid}.{k}', instance_number=k,
+                file_path='-', file_size=0,
+            )
+            for s in series for k in range(10)
+        ], batch_size=5000)
+        IngestJob.objects.bulk_create([
+            IngestJob(
+                created_by=doctors[i % len(doctors)], patient=patients[i % len(patients)],
+                status=IngestJob.Status.SUCCEEDED if i % 100 else IngestJob.Status.PENDING,
+                spool_directory='-',
+            )
+            for i in range(count(2000))
+        ], batch_size=5000)
+
+        return {'doctor': doctors[0], 'patient': patients[0], 'secretary': secretaries[0]}
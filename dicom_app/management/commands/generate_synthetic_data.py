@@ -0,0 +1,49 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dicom_app.synthetic import DEFAULT_PASSWORD, SyntheticDataGenerator, SyntheticScale, flush
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données synthétique reproductible : hôpitaux, personnel, "
+        "patients, dossiers médicaux et études DICOM avec leurs fichiers"
+    )
+
+    def add_arguments(self, parser):
+        SyntheticScale.add_arguments(parser)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='synth',
+                            help="Préfixe des noms d'utilisateur et d'hôpitaux générés")
+        parser.add_argument('--no-files', action='store_true',
+                            help="N'écrit pas de fichier DICOM (lignes d'instances seules)")
+        parser.add_argument('--flush', action='store_true',
+                            help="Supprime d'abord les données générées avec le même préfixe")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON uniquement")
+
+    def handle(self, *args, **options):
+        generator = SyntheticDataGenerator(
+            SyntheticScale.from_options(options),
+            seed=options['seed'],
+            prefix=options['prefix'],
+            write_files=not options['no_files'],
+        )
+        start = time.perf_counter()
+        with transaction.atomic():
+            deleted = flush(options['prefix']) if options['flush'] else 0
+            counts = generator.generate()
+        elapsed = round(time.perf_counter() - start, 2)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'deleted': deleted, 'created': counts, 'seconds': elapsed}, indent=2))
+            return
+        if deleted:
+            self.stdout.write(f"{deleted} objets supprimés")
+        for name, count in counts.items():
+            self.stdout.write(f"{name:>18} : {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Données générées en {elapsed} s (comptes {options['prefix']}-*, mot de passe '{DEFAULT_PASSWORD}')"
+        ))
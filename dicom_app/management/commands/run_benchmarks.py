@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from dicom_app.benchmark import compare, endpoint_scenarios, run_scenarios
+from dicom_app.fake_orthanc import FakeOrthancProcess
+from dicom_app.orthanc import reset_orthanc_clients
+from dicom_app.rendering import reset_render_cache
+from dicom_app.storage import reset_dicom_storage
+from dicom_app.synthetic import SyntheticDataGenerator, SyntheticScale, invalidate_caches
+from medical.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure débit, latences p50/p99 et requêtes SQL des principaux endpoints "
+        "sur un jeu de données synthétique, face à un Orthanc factice"
+    )
+
+    def add_arguments(self, parser):
+        SyntheticScale.add_arguments(parser)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50, help="Requêtes mesurées par scénario")
+        parser.add_argument('--warmup', type=int, default=5, help="Requêtes non mesurées par scénario")
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help="Limite l'exécution à ce scénario (option répétable)")
+        parser.add_argument('--use-existing', metavar='PREFIX',
+                            help="Utilise les données de generate_synthetic_data au lieu d'en générer")
+        parser.add_argument('--keep', action='store_true',
+                            help="Conserve les données générées et les uploads (annulés par défaut)")
+        parser.add_argument('--latency-ms', type=float, default=0.0,
+                            help="Latence injectée par l'Orthanc factice")
+        parser.add_argument('--payload-kb', type=int, default=64, help="Taille des réponses WADO factices")
+        parser.add_argument('--output', help="Écrit les résultats JSON dans ce fichier")
+        parser.add_argument('--baseline', help="Résultats JSON de référence à comparer")
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help="Hausse de latence médiane tolérée par rapport à la référence")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON uniquement")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        scale = SyntheticScale.from_options(options)
+        overrides = {'ALLOWED_HOSTS': ['testserver'], 'REQUEST_PROFILE_DIR': ''}
+        storage_root = None
+        if not options['keep']:
+            # Fichiers générés et uploadés : supprimés avec les données
+            storage_root = tempfile.mkdtemp(prefix='benchmark-storage-')
+            overrides.update(DICOM_STORAGE_BACKEND='local', DICOM_STORAGE_ROOT=storage_root,
+                             DICOM_RENDER_CACHE_DIR=os.path.join(storage_root, 'rendered'))
+        server = FakeOrthancProcess(
+            latency=options['latency_ms'] / 1000,
+            payload_size=options['payload_kb'] * 1024,
+        ).start()
+        # Une ligne de journal par requête fausserait les mesures
+        request_logger = logging.getLogger('pycrafted.requests')
+        level = request_logger.level
+        request_logger.setLevel(logging.WARNING)
+        try:
+            with override_settings(ORTHANC_URL=server.url, **overrides):
+                reset_orthanc_clients()
+                reset_dicom_storage()
+                reset_render_cache()
+                results = self.run(scale, options)
+        finally:
+            request_logger.setLevel(level)
+            reset_orthanc_clients()
+            reset_dicom_storage()
+            reset_render_cache()
+            server.stop()
+            if storage_root:
+                shutil.rmtree(storage_root, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        regressions = compare(results, baseline, options['max_regression']) if baseline else []
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results)
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} régression(s) par rapport à {options['baseline']} :\n" + '\n'.join(regressions)
+            )
+
+    def run(self, scale, options):
+        with transaction.atomic():
+            if options['use_existing']:
+                dataset = None
+                prefix = options['use_existing']
+            else:
+                prefix = f'benchmark{options["seed"]}'
+                dataset = SyntheticDataGenerator(scale, seed=options['seed'], prefix=prefix).generate()
+            doctor = User.objects.filter(
+                username__startswith=f'{prefix}-doctor-', role=User.Role.DOCTOR
+            ).order_by('username').first()
+            if doctor is None:
+                raise CommandError(f"Aucun médecin {prefix}-doctor-* : lancez generate_synthetic_data")
+
+            start = time.perf_counter()
+            scenarios = run_scenarios(
+                doctor, endpoint_scenarios(doctor, options['seed']),
+                options['iterations'], options['warmup'], options['scenarios'],
+            )
+            elapsed = time.perf_counter() - start
+            doctor_ids = list(User.objects.filter(
+                username__startswith=f'{prefix}-doctor-', role=User.Role.DOCTOR
+            ).values_list('pk', flat=True))
+            if not options['keep']:
+                transaction.set_rollback(True)
+        if not options['keep']:
+            # Rien n'a été validé : les caches ne doivent pas survivre aux données
+            invalidate_caches(doctor_ids)
+
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'seed': options['seed'],
+                'scale': None if options['use_existing'] else scale.as_dict(),
+                'dataset_prefix': prefix,
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'orthanc_latency_ms': options['latency_ms'],
+                'seconds': round(elapsed, 2),
+            },
+            'dataset': dataset,
+            'scenarios': scenarios,
+        }
+
+    def report(self, results):
+        for name, r in results['scenarios'].items():
+            if 'skipped' in r:
+                self.stdout.write(f"{name:>24} : ignoré ({r['skipped']})")
+                continue
+            self.stdout.write(
+                f"{name:>24} : {r['throughput_rps']} req/s, p50 {r['p50_ms']} ms, p99 {r['p99_ms']} ms, "
+                f"{r['queries_mean']} requêtes SQL (max {r['queries_max']}), {r['errors']} erreurs / {r['requests']}"
+            )
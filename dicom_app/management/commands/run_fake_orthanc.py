@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from dicom_app.fake_orthanc import FakeOrthancServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Lance un Orthanc factice (REST, WADO-URI, QIDO-RS, WADO-RS, STOW-RS) adossé à un "
+        "répertoire de fichiers, avec latence et erreurs injectées ; à utiliser avec ORTHANC_URL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8042)
+        parser.add_argument('--storage-dir',
+                            help="Répertoire des instances, indexé au démarrage (défaut : temporaire)")
+        parser.add_argument('--latency-ms', type=float, default=0.0, help="Latence ajoutée à chaque requête")
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help="Fraction des requêtes en erreur (0 à 1)")
+        parser.add_argument('--error-status', type=int, default=503, help="Statut HTTP des erreurs injectées")
+        parser.add_argument('--seed', type=int, default=None, help="Graine du tirage des erreurs")
+        parser.add_argument('--stream-chunk-kb', type=int, default=64)
+        parser.add_argument('--stream-chunk-delay-ms', type=float, default=0.0,
+                            help="Pause entre deux blocs des réponses (débit limité)")
+        parser.add_argument('--payload-kb', type=int, default=0,
+                            help="Contenu synthétique servi par /wado pour les objets inconnus (0 : 404)")
+
+    def handle(self, *args, **options):
+        server = FakeOrthancServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            payload_size=options['payload_kb'] * 1024,
+            storage_dir=options['storage_dir'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            seed=options['seed'],
+            stream_chunk_size=options['stream_chunk_kb'] * 1024,
+            stream_chunk_delay=options['stream_chunk_delay_ms'] / 1000,
+        )
+        statistics = server.store.statistics()
+        self.stdout.write(
+            f"Orthanc factice sur {server.url} ({statistics['CountInstances']} instances dans "
+            f"{server.store.root}) ; ORTHANC_URL={server.url}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
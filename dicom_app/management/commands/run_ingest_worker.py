@@ -0,0 +1,38 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from dicom_app.jobs import work
+
+
+class Command(BaseCommand):
+    help = "Traite les tâches d'ingestion DICOM déposées via /api/dicom/jobs/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Nombre de processus workers")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Attente (s) lorsque la file est vide")
+        parser.add_argument('--burst', action='store_true',
+                            help="S'arrête dès que la file est vide")
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            work(options['poll_interval'], options['burst'])
+            return
+
+        # Chaque processus ouvre sa propre connexion à la base
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=work, args=(options['poll_interval'], options['burst']))
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,141 @@
+"""Extraction rapide des métadonnées DICOM, limitée à l'en-tête.
+
+Seuls les attributs de METADATA_KEYWORDS sont décodés, et la lecture s'arrête au
+premier élément situé après le dernier d'entre eux (groupe 0020) : les
+données de pixels, mais aussi les longues séquences par image des objets
+multi-images « enhanced », ne sont jamais lues. Les HEADER_READ_BYTES
+premiers octets sont lus en une fois ; le fichier n'est relu que si l'en-tête
+est plus long.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from pydicom.datadict import tag_for_keyword
+from pydicom.filereader import read_partial
+from pydicom.tag import Tag
+
+from pycrafted.metrics import DICOM_PARSE_DURATION, timer
+from .storage import hash_file
+
+# Attributs lus, dans l'ordre des balises
+METADATA_KEYWORDS = [
+    'SOPClassUID',
+    'SOPInstanceUID',
+    'StudyDate',
+    'AccessionNumber',
+    'Modality',
+    'StudyDescription',
+    'SeriesDescription',
+    'PatientName',
+    'PatientID',
+    'StudyInstanceUID',
+    'SeriesInstanceUID',
+    'StudyID',
+    'SeriesNumber',
+    'InstanceNumber',
+]
+METADATA_TAGS = [Tag(tag_for_keyword(keyword)) for keyword in METADATA_KEYWORDS]
+LAST_METADATA_TAG = max(METADATA_TAGS)
+
+HEADER_READ_BYTES = 64 * 1024
+# En dessous, un pool de processus coûte plus qu'il ne rapporte
+BATCH_MIN_FILES = 8
+
+
+def parse_header(fileobj, keywords=None):
+    """Lit l'en-tête de `fileobj` jusqu'au dernier attribut demandé.
+
+    Retourne (dataset, complet) : `complet` est faux si le flux s'est terminé
+    avant d'atteindre un élément postérieur au dernier attribut demandé.
+    """
+    tags = [Tag(tag_for_keyword(k)) for k in keywords] if keywords else METADATA_TAGS
+    last_tag = max(tags)
+    reached_end = []
+
+    def stop_when(tag, vr, length):
+        if tag > last_tag:
+            reached_end.append(tag)
+            return True
+        return False
+
+    dataset = read_partial(fileobj, stop_when=stop_when, specific_tags=tags)
+    return dataset, bool(reached_end)
+
+
+def read_dataset(path, head=None, keywords=None):
+    """En-tête DICOM de `path`, à partir de `head` (premiers octets déjà lus) si fourni."""
+    with timer(DICOM_PARSE_DURATION):
+        return _read_dataset(path, head, keywords)
+
+
+def _read_dataset(path, head, keywords):
+    if head is None:
+        with open(path, 'rb') as f:
+            head = f.read(HEADER_READ_BYTES)
+    size = os.path.getsize(path)
+    if len(head) >= size:
+        return parse_header(io.BytesIO(head), keywords)[0]
+    try:
+        dataset, complete = parse_header(io.BytesIO(head), keywords)
+        if complete:
+            return dataset
+    except Exception:
+        # En-tête tronqué au milieu d'un élément
+        pass
+    # En-tête plus long que les octets disponibles : lecture depuis le fichier
+    with open(path, 'rb') as f:
+        return parse_header(f, keywords)[0]
+
+
+def dataset_metadata(ds):
+    """Dictionnaire de métadonnées attendu par l'ingestion (cf. utils.extract_dicom_metadata)."""
+    return {
+        'study_instance_uid': str(ds.StudyInstanceUID),
+        'series_instance_uid': str(ds.SeriesInstanceUID),
+        'sop_instance_uid': str(ds.SOPInstanceUID),
+        'modality': str(ds.Modality),
+        'study_date': ds.StudyDate,
+        'study_description': str(ds.StudyDescription) if hasattr(ds, 'StudyDescription') else '',
+        'series_description': str(ds.SeriesDescription) if hasattr(ds, 'SeriesDescription') else '',
+        'series_number': int(ds.SeriesNumber) if hasattr(ds, 'SeriesNumber') else 0,
+        'instance_number': int(ds.InstanceNumber) if hasattr(ds, 'InstanceNumber') else 0,
+        'study_id': str(ds.StudyID) if hasattr(ds, 'StudyID') else '',
+        'accession_number': str(ds.AccessionNumber) if hasattr(ds, 'AccessionNumber') else '',
+        'patient_name': str(ds.PatientName) if hasattr(ds, 'PatientName') else '',
+        'dicom_patient_id': str(ds.PatientID) if hasattr(ds, 'PatientID') else '',
+        'sop_class_uid': str(ds.SOPClassUID) if hasattr(ds, 'SOPClassUID') else '',
+        'number_of_instances': 1  # Par défaut, on suppose une seule instance
+    }
+
+
+def extract_metadata(path):
+    return dataset_metadata(read_dataset(path))
+
+
+def _extract_or_error(path, content_hash=False):
+    try:
+        metadata = extract_metadata(path)
+        if content_hash:
+            metadata['content_hash'] = hash_file(path)
+        return metadata
+    except Exception as e:
+        # Les exceptions de pydicom ne sont pas toutes sérialisables entre processus
+        return ValueError(f"{type(e).__name__}: {e}")
+
+
+def extract_metadata_batch(paths, processes=None, chunksize=16, content_hash=False):
+    """Métadonnées de nombreux fichiers, lues dans un pool de processus.
+
+    Retourne, dans l'ordre de `paths`, le dictionnaire de métadonnées ou
+    l'exception rencontrée pour chaque fichier. Avec `content_hash`, le
+    dictionnaire reçoit aussi l'empreinte SHA-256 du fichier, calculée par
+    le même processus.
+    """
+    paths = list(paths)
+    extract = partial(_extract_or_error, content_hash=content_hash)
+    if processes == 1 or len(paths) < BATCH_MIN_FILES:
+        return [extract(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(extract, paths, chunksize=chunksize))
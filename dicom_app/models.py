@@ -1,6 +1,48 @@
 from django.db import models
+from django.db.models import Count, Prefetch
 from django.utils.translation import gettext_lazy as _
 from medical.models import User
+from .storage import content_key
+
+class DicomSeriesQuerySet(models.QuerySet):
+    def with_instance_count(self):
+        # Meta.ordering n'est pas appliqué aux requêtes avec GROUP BY : on le rend explicite
+        return self.annotate(instance_count=Count('instances')).order_by(
+            *(self.query.order_by or self.model._meta.ordering)
+        )
+
+    def with_instances(self):
+        """Séries avec leur nombre d'instances annoté et leurs instances préchargées."""
+        return self.with_instance_count().prefetch_related('instances')
+
+class DicomStudyQuerySet(models.QuerySet):
+    def with_participants(self):
+        # UserSerializer expose hospital_name : on charge aussi l'hôpital
+        return self.select_related('patient__hospital', 'doctor__hospital')
+
+    def with_series_count(self):
+        return self.annotate(series_count=Count('series')).order_by(
+            *(self.query.order_by or self.model._meta.ordering)
+        )
+
+    def with_counts(self):
+        """Nombre de séries et d'instances par étude, sans charger les séries."""
+        return self.annotate(
+            series_count=Count('series', distinct=True),
+            instance_count=Count('series__instances'),
+        ).order_by(*(self.query.order_by or self.model._meta.ordering))
+
+    def with_series(self):
+        """Études avec leurs séries (comptées) mais sans précharger les instances."""
+        return self.with_participants().with_series_count().prefetch_related(
+            Prefetch('series', queryset=DicomSeries.objects.with_instance_count())
+        )
+
+    def with_details(self):
+        """Études prêtes pour DicomStudySerializer : un nombre constant de requêtes quel que soit le volume."""
+        return self.with_participants().with_series_count().prefetch_related(
+            Prefetch('series', queryset=DicomSeries.objects.with_instances())
+        )
 
 class DicomStudy(models.Model):
     patient = models.ForeignKey(
@@ -16,19 +58,29 @@ class DicomStudy(models.Model):
         related_name='doctor_studies'
     )
     study_instance_uid = models.CharField(_('UID de l\'étude'), max_length=255, unique=True)
-    study_date = models.DateField(_('Date de l\'étude'))
+    orthanc_id = models.CharField(_('Identifiant Orthanc'), max_length=64, blank=True)
+    study_date = models.DateField(_('Date de l\'étude'), db_index=True)
     study_description = models.CharField(_('Description'), max_length=255)
     study_id = models.CharField(_('ID de l\'étude'), max_length=255)
-    accession_number = models.CharField(_('Numéro d\'accès'), max_length=255, blank=True)
+    accession_number = models.CharField(_('Numéro d\'accès'), max_length=255, blank=True, db_index=True)
+    # Attributs patient de l'en-tête DICOM (recherche QIDO-RS)
+    patient_name = models.CharField(_('Nom du patient (DICOM)'), max_length=255, blank=True, db_index=True)
+    dicom_patient_id = models.CharField(_('ID du patient (DICOM)'), max_length=64, blank=True, db_index=True)
     is_active = models.BooleanField(_('Actif'), default=True)
     created_at = models.DateTimeField(_('Créé le'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Mis à jour le'), auto_now=True)
 
+    objects = DicomStudyQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Étude DICOM')
         verbose_name_plural = _('Études DICOM')
         ordering = ['-study_date']
         unique_together = ['patient', 'study_instance_uid']
+        indexes = [
+            models.Index(fields=['doctor', '-study_date', '-id'], name='dicomstudy_doctor_date_idx'),
+            models.Index(fields=['patient', '-study_date', '-id'], name='dicomstudy_patient_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.study_description} - {self.patient} ({self.study_date})"
@@ -41,19 +93,25 @@ class DicomSeries(models.Model):
         related_name='series'
     )
     series_instance_uid = models.CharField(_('UID de la série'), max_length=255, unique=True)
+    orthanc_id = models.CharField(_('Identifiant Orthanc'), max_length=64, blank=True)
     series_number = models.IntegerField(_('Numéro de série'))
     series_description = models.CharField(_('Description'), max_length=255)
-    modality = models.CharField(_('Modalité'), max_length=255)
+    modality = models.CharField(_('Modalité'), max_length=255, db_index=True)
     number_of_instances = models.IntegerField(_('Nombre d\'instances'), default=0)
     is_active = models.BooleanField(_('Actif'), default=True)
     created_at = models.DateTimeField(_('Créé le'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Mis à jour le'), auto_now=True)
 
+    objects = DicomSeriesQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Série DICOM')
         verbose_name_plural = _('Séries DICOM')
         ordering = ['series_number']
         unique_together = ['study', 'series_instance_uid']
+        indexes = [
+            models.Index(fields=['study', 'series_number'], name='dicomseries_study_number_idx'),
+        ]
 
     def __str__(self):
         return f"{self.series_description} - {self.modality} ({self.series_number})"
@@ -66,9 +124,12 @@ class DicomInstance(models.Model):
         related_name='instances'
     )
     sop_instance_uid = models.CharField(_('UID de l\'instance'), max_length=255, unique=True)
+    orthanc_id = models.CharField(_('Identifiant Orthanc'), max_length=64, blank=True)
+    sop_class_uid = models.CharField(_('Classe SOP'), max_length=64, blank=True)
     instance_number = models.IntegerField(_('Numéro d\'instance'))
     file_path = models.CharField(_('Chemin du fichier'), max_length=512)
     file_size = models.BigIntegerField(_('Taille du fichier'), default=0)
+    content_hash = models.CharField(_('Empreinte SHA-256'), max_length=64, blank=True, db_index=True)
     is_active = models.BooleanField(_('Actif'), default=True)
     created_at = models.DateTimeField(_('Créé le'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Mis à jour le'), auto_now=True)
@@ -78,10 +139,102 @@ class DicomInstance(models.Model):
         verbose_name_plural = _('Instances DICOM')
         ordering = ['instance_number']
         unique_together = ['series', 'sop_instance_uid']
+        indexes = [
+            # Ordre de InstanceCursorPagination (instance_number, id)
+            models.Index(fields=['series', 'instance_number', 'id'], name='dicominstance_series_num_idx'),
+        ]
 
     def __str__(self):
         return f"Instance {self.instance_number} - {self.series}"
 
     def get_storage_path(self):
-        """Retourne le chemin de stockage pour l'instance DICOM"""
-        return f"patients/{self.series.study.patient.id}/studies/{self.series.study.study_instance_uid}/series/{self.series.series_instance_uid}/{self.sop_instance_uid}.dcm"
+        """Retourne la clé de stockage (adressée par contenu) de l'instance DICOM"""
+        return content_key(self.content_hash)
+
+
+class DicomSeriesMetadata(models.Model):
+    """
+    DICOM JSON de toutes les instances d'une série, compressé (gzip) et
+    servi tel quel par WADO-RS .../series/{uid}/metadata (series_metadata.py).
+    """
+    series = models.OneToOneField(
+        DicomSeries,
+        verbose_name=_('Série'),
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='metadata_document'
+    )
+    document = models.BinaryField(_('Document DICOM JSON (gzip)'))
+    instance_count = models.IntegerField(_('Nombre d\'instances'))
+    updated_at = models.DateTimeField(_('Mis à jour le'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Métadonnées de série')
+        verbose_name_plural = _('Métadonnées de séries')
+
+    def __str__(self):
+        return f"Métadonnées - {self.series}"
+
+# Statuts des tâches qu'un worker peut réserver (RUNNING : bail expiré)
+INGEST_CLAIMABLE_STATUSES = ['PENDING', 'RETRY', 'RUNNING']
+
+
+class IngestJob(models.Model):
+    """Ingestion DICOM différée, traitée par la commande run_ingest_worker."""
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('En attente')
+        RUNNING = 'RUNNING', _('En cours')
+        RETRY = 'RETRY', _('Nouvel essai programmé')
+        SUCCEEDED = 'SUCCEEDED', _('Terminé')
+        FAILED = 'FAILED', _('Échec')
+
+    created_by = models.ForeignKey(
+        User,
+        verbose_name=_('Créé par'),
+        on_delete=models.CASCADE,
+        related_name='ingest_jobs'
+    )
+    patient = models.ForeignKey(
+        User,
+        verbose_name=_('Patient'),
+        on_delete=models.CASCADE,
+        related_name='patient_ingest_jobs'
+    )
+    status = models.CharField(
+        _('Statut'),
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    spool_directory = models.CharField(_('Répertoire de dépôt'), max_length=512)
+    files_total = models.IntegerField(_('Fichiers reçus'), default=0)
+    files_parsed = models.IntegerField(_('Fichiers analysés'), default=0)
+    files_stored = models.IntegerField(_('Fichiers stockés'), default=0)
+    files_forwarded = models.IntegerField(_('Fichiers transmis à Orthanc'), default=0)
+    files_failed = models.IntegerField(_('Fichiers en échec'), default=0)
+    report = models.JSONField(_('Rapport'), default=list, blank=True)
+    error = models.TextField(_('Erreur'), blank=True)
+    attempts = models.IntegerField(_('Tentatives'), default=0)
+    available_at = models.DateTimeField(_('Disponible à partir de'), auto_now_add=True)
+    locked_at = models.DateTimeField(_('Pris en charge le'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('Terminé le'), null=True, blank=True)
+    created_at = models.DateTimeField(_('Créé le'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Mis à jour le'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Tâche d\'ingestion DICOM')
+        verbose_name_plural = _('Tâches d\'ingestion DICOM')
+        ordering = ['-created_at']
+        indexes = [
+            # Réservation des tâches par les workers (jobs.claimable_jobs)
+            models.Index(
+                fields=['available_at'],
+                name='ingestjob_claim_idx',
+                condition=models.Q(status__in=INGEST_CLAIMABLE_STATUSES)
+            ),
+            models.Index(fields=['created_by', '-created_at', '-id'], name='ingestjob_creator_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ingestion {self.pk} - {self.get_status_display()}"
@@ -0,0 +1,157 @@
+"""Corps multipart/related de DICOMweb (PS3.18), produits et lus au fil de l'eau.
+
+À l'écriture, chaque partie est décrite par (type MIME, en-têtes, itérable
+de blocs d'octets) ; à la lecture (MultipartReader), chaque partie est
+rendue dès ses en-têtes reçus et son contenu lu par blocs. Dans les deux
+sens, le corps complet n'est jamais assemblé en mémoire.
+"""
+import uuid
+
+from django.utils.http import parse_header_parameters
+
+CRLF = b'\r\n'
+# Au-delà, les en-têtes d'une partie sont refusés
+MAX_HEADER_BYTES = 16 * 1024
+
+
+def new_boundary():
+    return uuid.uuid4().hex
+
+
+def content_type(boundary, part_type):
+    """En-tête Content-Type du corps, `part_type` étant le type de chacune des parties."""
+    return f'multipart/related; type="{part_type}"; boundary={boundary}'
+
+
+def part_header(boundary, part_type, headers=None):
+    lines = [f'--{boundary}', f'Content-Type: {part_type}']
+    lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+def iter_multipart(parts, boundary):
+    """Sérialise `parts`, itérable de (type MIME, en-têtes, blocs), en multipart/related."""
+    for part_type, headers, chunks in parts:
+        yield part_header(boundary, part_type, headers)
+        yield from chunks
+        yield CRLF
+    yield f'--{boundary}--'.encode() + CRLF
+
+
+def iter_file(source, chunk_size):
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class MultipartError(ValueError):
+    pass
+
+
+def parse_content_type(value):
+    """(type principal, paramètres) d'un en-tête Content-Type, paramètres en minuscules."""
+    media_type, params = parse_header_parameters(value or '')
+    return media_type.lower(), {name.lower(): param for name, param in params.items()}
+
+
+class Part:
+    """Partie en cours de lecture : `headers` (noms en minuscules) et `chunks`, à lire une seule fois."""
+
+    def __init__(self, headers, chunks):
+        self.headers = headers
+        self.chunks = chunks
+
+    @property
+    def content_type(self):
+        return parse_content_type(self.headers.get('content-type', 'text/plain'))[0]
+
+
+class MultipartReader:
+    """
+    Lecture incrémentale d'un corps multipart : `stream.read(n)` est appelé
+    par blocs de `chunk_size` et le tampon ne dépasse jamais un bloc plus la
+    longueur du délimiteur. Une partie non lue entièrement est sautée au
+    passage à la suivante.
+    """
+
+    def __init__(self, stream, boundary, chunk_size=64 * 1024):
+        if not boundary:
+            raise MultipartError("Paramètre boundary manquant")
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.delimiter = CRLF + b'--' + boundary.encode('latin-1')
+        # Le premier délimiteur n'est pas précédé d'un saut de ligne
+        self.buffer = CRLF
+
+    def fill(self):
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer += chunk
+        return True
+
+    def read_until(self, marker, limit=None):
+        """Données jusqu'à `marker` exclu ; `marker` est consommé."""
+        while True:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                data = self.buffer[:index]
+                self.buffer = self.buffer[index + len(marker):]
+                return data
+            if limit is not None and len(self.buffer) > limit:
+                raise MultipartError("En-têtes de partie trop longs")
+            if not self.fill():
+                raise MultipartError("Corps multipart tronqué")
+
+    def skip_until_delimiter(self):
+        """Ignore les données (préambule) jusqu'au premier délimiteur."""
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                self.buffer = self.buffer[index + len(self.delimiter):]
+                return
+            self.buffer = self.buffer[-keep:]
+            if not self.fill():
+                raise MultipartError("Délimiteur multipart introuvable")
+
+    def body(self):
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if index:
+                    yield self.buffer[:index]
+                self.buffer = self.buffer[index + len(self.delimiter):]
+                return
+            # On garde de quoi reconnaître un délimiteur à cheval sur deux blocs
+            if len(self.buffer) > keep:
+                yield self.buffer[:-keep]
+                self.buffer = self.buffer[-keep:]
+            if not self.fill():
+                raise MultipartError("Corps multipart tronqué")
+
+    def parts(self):
+        self.skip_until_delimiter()
+        while True:
+            while len(self.buffer) < 2:
+                if not self.fill():
+                    raise MultipartError("Corps multipart tronqué")
+            if self.buffer.startswith(b'--'):
+                return
+            # Fin de la ligne du délimiteur (espaces éventuels compris), puis en-têtes
+            self.read_until(CRLF, limit=MAX_HEADER_BYTES)
+            headers = {}
+            while True:
+                line = self.read_until(CRLF, limit=MAX_HEADER_BYTES)
+                if not line:
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            chunks = self.body()
+            yield Part(headers, chunks)
+            # Partie non lue (ou lue en partie) par l'appelant
+            for _ in chunks:
+                pass
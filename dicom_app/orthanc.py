@@ -0,0 +1,253 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pycrafted import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class OrthancCallStats:
+    """Statistiques de latence des appels Orthanc, agrégées par (méthode, ressource)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def record(self, method, resource, status_code, elapsed):
+        metrics.ORTHANC_DURATION.observe(elapsed, method=method, resource=resource, status=status_code)
+        metrics.record_external(elapsed)
+        key = (method, resource)
+        with self._lock:
+            entry = self._calls.setdefault(key, {
+                'count': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0
+            })
+            entry['count'] += 1
+            entry['total_seconds'] += elapsed
+            entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+            if status_code is None or status_code >= 500:
+                entry['errors'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                f'{method} /{resource}': dict(entry)
+                for (method, resource), entry in self._calls.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+
+class OrthancClient:
+    """Client HTTP Orthanc avec pool de connexions keep-alive, timeouts et retries.
+
+    Une instance est partagée par processus (voir get_orthanc_client) afin que
+    toutes les vues réutilisent les mêmes connexions TCP.
+    """
+
+    # Méthodes rejouées automatiquement ; POST n'en fait pas partie car le
+    # corps (fichier DICOM) peut être un flux déjà consommé.
+    RETRY_METHODS = frozenset({'GET', 'HEAD', 'DELETE'})
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, base_url=None, pool_size=None, connect_timeout=None,
+                 read_timeout=None, max_retries=None, auth=None):
+        self.base_url = (base_url or settings.ORTHANC_URL).rstrip('/')
+        self.pool_size = pool_size or settings.ORTHANC_POOL_SIZE
+        self.timeout = (
+            connect_timeout or settings.ORTHANC_CONNECT_TIMEOUT,
+            read_timeout or settings.ORTHANC_READ_TIMEOUT,
+        )
+        if max_retries is None:
+            max_retries = settings.ORTHANC_MAX_RETRIES
+        if auth is None and settings.ORTHANC_USERNAME:
+            auth = (settings.ORTHANC_USERNAME, settings.ORTHANC_PASSWORD)
+
+        self.stats = OrthancCallStats()
+        self.session = requests.Session()
+        self.session.auth = auth
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=0.2,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=self.RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, **kwargs):
+        """Exécute une requête vers Orthanc en mesurant sa latence."""
+        kwargs.setdefault('timeout', self.timeout)
+        resource = path.lstrip('/').split('/', 1)[0]
+        status_code = None
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            elapsed = time.monotonic() - start
+            self.stats.record(method, resource, status_code, elapsed)
+            logger.debug('Orthanc %s %s -> %s en %.1f ms', method, path, status_code, elapsed * 1000)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_orthanc_client():
+    """Retourne le client Orthanc partagé du processus courant.
+
+    Le client est recréé après un fork pour ne pas partager de sockets
+    entre processus workers.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = OrthancClient()
+                _client_pid = pid
+    return _client
+
+
+class AsyncOrthancClient:
+    """Équivalent non bloquant d'OrthancClient, basé sur httpx.AsyncClient.
+
+    Les connexions d'un httpx.AsyncClient sont liées à la boucle d'événements
+    qui les a ouvertes : utiliser get_async_orthanc_client() pour obtenir le
+    client de la boucle courante.
+    """
+
+    # Le pool httpcore parcourt toutes ses connexions à chaque requête : au-delà
+    # de quelques dizaines de connexions ce coût domine. Le pool est donc réparti
+    # sur plusieurs clients httpx de SHARD_SIZE connexions, utilisés à tour de rôle.
+    SHARD_SIZE = 4
+
+    def __init__(self, base_url=None, pool_size=None, connect_timeout=None,
+                 read_timeout=None, max_retries=None, auth=None, stats=None):
+        self.base_url = (base_url or settings.ORTHANC_URL).rstrip('/')
+        self.pool_size = pool_size or settings.ORTHANC_ASYNC_POOL_SIZE
+        if max_retries is None:
+            max_retries = settings.ORTHANC_MAX_RETRIES
+        if auth is None and settings.ORTHANC_USERNAME:
+            auth = (settings.ORTHANC_USERNAME, settings.ORTHANC_PASSWORD)
+        timeout = httpx.Timeout(
+            read_timeout or settings.ORTHANC_READ_TIMEOUT,
+            connect=connect_timeout or settings.ORTHANC_CONNECT_TIMEOUT,
+        )
+        shard_size = min(self.SHARD_SIZE, self.pool_size)
+
+        self.stats = stats or OrthancCallStats()
+        self.clients = [
+            httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=auth,
+                timeout=timeout,
+                # Seules les erreurs de connexion sont rejouées par le transport
+                transport=httpx.AsyncHTTPTransport(
+                    retries=max_retries,
+                    limits=httpx.Limits(
+                        max_connections=shard_size,
+                        max_keepalive_connections=shard_size,
+                    ),
+                ),
+            )
+            for _ in range(max(1, self.pool_size // shard_size))
+        ]
+        self._next_client = itertools.cycle(self.clients)
+
+    async def send(self, method, path, stream=False, **kwargs):
+        """Exécute une requête vers Orthanc en mesurant sa latence.
+
+        Avec stream=True, le corps n'est pas lu : l'appelant doit fermer la
+        réponse (aclose) après l'avoir consommée.
+        """
+        resource = path.lstrip('/').split('/', 1)[0]
+        status_code = None
+        start = time.monotonic()
+        try:
+            client = next(self._next_client)
+            request = client.build_request(method, '/' + path.lstrip('/'), **kwargs)
+            response = await client.send(request, stream=stream)
+            status_code = response.status_code
+            return response
+        finally:
+            elapsed = time.monotonic() - start
+            self.stats.record(method, resource, status_code, elapsed)
+            logger.debug('Orthanc %s %s -> %s en %.1f ms', method, path, status_code, elapsed * 1000)
+
+    async def get(self, path, **kwargs):
+        return await self.send('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.send('POST', path, **kwargs)
+
+    async def delete(self, path, **kwargs):
+        return await self.send('DELETE', path, **kwargs)
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_orthanc_client():
+    """Retourne le client Orthanc asynchrone partagé par la boucle d'événements courante."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncOrthancClient(stats=get_orthanc_client().stats)
+        _async_clients[loop] = client
+    return client
+
+
+def reset_orthanc_clients():
+    """Oublie les clients partagés (après un changement de ORTHANC_URL, par exemple)."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _client_pid = None
+    _async_clients.clear()
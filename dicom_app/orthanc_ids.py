@@ -0,0 +1,186 @@
+"""Correspondance entre les UID DICOM et les identifiants Orthanc.
+
+L'API REST d'Orthanc désigne études, séries et instances par ses propres
+identifiants (SHA-1 des UID et de l'identifiant patient). Ils sont
+enregistrés dans le champ `orthanc_id` des modèles dès l'envoi à Orthanc
+(réponse de POST /instances, cf. record_stored), de sorte que chaque
+opération sur Orthanc soit une requête directe.
+
+Pour les lignes antérieures ou envoyées sans réponse exploitable,
+resolve_objects interroge /tools/lookup en parallèle, garde le résultat
+dans un cache LRU partagé par le processus et complète la base
+(commande backfill_orthanc_ids pour tout compléter d'un coup).
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from .models import DicomInstance, DicomSeries, DicomStudy
+from .orthanc import get_orthanc_client
+
+logger = logging.getLogger(__name__)
+
+# Niveau REST d'Orthanc -> (modèle, Type dans /tools/lookup, champ UID)
+LEVELS = {
+    'studies': (DicomStudy, 'Study', 'study_instance_uid'),
+    'series': (DicomSeries, 'Series', 'series_instance_uid'),
+    'instances': (DicomInstance, 'Instance', 'sop_instance_uid'),
+}
+
+
+class OrthancLookupError(Exception):
+    pass
+
+
+class OrthancIdCache:
+    """LRU (niveau, UID DICOM) -> identifiants Orthanc, partagé entre threads."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            ids = self._entries.get(key)
+            if ids is not None:
+                self._entries.move_to_end(key)
+            return ids
+
+    def set(self, key, ids):
+        with self._lock:
+            self._entries[key] = ids
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_orthanc_id_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = OrthancIdCache(settings.ORTHANC_ID_CACHE_SIZE)
+    return _cache
+
+
+def reset_orthanc_id_cache():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def record_stored(payloads):
+    """
+    Enregistre les identifiants renvoyés par POST /instances, `payloads`
+    associant la clé de stockage du fichier envoyé à la réponse d'Orthanc
+    (ID, ParentSeries, ParentStudy). Trois requêtes au plus, quel que soit
+    le nombre de fichiers.
+    """
+    if not payloads:
+        return
+    instances, series, studies = {}, {}, {}
+    for pk, key, series_id, study_id in DicomInstance.objects.filter(file_path__in=payloads).values_list(
+        'pk', 'file_path', 'series_id', 'series__study_id'
+    ):
+        payload = payloads[key]
+        instances[pk] = DicomInstance(pk=pk, orthanc_id=payload['ID'])
+        series[series_id] = DicomSeries(pk=series_id, orthanc_id=payload['ParentSeries'])
+        studies[study_id] = DicomStudy(pk=study_id, orthanc_id=payload['ParentStudy'])
+    for model, objects in ((DicomInstance, instances), (DicomSeries, series), (DicomStudy, studies)):
+        if objects:
+            model.objects.bulk_update(objects.values(), ['orthanc_id'], batch_size=500)
+
+
+def lookup(level, uid):
+    """Identifiants Orthanc de `uid` par /tools/lookup (plusieurs si l'UID existe chez plusieurs patients)."""
+    cache = get_orthanc_id_cache()
+    ids = cache.get((level, uid))
+    if ids is not None:
+        return ids
+    try:
+        response = get_orthanc_client().post('/tools/lookup', data=uid)
+    except requests.exceptions.RequestException as e:
+        raise OrthancLookupError(f"Orthanc injoignable : {e}")
+    if response.status_code != 200:
+        raise OrthancLookupError(f"Recherche de {uid} dans Orthanc impossible ({response.status_code})")
+    resource_type = LEVELS[level][1]
+    ids = tuple(match['ID'] for match in response.json() if match.get('Type') == resource_type)
+    # Une ressource absente peut être envoyée plus tard : seules les correspondances sont gardées
+    if ids:
+        cache.set((level, uid), ids)
+    return ids
+
+
+def resolve_objects(level, objects):
+    """
+    Identifiants Orthanc des objets `objects` du niveau `level` : champ
+    `orthanc_id` s'il est renseigné, sinon /tools/lookup (en parallèle), les
+    correspondances uniques étant enregistrées en base. Retourne
+    ({clé primaire: identifiants}, {clé primaire: OrthancLookupError}) ;
+    un objet absent d'Orthanc a un tuple d'identifiants vide.
+    """
+    model, _, uid_field = LEVELS[level]
+    resolved = {obj.pk: (obj.orthanc_id,) for obj in objects if obj.orthanc_id}
+    missing = [obj for obj in objects if not obj.orthanc_id]
+    failures = {}
+    if not missing:
+        return resolved, failures
+
+    def resolve(obj):
+        try:
+            return obj, lookup(level, getattr(obj, uid_field))
+        except OrthancLookupError as e:
+            return obj, e
+
+    client = get_orthanc_client()
+    with ThreadPoolExecutor(max_workers=min(client.pool_size, len(missing))) as pool:
+        results = list(pool.map(resolve, missing))
+
+    mapped = []
+    for obj, ids in results:
+        if isinstance(ids, OrthancLookupError):
+            failures[obj.pk] = ids
+            continue
+        resolved[obj.pk] = ids
+        if len(ids) == 1:
+            obj.orthanc_id = ids[0]
+            mapped.append(obj)
+    if mapped:
+        model.objects.bulk_update(mapped, ['orthanc_id'], batch_size=500)
+    return resolved, failures
+
+
+def backfill(level, batch_size=200):
+    """Complète `orthanc_id` pour toutes les lignes du niveau ; retourne (résolues, absentes ou ambiguës, échecs)."""
+    model = LEVELS[level][0]
+    counts = [0, 0, 0]
+    last_pk = 0
+    while True:
+        batch = list(model.objects.filter(orthanc_id='', pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return tuple(counts)
+        last_pk = batch[-1].pk
+        resolved, failures = resolve_objects(level, batch)
+        for obj in batch:
+            if obj.pk in failures:
+                counts[2] += 1
+            elif obj.orthanc_id:
+                counts[0] += 1
+            else:
+                counts[1] += 1
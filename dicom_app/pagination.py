@@ -0,0 +1,8 @@
+from medical.pagination import KeysetPagination
+
+
+class InstanceCursorPagination(KeysetPagination):
+    """Pagination par curseur des instances d'une série, dans l'ordre de la pile d'images."""
+    ordering = ('instance_number', 'id')
+    page_size = 100
+    max_page_size = 1000
@@ -1,21 +1,22 @@
 from rest_framework import permissions
-from medical.models import PatientDoctor
+from medical.models import User
+from medical.permissions import PatientRelationPermission
+from medical.relations import is_doctor_of
+from .models import DicomSeries, DicomInstance
 
-class IsDicomStudyParticipant(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        # Le patient peut voir ses propres études
-        if request.user.role == 'PATIENT':
-            return obj.patient == request.user
-        
-        # Le médecin peut voir les études de ses patients
-        if request.user.role == 'DOCTOR':
-            return PatientDoctor.objects.filter(
-                patient=obj.patient,
-                doctor=request.user
-            ).exists()
-        
-        # Les secrétaires n'ont pas accès aux images DICOM
-        return False
+def get_study(obj):
+    """Retourne l'étude à laquelle appartient une étude, une série ou une instance."""
+    if isinstance(obj, DicomInstance):
+        return obj.series.study
+    if isinstance(obj, DicomSeries):
+        return obj.study
+    return obj
+
+class IsDicomStudyParticipant(PatientRelationPermission):
+    # Le patient voit ses propres études, le médecin celles de ses patients ;
+    # les secrétaires n'ont pas accès aux images DICOM
+    def get_patient_id(self, obj):
+        return get_study(obj).patient_id
 
 class CanUploadDicom(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -27,16 +28,30 @@ class CanDeleteDicom(permissions.BasePermission):
         # Seuls les médecins peuvent supprimer les images
         if request.user.role != 'DOCTOR':
             return False
+
+        study = get_study(obj)
             
         # Le médecin peut supprimer s'il est le créateur de l'étude
-        if hasattr(obj, 'doctor') and obj.doctor == request.user:
+        if study.doctor_id == request.user.id:
             return True
             
         # Le médecin peut supprimer s'il est lié au patient
-        if hasattr(obj, 'patient'):
-            return PatientDoctor.objects.filter(
-                patient=obj.patient,
-                doctor=request.user
-            ).exists()
-            
-        return False 
\ No newline at end of file
+        return is_doctor_of(request.user, study.patient_id)
+
+
+def upload_patient_error(user, patient_id):
+    """
+    Contrôle du patient auquel le médecin `user` rattache des images :
+    retourne (message, code HTTP) si l'envoi est refusé, None sinon.
+    """
+    if not patient_id:
+        return 'Patient ID is required', 400
+    try:
+        patient_id = int(patient_id)
+    except (TypeError, ValueError):
+        return 'Patient introuvable', 400
+    if not User.objects.filter(pk=patient_id, role=User.Role.PATIENT).exists():
+        return 'Patient introuvable', 400
+    if not is_doctor_of(user, patient_id):
+        return "Ce patient n'est pas suivi par ce médecin", 403
+    return None
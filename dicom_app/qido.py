@@ -0,0 +1,375 @@
+"""Moteur QIDO-RS (PS3.18 §10.6) répondant depuis l'index local.
+
+Les recherches d'études, de séries et d'instances sont traduites en requêtes
+sur DicomStudy, DicomSeries et DicomInstance et le résultat est rendu en
+DICOM JSON. Seuls les attributs indexés sont gérés ici ; pour les autres,
+`search` lève UnsupportedQuery et la vue relaie la requête à Orthanc.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime
+
+from django.db.models import Count, Exists, OuterRef, Q
+from pydicom.datadict import dictionary_VR, keyword_for_tag, tag_for_keyword
+
+from .models import DicomSeries, DicomInstance
+
+STUDY, SERIES, INSTANCE = 'studies', 'series', 'instances'
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Paramètres de requête qui ne sont pas des attributs DICOM
+RESERVED_PARAMETERS = {'limit', 'offset', 'includefield', 'fuzzymatching'}
+
+# Attributs de correspondance : mot-clé -> (champ du modèle, type de correspondance)
+STUDY_MATCHING = {
+    'StudyInstanceUID': ('study_instance_uid', 'uid'),
+    'StudyDate': ('study_date', 'date'),
+    'AccessionNumber': ('accession_number', 'string'),
+    'PatientName': ('patient_name', 'pn'),
+    'PatientID': ('dicom_patient_id', 'string'),
+    'StudyID': ('study_id', 'string'),
+    'StudyDescription': ('study_description', 'string'),
+    'ModalitiesInStudy': (None, 'modalities'),
+}
+SERIES_MATCHING = {
+    'SeriesInstanceUID': ('series_instance_uid', 'uid'),
+    'Modality': ('modality', 'string'),
+    'SeriesNumber': ('series_number', 'int'),
+    'SeriesDescription': ('series_description', 'string'),
+}
+INSTANCE_MATCHING = {
+    'SOPInstanceUID': ('sop_instance_uid', 'uid'),
+    'SOPClassUID': ('sop_class_uid', 'uid'),
+    'InstanceNumber': ('instance_number', 'int'),
+}
+
+# Attributs renvoyés par défaut à chaque niveau
+STUDY_ATTRIBUTES = [
+    'StudyDate', 'AccessionNumber', 'ModalitiesInStudy', 'PatientName', 'PatientID',
+    'StudyInstanceUID', 'StudyID', 'StudyDescription',
+    'NumberOfStudyRelatedSeries', 'NumberOfStudyRelatedInstances',
+]
+SERIES_ATTRIBUTES = [
+    'Modality', 'SeriesDescription', 'StudyInstanceUID', 'SeriesInstanceUID',
+    'SeriesNumber', 'NumberOfSeriesRelatedInstances',
+]
+INSTANCE_ATTRIBUTES = [
+    'SOPClassUID', 'SOPInstanceUID', 'StudyInstanceUID', 'SeriesInstanceUID', 'InstanceNumber',
+]
+# Attributs d'étude disponibles aux niveaux inférieurs (includefield)
+STUDY_LEVEL_EXTRA = ['StudyDate', 'AccessionNumber', 'PatientName', 'PatientID', 'StudyID', 'StudyDescription']
+
+
+class QueryError(ValueError):
+    """Requête QIDO-RS invalide (400)."""
+
+
+class UnsupportedQuery(Exception):
+    """La requête porte sur des attributs non indexés : elle doit être relayée à Orthanc."""
+
+
+def attribute_keyword(key):
+    """Mot-clé DICOM pour un paramètre donné par mot-clé ou balise hexadécimale, sinon None."""
+    if re.fullmatch(r'[0-9A-Fa-f]{8}', key):
+        return keyword_for_tag(int(key, 16)) or None
+    return key if tag_for_keyword(key) is not None else None
+
+
+def split_values(value):
+    return [v for v in re.split(r'[,\\]', value) if v]
+
+
+def wildcard_q(field, value, insensitive=False):
+    """Correspondance avec jokers DICOM `*` et `?`, traduite en LIKE lorsque c'est possible."""
+    prefix = 'i' if insensitive else ''
+    if value.strip('*') == '':
+        return Q()
+    if '?' not in value and '*' not in value.strip('*'):
+        core = value.strip('*')
+        if value.startswith('*') and value.endswith('*'):
+            lookup = 'contains'
+        elif value.endswith('*'):
+            lookup = 'startswith'
+        elif value.startswith('*'):
+            lookup = 'endswith'
+        else:
+            lookup = 'exact'
+        return Q(**{f'{field}__{prefix}{lookup}': core})
+    pattern = ''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in value)
+    return Q(**{f'{field}__{prefix}regex': f'^{pattern}$'})
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y%m%d').date()
+    except ValueError:
+        raise QueryError(f'Date invalide: {value}')
+
+
+def date_q(field, value):
+    """Correspondance simple ou par intervalle (AAAAMMJJ-AAAAMMJJ, bornes optionnelles)."""
+    if '-' not in value:
+        return Q(**{field: parse_date(value)})
+    start, end = value.split('-', 1)
+    q = Q()
+    if start:
+        q &= Q(**{f'{field}__gte': parse_date(start)})
+    if end:
+        q &= Q(**{f'{field}__lte': parse_date(end)})
+    return q
+
+
+def person_name_q(field, value, fuzzy):
+    """PN : insensible à la casse ; en fuzzymatching, chaque mot doit débuter un composant du nom."""
+    if not fuzzy:
+        return wildcard_q(field, value, insensitive=True)
+    q = Q()
+    for word in re.split(r'[\s^,]+', value.replace('*', '').replace('?', '')):
+        if word:
+            q &= (
+                Q(**{f'{field}__istartswith': word}) |
+                Q(**{f'{field}__icontains': f'^{word}'}) |
+                Q(**{f'{field}__icontains': f' {word}'})
+            )
+    return q
+
+
+def matching_q(field, kind, value, fuzzy):
+    if kind == 'uid':
+        return Q(**{f'{field}__in': split_values(value)})
+    if kind == 'date':
+        return date_q(field, value)
+    if kind == 'int':
+        try:
+            return Q(**{field: int(value)})
+        except ValueError:
+            raise QueryError(f'Valeur numérique invalide: {value}')
+    if kind == 'pn':
+        return person_name_q(field, value, fuzzy)
+    return wildcard_q(field, value)
+
+
+class Query:
+    """Paramètres QIDO-RS analysés : filtres, pagination et attributs à renvoyer."""
+
+    def __init__(self, params, level):
+        self.level = level
+        self.fuzzy = params.get('fuzzymatching', '').lower() == 'true'
+        try:
+            self.limit = min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+            self.offset = int(params.get('offset', 0))
+        except ValueError:
+            raise QueryError('limit et offset doivent être des entiers')
+        if self.limit < 0 or self.offset < 0:
+            raise QueryError('limit et offset doivent être positifs')
+
+        matching = self.matching_attributes()
+        self.filters = []
+        for key, values in params.lists():
+            if key in RESERVED_PARAMETERS:
+                continue
+            keyword = attribute_keyword(key)
+            if keyword is None:
+                if '.' in key:
+                    # Correspondance sur un attribut de séquence
+                    raise UnsupportedQuery(key)
+                raise QueryError(f'Attribut inconnu: {key}')
+            if keyword not in matching:
+                raise UnsupportedQuery(keyword)
+            for value in values:
+                if value:
+                    self.filters.append((keyword, value))
+
+        available = self.available_attributes()
+        self.attributes = list(self.default_attributes())
+        for value in params.getlist('includefield'):
+            for key in split_values(value):
+                if key == 'all':
+                    self.attributes += [a for a in available if a not in self.attributes]
+                    continue
+                keyword = attribute_keyword(key)
+                if keyword is None:
+                    raise QueryError(f'Attribut inconnu: {key}')
+                if keyword not in available:
+                    raise UnsupportedQuery(keyword)
+                if keyword not in self.attributes:
+                    self.attributes.append(keyword)
+
+    def matching_attributes(self):
+        if self.level == STUDY:
+            return STUDY_MATCHING
+        if self.level == SERIES:
+            return {**STUDY_MATCHING, **SERIES_MATCHING}
+        return {**STUDY_MATCHING, **SERIES_MATCHING, **INSTANCE_MATCHING}
+
+    def default_attributes(self):
+        return {STUDY: STUDY_ATTRIBUTES, SERIES: SERIES_ATTRIBUTES, INSTANCE: INSTANCE_ATTRIBUTES}[self.level]
+
+    def available_attributes(self):
+        if self.level == STUDY:
+            return STUDY_ATTRIBUTES
+        if self.level == SERIES:
+            return SERIES_ATTRIBUTES + STUDY_LEVEL_EXTRA
+        return INSTANCE_ATTRIBUTES + ['Modality', 'SeriesNumber', 'SeriesDescription'] + STUDY_LEVEL_EXTRA
+
+    def q(self, study_prefix='', series_prefix=''):
+        """Filtre ORM ; les préfixes désignent l'étude et la série depuis le modèle interrogé."""
+        q = Q()
+        for keyword, value in self.filters:
+            if keyword in STUDY_MATCHING:
+                field, kind = STUDY_MATCHING[keyword]
+                if kind == 'modalities':
+                    modalities = DicomSeries.objects.filter(
+                        study=OuterRef(f'{study_prefix}pk'),
+                        modality__in=split_values(value),
+                    )
+                    q &= Q(Exists(modalities))
+                    continue
+                q &= matching_q(study_prefix + field, kind, value, self.fuzzy)
+            elif keyword in SERIES_MATCHING:
+                field, kind = SERIES_MATCHING[keyword]
+                q &= matching_q(series_prefix + field, kind, value, self.fuzzy)
+            else:
+                field, kind = INSTANCE_MATCHING[keyword]
+                q &= matching_q(field, kind, value, self.fuzzy)
+        return q
+
+
+def element(keyword, value):
+    """Élément DICOM JSON ; une valeur vide ou None donne un élément sans Value."""
+    tag = tag_for_keyword(keyword)
+    vr = dictionary_VR(tag)
+    item = {'vr': vr}
+    values = value if isinstance(value, (list, tuple)) else [value]
+    values = [v for v in values if v not in (None, '')]
+    if values:
+        if vr == 'PN':
+            values = [{'Alphabetic': str(v)} for v in values]
+        elif vr == 'DA':
+            values = [v.strftime('%Y%m%d') if hasattr(v, 'strftime') else str(v) for v in values]
+        elif vr in ('IS', 'US', 'UL', 'SS', 'SL'):
+            values = [int(v) for v in values]
+        else:
+            values = [str(v) for v in values]
+        item['Value'] = values
+    return f'{tag:08X}', item
+
+
+def to_dicom_json(values, attributes):
+    return dict(sorted(element(keyword, values.get(keyword)) for keyword in attributes))
+
+
+def study_values(study):
+    return {
+        'StudyDate': study.study_date,
+        'AccessionNumber': study.accession_number,
+        'PatientName': study.patient_name,
+        'PatientID': study.dicom_patient_id,
+        'StudyInstanceUID': study.study_instance_uid,
+        'StudyID': study.study_id,
+        'StudyDescription': study.study_description,
+    }
+
+
+def series_values(series):
+    return {
+        'Modality': series.modality,
+        'SeriesDescription': series.series_description,
+        'SeriesInstanceUID': series.series_instance_uid,
+        'SeriesNumber': series.series_number,
+    }
+
+
+def search_studies(query, studies):
+    page = list(
+        studies.filter(query.q())
+        .order_by('-study_date', 'id')[query.offset:query.offset + query.limit]
+    )
+    # Compteurs et modalités des études de la page : une seule requête groupée
+    modalities = defaultdict(list)
+    series_counts = defaultdict(int)
+    instance_counts = defaultdict(int)
+    rows = (
+        DicomSeries.objects.filter(study__in=[s.pk for s in page])
+        .values('study_id', 'modality')
+        .annotate(series=Count('id', distinct=True), instances=Count('instances'))
+        .order_by()
+    )
+    for row in rows:
+        modalities[row['study_id']].append(row['modality'])
+        series_counts[row['study_id']] += row['series']
+        instance_counts[row['study_id']] += row['instances']
+
+    results = []
+    for study in page:
+        values = study_values(study)
+        values.update(
+            ModalitiesInStudy=sorted(set(modalities[study.pk])),
+            NumberOfStudyRelatedSeries=series_counts[study.pk],
+            NumberOfStudyRelatedInstances=instance_counts[study.pk],
+        )
+        results.append(to_dicom_json(values, query.attributes))
+    return results
+
+
+def search_series(query, studies, study_uid=None):
+    series_qs = DicomSeries.objects.filter(study__in=studies)
+    if study_uid:
+        series_qs = series_qs.filter(study__study_instance_uid=study_uid)
+    page = list(
+        series_qs.filter(query.q(study_prefix='study__'))
+        .select_related('study')
+        .order_by('study_id', 'series_number', 'id')[query.offset:query.offset + query.limit]
+    )
+    counts = dict(
+        DicomInstance.objects.filter(series__in=[s.pk for s in page])
+        .values('series_id').annotate(count=Count('id')).values_list('series_id', 'count')
+        .order_by()
+    )
+    results = []
+    for series in page:
+        values = study_values(series.study)
+        values.update(series_values(series))
+        values['NumberOfSeriesRelatedInstances'] = counts.get(series.pk, 0)
+        results.append(to_dicom_json(values, query.attributes))
+    return results
+
+
+def search_instances(query, studies, study_uid=None, series_uid=None):
+    instances = DicomInstance.objects.filter(series__study__in=studies)
+    if study_uid:
+        instances = instances.filter(series__study__study_instance_uid=study_uid)
+    if series_uid:
+        instances = instances.filter(series__series_instance_uid=series_uid)
+    page = (
+        instances.filter(query.q(study_prefix='series__study__', series_prefix='series__'))
+        .select_related('series__study')
+        .order_by('series_id', 'instance_number', 'id')[query.offset:query.offset + query.limit]
+    )
+    results = []
+    for instance in page:
+        values = study_values(instance.series.study)
+        values.update(series_values(instance.series))
+        values.update(
+            SOPClassUID=instance.sop_class_uid,
+            SOPInstanceUID=instance.sop_instance_uid,
+            InstanceNumber=instance.instance_number,
+        )
+        results.append(to_dicom_json(values, query.attributes))
+    return results
+
+
+def search(level, params, studies, study_uid=None, series_uid=None):
+    """Recherche QIDO-RS parmi `studies` (études accessibles à l'utilisateur).
+
+    Lève QueryError pour une requête invalide et UnsupportedQuery si elle
+    porte sur un attribut absent de l'index.
+    """
+    query = Query(params, level)
+    if level == STUDY:
+        return search_studies(query, studies)
+    if level == SERIES:
+        return search_series(query, studies, study_uid)
+    return search_instances(query, studies, study_uid, series_uid)
@@ -0,0 +1,331 @@
+"""Rendu des instances DICOM en JPEG ou PNG (endpoints rendered et thumbnail).
+
+Les pixels sont décodés par pydicom et NumPy : LUT de modalité
+(RescaleSlope/Intercept), fenêtrage (centre et largeur demandés, sinon ceux
+de l'en-tête, sinon min/max de l'image), inversion MONOCHROME1, puis
+redimensionnement et encodage par Pillow.
+
+Les images sont conservées dans un cache disque (RenderCache), indexé par
+la clé de stockage de l'instance et les paramètres de rendu. Le stockage
+étant adressé par contenu, une entrée n'est jamais périmée ; le cache est
+borné en taille et les entrées les moins récemment lues sont évincées.
+Les vignettes peuvent être calculées dès l'ingestion (prewarm_thumbnails).
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pydicom
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from pycrafted import metrics
+from .storage import get_dicom_storage
+
+logger = logging.getLogger(__name__)
+
+# Type MIME -> (format Pillow, extension du fichier en cache)
+FORMATS = {
+    'image/jpeg': ('JPEG', 'jpg'),
+    'image/png': ('PNG', 'png'),
+}
+DEFAULT_CONTENT_TYPE = 'image/jpeg'
+DEFAULT_QUALITY = 90
+# Après éviction, le cache redescend à cette fraction de sa taille maximale
+EVICTION_TARGET = 0.9
+
+
+class RenderingError(Exception):
+    """Pas de pixels, ou pixels dans un format que pydicom ne sait pas décoder."""
+
+
+class FrameNotFound(RenderingError):
+    pass
+
+
+def import_imaging():
+    try:
+        import numpy
+        from PIL import Image
+    except ImportError:
+        raise ImproperlyConfigured("Le rendu des images nécessite les paquets 'numpy' et 'Pillow'")
+    return numpy, Image
+
+
+def parse_int(query, name, default=None, minimum=1, maximum=None):
+    value = query.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"Paramètre {name} invalide")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"Paramètre {name} hors limites ({minimum}-{maximum})")
+    return value
+
+
+def parse_render_params(query):
+    """
+    Paramètres de rendu, avec les noms de WADO-URI : frameNumber,
+    windowCenter et windowWidth, rows et columns (taille maximale),
+    contentType (image/jpeg ou image/png) et imageQuality. Lève ValueError.
+    """
+    max_size = settings.DICOM_RENDER_MAX_SIZE
+    content_type = query.get('contentType') or DEFAULT_CONTENT_TYPE
+    if content_type not in FORMATS:
+        raise ValueError(f"contentType non pris en charge : {content_type}")
+    center, width = query.get('windowCenter'), query.get('windowWidth')
+    if (center is None) != (width is None):
+        raise ValueError("windowCenter et windowWidth vont ensemble")
+    window = None
+    if center is not None:
+        try:
+            window = (float(center), float(width))
+        except ValueError:
+            raise ValueError("Fenêtre invalide")
+        if window[1] <= 0:
+            raise ValueError("windowWidth doit être positif")
+    rows = parse_int(query, 'rows', maximum=max_size)
+    columns = parse_int(query, 'columns', maximum=max_size)
+    return render_params(
+        frame=parse_int(query, 'frameNumber', default=1),
+        window=window,
+        viewport=(rows, columns) if rows or columns else None,
+        content_type=content_type,
+        quality=parse_int(query, 'imageQuality', default=DEFAULT_QUALITY, maximum=100),
+    )
+
+
+def render_params(frame=1, window=None, viewport=None, content_type=DEFAULT_CONTENT_TYPE, quality=DEFAULT_QUALITY):
+    """Paramètres complets d'un rendu, tels qu'attendus par render() et render_key()."""
+    return {'frame': frame, 'window': window, 'viewport': viewport, 'content_type': content_type,
+            'quality': quality}
+
+
+def thumbnail_params(size=None):
+    size = size or settings.DICOM_THUMBNAIL_SIZE
+    return render_params(viewport=(size, size))
+
+
+def load_dataset(storage_key):
+    with get_dicom_storage().open(storage_key) as f:
+        # Les flux S3 ne permettent pas de se déplacer dans le fichier
+        source = f if f.seekable() else BytesIO(f.read())
+        return pydicom.dcmread(source)
+
+
+def first_value(value):
+    return float(value[0] if isinstance(value, pydicom.multival.MultiValue) else value)
+
+
+def to_8bit(numpy, ds, pixels, window):
+    """Pixels en niveaux de gris 8 bits, après LUT de modalité et fenêtrage."""
+    slope = float(ds.get('RescaleSlope', 1) or 1)
+    intercept = float(ds.get('RescaleIntercept', 0) or 0)
+    pixels = pixels.astype(numpy.float64) * slope + intercept
+    if window is None and 'WindowCenter' in ds and 'WindowWidth' in ds:
+        window = (first_value(ds.WindowCenter), first_value(ds.WindowWidth))
+    if window is not None:
+        low, high = window[0] - window[1] / 2, window[0] + window[1] / 2
+    else:
+        low, high = float(pixels.min()), float(pixels.max())
+    scaled = numpy.clip((pixels - low) / max(high - low, 1e-6), 0, 1) * 255
+    if ds.get('PhotometricInterpretation') == 'MONOCHROME1':
+        scaled = 255 - scaled
+    return scaled.astype(numpy.uint8)
+
+
+def render(ds, frame=1, window=None, viewport=None, content_type=DEFAULT_CONTENT_TYPE, quality=DEFAULT_QUALITY):
+    """Encode la frame `frame` (à partir de 1) de `ds` ; retourne les octets de l'image."""
+    numpy, Image = import_imaging()
+    frames = int(ds.get('NumberOfFrames', 1) or 1)
+    if not 1 <= frame <= frames:
+        raise FrameNotFound(f"Frame {frame} inexistante ({frames} frame(s))")
+    if 'PixelData' not in ds:
+        raise RenderingError("Instance sans données de pixels")
+    try:
+        pixels = ds.pixel_array
+    except Exception as e:
+        raise RenderingError(f"Pixels non décodables ({ds.file_meta.get('TransferSyntaxUID', '?')}) : {e}")
+    if frames > 1:
+        pixels = pixels[frame - 1]
+
+    if int(ds.get('SamplesPerPixel', 1)) == 1:
+        image = Image.fromarray(to_8bit(numpy, ds, pixels, window), mode='L')
+    else:
+        # Couleur : pas de fenêtrage, simple ramené à 8 bits
+        if pixels.dtype != numpy.uint8:
+            pixels = (pixels.astype(numpy.float64) / max(float(pixels.max()), 1) * 255).astype(numpy.uint8)
+        image = Image.fromarray(pixels, mode='RGB')
+
+    if viewport:
+        rows, columns = viewport
+        scales = [limit / current for limit, current in ((rows, image.height), (columns, image.width)) if limit]
+        scale = min(scales)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    pil_format = FORMATS[content_type][0]
+    if pil_format == 'JPEG':
+        image.save(output, pil_format, quality=quality)
+    else:
+        image.save(output, pil_format, optimize=True)
+    return output.getvalue()
+
+
+class RenderCache:
+    """
+    Cache disque des images rendues, borné à `max_bytes`.
+
+    La date de modification d'un fichier sert de date de dernier accès (elle
+    est mise à jour à chaque lecture, atime n'étant pas fiable). La taille
+    occupée est suivie en mémoire et recalculée par un parcours du
+    répertoire à chaque éviction : plusieurs processus peuvent partager le
+    même répertoire.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path(self, key, extension):
+        return os.path.join(self.root, key[:2], f'{key}.{extension}')
+
+    def get(self, key, extension):
+        path = self.path(key, extension)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, extension, data):
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+        with self._lock:
+            self._size = self.disk_usage() if self._size is None else self._size + len(data)
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        """(date de dernier accès, taille, chemin) de chaque image en cache."""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Supprime les images les moins récemment lues jusqu'à repasser sous la limite."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICTION_TARGET
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        self._size = total
+        logger.debug("Cache de rendu : %d image(s) évincée(s), %d octets restants", evicted, total)
+
+    def stats(self):
+        entries = self.entries()
+        return {'entries': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Cache de rendu partagé par le processus, construit depuis les settings."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RenderCache(settings.DICOM_RENDER_CACHE_DIR, settings.DICOM_RENDER_CACHE_MAX_BYTES)
+    return _cache
+
+
+def reset_render_cache():
+    """Oublie le cache partagé (changement de settings, tests)."""
+    global _cache
+    _cache = None
+
+
+def render_key(storage_key, params):
+    """Clé de cache du rendu, connue sans décoder l'image (sert aussi d'ETag)."""
+    return hashlib.sha256(repr((storage_key, sorted(params.items()))).encode()).hexdigest()
+
+
+def rendered_image(storage_key, params):
+    """Image rendue de l'instance stockée sous `storage_key`, lue en cache ou calculée."""
+    key = render_key(storage_key, params)
+    extension = FORMATS[params['content_type']][1]
+    cache = get_render_cache()
+    data = cache.get(key, extension)
+    if data is None:
+        with metrics.timer(metrics.DICOM_RENDER_DURATION):
+            data = render(load_dataset(storage_key), **params)
+        cache.set(key, extension, data)
+    return data
+
+
+_prewarm_executor = None
+
+
+def prewarm_thumbnails(storage_keys):
+    """Calcule en tâche de fond les vignettes des instances tout juste stockées."""
+    global _prewarm_executor
+    if not settings.DICOM_THUMBNAIL_PREWARM or not storage_keys:
+        return
+    with _cache_lock:
+        if _prewarm_executor is None:
+            _prewarm_executor = ThreadPoolExecutor(
+                max_workers=settings.DICOM_RENDER_PREWARM_WORKERS, thread_name_prefix='thumbnail-prewarm'
+            )
+    for key in storage_keys:
+        _prewarm_executor.submit(prewarm_thumbnail, key)
+
+
+def prewarm_thumbnail(storage_key):
+    try:
+        rendered_image(storage_key, thumbnail_params())
+    except Exception as e:
+        logger.info("Vignette non pré-calculée pour %s : %s", storage_key, e)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import DicomStudy, DicomSeries, DicomInstance
+from .models import DicomStudy, DicomSeries, DicomInstance, IngestJob
 from medical.serializers import UserSerializer
 
 class DicomInstanceSerializer(serializers.ModelSerializer):
@@ -11,24 +11,46 @@ class DicomInstanceSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class DicomSeriesSerializer(serializers.ModelSerializer):
-    instances = DicomInstanceSerializer(many=True, read_only=True)
-    instance_count = serializers.IntegerField(source='instances.count', read_only=True)
+class DicomInstanceSummarySerializer(serializers.ModelSerializer):
+    """Représentation réduite d'une instance (?view=summary)."""
+    class Meta:
+        model = DicomInstance
+        fields = ['id', 'sop_instance_uid', 'instance_number']
+
+class DicomSeriesSummarySerializer(serializers.ModelSerializer):
+    """Série sans ses instances (?view=summary, ou ?view=series sur les études)."""
+    instance_count = serializers.SerializerMethodField()
 
     class Meta:
         model = DicomSeries
+        fields = [
+            'id', 'series_instance_uid', 'series_number', 'series_description',
+            'modality', 'number_of_instances', 'is_active', 'instance_count',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = ['created_at', 'updated_at']
+
+    def get_instance_count(self, obj):
+        # Annoté par DicomSeriesQuerySet.with_instance_count() ; sinon une requête COUNT
+        count = getattr(obj, 'instance_count', None)
+        return obj.instances.count() if count is None else count
+
+class DicomSeriesSerializer(DicomSeriesSummarySerializer):
+    """Série avec ses instances (?view=full)."""
+    instances = DicomInstanceSerializer(many=True, read_only=True)
+
+    class Meta(DicomSeriesSummarySerializer.Meta):
         fields = [
             'id', 'series_instance_uid', 'series_number', 'series_description',
             'modality', 'number_of_instances', 'is_active', 'instances',
             'instance_count', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
 
 class DicomStudySerializer(serializers.ModelSerializer):
     patient_details = UserSerializer(source='patient', read_only=True)
     doctor_details = UserSerializer(source='doctor', read_only=True)
     series = DicomSeriesSerializer(many=True, read_only=True)
-    series_count = serializers.IntegerField(source='series.count', read_only=True)
+    series_count = serializers.SerializerMethodField()
 
     class Meta:
         model = DicomStudy
@@ -38,4 +60,38 @@ class DicomStudySerializer(serializers.ModelSerializer):
             'accession_number', 'is_active', 'series', 'series_count',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at'] 
\ No newline at end of file
+        read_only_fields = ['created_at', 'updated_at']
+
+    def get_series_count(self, obj):
+        # Annoté par DicomStudyQuerySet.with_series_count() ; sinon une requête COUNT
+        count = getattr(obj, 'series_count', None)
+        return obj.series.count() if count is None else count
+
+class DicomStudySummarySerializer(serializers.ModelSerializer):
+    """Colonnes de l'étude et compteurs annotés, sans participants ni séries (?view=summary)."""
+    series_count = serializers.IntegerField(read_only=True)
+    instance_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = DicomStudy
+        fields = [
+            'id', 'patient', 'doctor', 'study_instance_uid', 'study_date',
+            'study_description', 'study_id', 'accession_number', 'is_active',
+            'series_count', 'instance_count', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+class DicomStudySeriesSerializer(DicomStudySerializer):
+    """Étude avec ses séries mais sans les instances (?view=series)."""
+    series = DicomSeriesSummarySerializer(many=True, read_only=True)
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    """Suivi d'une ingestion différée : statut, compteurs et rapport par fichier."""
+    class Meta:
+        model = IngestJob
+        fields = [
+            'id', 'patient', 'status', 'files_total', 'files_parsed', 'files_stored',
+            'files_forwarded', 'files_failed', 'attempts', 'error', 'report',
+            'available_at', 'finished_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
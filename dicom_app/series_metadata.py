@@ -0,0 +1,113 @@
+"""Document de métadonnées par série, servi par WADO-RS .../series/{uid}/metadata.
+
+Le DICOM JSON de chaque instance (sans pixels, cf. wado_rs.dataset_json)
+est calculé une seule fois, à l'ingestion, et ajouté au document compressé
+de sa série (DicomSeriesMetadata) : ouvrir une série revient à lire un seul
+blob au lieu de relire chaque fichier.
+
+Le document est supprimé avec les instances de sa série (deletion.delete_rows).
+Il est reconstruit depuis les fichiers à la demande s'il est absent ou si
+son nombre d'instances ne correspond plus à la série, ce qui couvre les
+autres chemins (bulk_create, suppressions en cascade) sans signal
+post_delete, qui empêcherait Django de supprimer les instances en masse.
+"""
+import gzip
+import json
+import logging
+
+import pydicom
+from django.db import transaction
+
+from . import wado_rs
+from .models import DicomSeriesMetadata, DicomStudy
+
+logger = logging.getLogger(__name__)
+
+# Compromis taille/temps : le document est compressé à chaque ajout d'instances
+COMPRESSION_LEVEL = 6
+
+
+def compress(entries):
+    payload = json.dumps(entries, separators=(',', ':')).encode()
+    return gzip.compress(payload, compresslevel=COMPRESSION_LEVEL)
+
+
+def decompress(document):
+    return json.loads(gzip.decompress(bytes(document)))
+
+
+def sort_key(entry):
+    number = entry.get('00200013', {}).get('Value', [0])[0]
+    return number if isinstance(number, int) else 0, entry.get('00080018', {}).get('Value', [''])[0]
+
+
+def file_entry(path, study_uid, series_uid, sop_uid):
+    """DICOM JSON d'un fichier en cours d'ingestion ; None s'il ne peut être produit."""
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True)
+        return wado_rs.dataset_json(ds, wado_rs.instance_uri(study_uid, series_uid, sop_uid))
+    except Exception as e:
+        logger.warning("Métadonnées JSON de %s non calculées : %s", sop_uid, e)
+        return None
+
+
+def save(series, entries):
+    entries = sorted(entries, key=sort_key)
+    document = compress(entries)
+    DicomSeriesMetadata.objects.update_or_create(
+        series=series, defaults={'document': document, 'instance_count': len(entries)}
+    )
+    return document
+
+
+def add_instances(series, entries):
+    """
+    Ajoute au document de la série le DICOM JSON d'instances tout juste
+    créées. Une entrée manquante (None) ou un document qui ne couvrirait pas
+    toute la série laisse la reconstruction à la prochaine lecture.
+    """
+    if not entries:
+        return
+    with transaction.atomic():
+        current = DicomSeriesMetadata.objects.select_for_update().filter(series=series).first()
+        count = series.instances.count()
+        if any(entry is None for entry in entries):
+            invalidate(series.pk)
+            return
+        if current is None:
+            merged = entries
+        else:
+            added = {sort_key(entry)[1] for entry in entries}
+            merged = [entry for entry in decompress(current.document) if sort_key(entry)[1] not in added] + entries
+        if len(merged) == count:
+            save(series, merged)
+        elif current is not None:
+            current.delete()
+
+
+def invalidate(series_id):
+    DicomSeriesMetadata.objects.filter(series_id=series_id).delete()
+
+
+def rebuild(series):
+    """Relit les fichiers de la série (stockage ou Orthanc) et enregistre le document."""
+    refs = wado_rs.select_instances(
+        DicomStudy.objects.filter(pk=series.study_id), series.study.study_instance_uid, series.series_instance_uid
+    )
+    entries = []
+    for ref in refs:
+        try:
+            entries.append(wado_rs.instance_metadata(ref))
+        except wado_rs.InstanceUnavailable as e:
+            logger.warning("Métadonnées de l'instance %s omises : %s", ref.sop_uid, e)
+    # Une instance omise rend le nombre d'instances incohérent : nouvel essai à la prochaine lecture
+    logger.info("Métadonnées de la série %s reconstruites (%d instances)", series.pk, len(entries))
+    return save(series, entries)
+
+
+def series_document(series):
+    """Document compressé (gzip) de la série, reconstruit s'il est absent ou périmé."""
+    current = DicomSeriesMetadata.objects.filter(series=series).values_list('document', 'instance_count').first()
+    if current is not None and current[1] == series.instances.count():
+        return bytes(current[0])
+    return rebuild(series)
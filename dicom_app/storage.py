@@ -0,0 +1,151 @@
+"""Stockage des fichiers DICOM, adressé par contenu.
+
+Chaque fichier est rangé sous la clé dérivée de son SHA-256
+(`sha256/ab/cd/abcd….dcm`) : un même fichier reçu deux fois n'est écrit
+qu'une fois. `DicomInstance.file_path` contient cette clé ; les anciens
+enregistrements contenant un chemin absolu restent lisibles en local.
+
+Backends : système de fichiers local (par défaut) ou stockage compatible S3
+(MinIO), choisis par DICOM_STORAGE_BACKEND.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 hexadécimal du fichier `path`."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def content_key(content_hash):
+    return f'sha256/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.dcm'
+
+
+class LocalDicomStorage:
+    """Objets stockés sous `root` sur le système de fichiers local."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        # Une clé absolue (anciens enregistrements) est retournée telle quelle
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, key, source_path):
+        """Déplace `source_path` sous `key` ; s'il y est déjà, la source est simplement supprimée."""
+        path = self.path(key)
+        if os.path.exists(path):
+            os.unlink(source_path)
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Renommage si la source est sur le même système de fichiers (cas de .incoming/)
+        shutil.move(source_path, path)
+        return key
+
+    @contextmanager
+    def open(self, key):
+        with open(self.path(key), 'rb') as f:
+            yield f
+
+    def delete(self, key):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+class S3DicomStorage:
+    """Objets stockés dans un bucket S3 (MinIO ou compatible)."""
+
+    def __init__(self, endpoint, access_key, secret_key, bucket, secure=True):
+        try:
+            from minio import Minio
+        except ImportError:
+            raise ImproperlyConfigured("Le backend S3 nécessite le paquet 'minio'")
+        self.client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
+        self.bucket = bucket
+        if not self.client.bucket_exists(bucket):
+            self.client.make_bucket(bucket)
+
+    def exists(self, key):
+        from minio.error import S3Error
+        try:
+            self.client.stat_object(self.bucket, key)
+            return True
+        except S3Error as e:
+            if e.code in ('NoSuchKey', 'NoSuchObject'):
+                return False
+            raise
+
+    def save(self, key, source_path):
+        try:
+            if not self.exists(key):
+                self.client.fput_object(self.bucket, key, source_path, content_type='application/dicom')
+        finally:
+            os.unlink(source_path)
+        return key
+
+    @contextmanager
+    def open(self, key):
+        from minio.error import S3Error
+        try:
+            response = self.client.get_object(self.bucket, key)
+        except S3Error as e:
+            # Même exception que le stockage local pour un objet absent
+            if e.code in ('NoSuchKey', 'NoSuchObject'):
+                raise FileNotFoundError(key)
+            raise
+        try:
+            yield response
+        finally:
+            response.close()
+            response.release_conn()
+
+    def delete(self, key):
+        self.client.remove_object(self.bucket, key)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_dicom_storage():
+    """Backend de stockage partagé par le processus, construit depuis les settings."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                backend = settings.DICOM_STORAGE_BACKEND
+                if backend == 'local':
+                    _storage = LocalDicomStorage(settings.DICOM_STORAGE_ROOT)
+                elif backend == 's3':
+                    _storage = S3DicomStorage(
+                        settings.DICOM_S3_ENDPOINT,
+                        settings.DICOM_S3_ACCESS_KEY,
+                        settings.DICOM_S3_SECRET_KEY,
+                        settings.DICOM_S3_BUCKET,
+                        secure=settings.DICOM_S3_SECURE,
+                    )
+                else:
+                    raise ImproperlyConfigured(f"DICOM_STORAGE_BACKEND inconnu: {backend}")
+    return _storage
+
+
+def reset_dicom_storage():
+    """Oublie le backend partagé (changement de settings, tests)."""
+    global _storage
+    _storage = None
@@ -0,0 +1,117 @@
+"""STOW-RS : instances reçues en multipart/related, ingérées au fil de la réception.
+
+Chaque partie application/dicom est écrite sous DICOM_STORAGE_ROOT/.incoming
+(même système de fichiers que le stockage local : la ranger sous sa clé est
+un renommage), puis confiée à ingest_files par lots de BATCH_FILES. Mémoire
+constante et disque borné à un lot, quel que soit le volume envoyé.
+"""
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+from .ingest import DUPLICATE, FAILED, STORED, ingest_files
+from .multipart import MultipartError, MultipartReader
+
+logger = logging.getLogger(__name__)
+
+DICOM_MEDIA_TYPE = 'application/dicom'
+BATCH_FILES = 32
+
+# FailureReason (PS3.4 C.4.2.1.4, PS3.18 table 10.5.3-3)
+PROCESSING_FAILURE = 0x0110
+CANNOT_UNDERSTAND = 0xC000
+
+
+def receive(stream, boundary, patient_id, doctor, study_uid=None, forward=True):
+    """
+    Lit le corps multipart de `stream` et ingère les instances par lots.
+    Retourne un rapport par partie (format de ingest_files). Un corps
+    tronqué n'annule pas les parties complètes déjà reçues.
+    """
+    incoming = os.path.join(settings.DICOM_STORAGE_ROOT, '.incoming')
+    os.makedirs(incoming, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix='stow-', dir=incoming)
+    # Un rapport par partie, dans l'ordre du corps ; None jusqu'à l'ingestion de son lot
+    results = []
+    batch = []
+    positions = []
+
+    def flush():
+        reports = ingest_files(batch, patient_id, doctor, forward=forward, expected_study_uid=study_uid)
+        for position, report in zip(positions, reports):
+            results[position] = report
+        # Fichiers non rangés dans le stockage (doublons, échecs)
+        for _, path in batch:
+            if os.path.exists(path):
+                os.unlink(path)
+        batch.clear()
+        positions.clear()
+
+    try:
+        try:
+            for index, part in enumerate(MultipartReader(stream, boundary).parts()):
+                name = f'part-{index + 1}'
+                if part.content_type != DICOM_MEDIA_TYPE:
+                    results.append({
+                        'file': name, 'status': FAILED,
+                        'error': f"Type de partie non pris en charge : {part.content_type}",
+                    })
+                    continue
+                path = os.path.join(directory, str(index))
+                with open(path, 'wb') as f:
+                    for chunk in part.chunks:
+                        f.write(chunk)
+                positions.append(len(results))
+                results.append(None)
+                batch.append((name, path))
+                if len(batch) >= BATCH_FILES:
+                    flush()
+        except MultipartError as e:
+            if not results:
+                raise
+            # La partie en échec suit les len(results) parties déjà lues
+            logger.warning("Corps STOW-RS interrompu après %d partie(s) : %s", len(results), e)
+            results.append({'file': f'part-{len(results) + 1}', 'status': FAILED, 'error': str(e)})
+        if batch:
+            flush()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def element(vr, value):
+    return {'vr': vr, 'Value': [value]}
+
+
+def response_dataset(results, instance_url, study_url=None):
+    """
+    Réponse STOW-RS en DICOM JSON : ReferencedSOPSequence (instances
+    stockées, ou déjà présentes pour ce patient) et FailedSOPSequence. `instance_url(report)`
+    donne le RetrieveURL de chaque instance stockée.
+    """
+    referenced, failed = [], []
+    for report in results:
+        if report['status'] in (STORED, DUPLICATE):
+            referenced.append({
+                '00081150': element('UI', report['sop_class_uid']),
+                '00081155': element('UI', report['sop_instance_uid']),
+                '00081190': element('UR', instance_url(report)),
+            })
+            continue
+        item = {'00081197': element('US', PROCESSING_FAILURE if 'sop_instance_uid' in report else CANNOT_UNDERSTAND)}
+        if 'sop_instance_uid' in report:
+            item['00081150'] = element('UI', report['sop_class_uid'])
+            item['00081155'] = element('UI', report['sop_instance_uid'])
+        failed.append(item)
+
+    dataset = {}
+    if study_url:
+        dataset['00081190'] = element('UR', study_url)
+    if failed:
+        dataset['00081198'] = {'vr': 'SQ', 'Value': failed}
+    if referenced:
+        dataset['00081199'] = {'vr': 'SQ', 'Value': referenced}
+    return dataset, len(referenced), len(failed)
@@ -0,0 +1,385 @@
+"""Jeu de données synthétique reproductible : hôpitaux, personnel, patients,
+dossiers médicaux et études DICOM avec de petits fichiers DICOM valides.
+
+Le volume est fixé par SyntheticScale et le contenu par une graine : deux
+générations avec les mêmes paramètres produisent les mêmes noms, dates et
+UIDs. Les lignes sont insérées par bulk_create, sans signaux ; les caches
+dérivés (relations patient-médecin, réponses en cache) sont invalidés
+explicitement à la fin (invalidate_caches).
+
+Toutes les données portent le préfixe `prefix` (noms d'utilisateur et
+d'hôpitaux) et peuvent être supprimées par flush().
+"""
+import hashlib
+import io
+import os
+import random
+import tempfile
+from datetime import date, datetime, time, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from medical import cache as response_cache
+from medical.models import (
+    Hospital, User, PatientDoctor, Appointment, MedicalRecord, MedicalHistory, Treatment, Examination
+)
+from medical.relations import CACHE_KEY as DOCTOR_PATIENTS_CACHE_KEY
+from . import series_metadata
+from .models import DicomStudy, DicomSeries, DicomInstance, DicomSeriesMetadata
+from .storage import content_key, get_dicom_storage
+from .wado_rs import dataset_json, instance_uri
+
+CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2'
+MR_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.4'
+SECONDARY_CAPTURE_STORAGE = '1.2.840.10008.5.1.4.1.1.7'
+
+MODALITIES = [('CT', CT_IMAGE_STORAGE), ('MR', MR_IMAGE_STORAGE), ('OT', SECONDARY_CAPTURE_STORAGE)]
+
+FIRST_NAMES = ['Alice', 'Bruno', 'Chloé', 'David', 'Emma', 'Farid', 'Gaëlle', 'Hugo', 'Inès', 'Jules',
+               'Karima', 'Louis', 'Manon', 'Nicolas', 'Océane', 'Paul', 'Rose', 'Samir', 'Théo', 'Yasmine']
+LAST_NAMES = ['Martin', 'Bernard', 'Diallo', 'Petit', 'Durand', 'Leroy', 'Moreau', 'Benali', 'Laurent',
+              'Lefebvre', 'Michel', 'Garcia', 'Fournier', 'Rousseau', 'Nguyen', 'Mercier']
+CONDITIONS = ['Hypertension', 'Diabète de type 2', 'Asthme', 'Migraine', 'Hypothyroïdie', 'Lombalgie']
+MEDICATIONS = [('Amlodipine', '5 mg'), ('Metformine', '850 mg'), ('Salbutamol', '100 µg'),
+               ('Paracétamol', '1 g'), ('Lévothyroxine', '75 µg'), ('Ibuprofène', '400 mg')]
+EXAM_TYPES = ['Bilan sanguin', 'Radiographie thoracique', 'IRM cérébrale', 'Scanner abdominal', 'ECG']
+
+# Date de référence fixe : les données ne dépendent pas du jour de génération
+REFERENCE_DATE = date(2024, 1, 1)
+# Mot de passe commun des comptes générés (haché une seule fois)
+DEFAULT_PASSWORD = 'mediconnect'
+# Côté des images générées, en pixels
+IMAGE_SIZE = 8
+
+BATCH_SIZE = 2000
+
+
+class SyntheticScale:
+    """Volumes générés, par hôpital puis par patient, dossier ou étude."""
+
+    DEFAULTS = {
+        'hospitals': 2,
+        'doctors': 5,
+        'secretaries': 2,
+        'patients_per_doctor': 20,
+        'appointments': 3,
+        'records': 2,
+        'histories': 2,
+        'treatments': 2,
+        'examinations': 1,
+        'studies': 1,
+        'series': 2,
+        'instances': 5,
+    }
+
+    HELP = {
+        'hospitals': "Hôpitaux",
+        'doctors': "Médecins par hôpital",
+        'secretaries': "Secrétaires par hôpital",
+        'patients_per_doctor': "Patients suivis par médecin",
+        'appointments': "Rendez-vous par patient",
+        'records': "Dossiers médicaux par patient",
+        'histories': "Antécédents par dossier",
+        'treatments': "Traitements par dossier",
+        'examinations': "Examens par dossier",
+        'studies': "Études DICOM par patient",
+        'series': "Séries par étude",
+        'instances': "Instances par série",
+    }
+
+    def __init__(self, **volumes):
+        unknown = set(volumes) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Volumes inconnus: {', '.join(sorted(unknown))}")
+        for name, default in self.DEFAULTS.items():
+            setattr(self, name, volumes.get(name, default))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.DEFAULTS}
+
+    @classmethod
+    def add_arguments(cls, parser):
+        for name, default in cls.DEFAULTS.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default, help=cls.HELP[name])
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(**{name: options[name] for name in cls.DEFAULTS})
+
+
+def dicom_dataset(sop_class_uid, modality, study_uid, series_uid, sop_uid, number, rows=IMAGE_SIZE, frames=1,
+                  patient_name='Synthetic^Patient', patient_id='SYNTH', study_date=REFERENCE_DATE):
+    """Dataset DICOM minimal mais complet (méta-informations, pixels 16 bits à zéro)."""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = sop_class_uid
+    meta.MediaStorageSOPInstanceUID = sop_uid
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.preamble = b'\0' * 128
+    ds.SOPClassUID = sop_class_uid
+    ds.SOPInstanceUID = sop_uid
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = modality
+    ds.StudyDate = study_date.strftime('%Y%m%d')
+    ds.StudyDescription = 'Synthetic'
+    ds.SeriesDescription = modality
+    ds.SeriesNumber = 1
+    ds.InstanceNumber = number
+    ds.StudyID = '1'
+    ds.AccessionNumber = 'SYNTH'
+    ds.PatientName = patient_name
+    ds.PatientID = patient_id
+    ds.Rows = rows
+    ds.Columns = rows
+    ds.NumberOfFrames = frames
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 16
+    ds.BitsStored = 12
+    ds.HighBit = 11
+    ds.PixelRepresentation = 0
+    ds.PixelData = b'\0' * (rows * rows * 2 * frames)
+    return ds
+
+
+def dicom_bytes(ds):
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def store_bytes(content):
+    """Écrit `content` dans le stockage DICOM sous sa clé de contenu ; retourne (clé, empreinte)."""
+    content_hash = hashlib.sha256(content).hexdigest()
+    key = content_key(content_hash)
+    storage = get_dicom_storage()
+    if not storage.exists(key):
+        fd, path = tempfile.mkstemp(suffix='.dcm')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        storage.save(key, path)
+    return key, content_hash
+
+
+class SyntheticDataGenerator:
+    """
+    Génère le jeu de données décrit par `scale`.
+
+    Chaque patient est suivi par un médecin principal de son hôpital (et,
+    une fois sur cinq, par un second) ; ses rendez-vous, dossiers et
+    études sont rattachés au médecin principal. Avec `write_files`, chaque
+    instance DICOM reçoit un petit fichier valide dans le stockage.
+    """
+
+    def __init__(self, scale=None, seed=0, prefix='synth', write_files=True):
+        self.scale = scale or SyntheticScale()
+        self.seed = seed
+        self.prefix = prefix
+        self.write_files = write_files
+        self.random = random.Random(seed)
+
+    def uid(self, *parts):
+        return generate_uid(entropy_srcs=[self.prefix, str(self.seed), *map(str, parts)])
+
+    def day(self, max_days):
+        return REFERENCE_DATE - timedelta(days=self.random.randrange(max_days))
+
+    def name(self):
+        return self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+
+    def generate(self):
+        """Crée les données et retourne le nombre de lignes créées par modèle."""
+        scale = self.scale
+        password = make_password(DEFAULT_PASSWORD)
+
+        hospitals = Hospital.objects.bulk_create([
+            Hospital(
+                name=f'{self.prefix} Hôpital {h}', address=f'{h} rue de la Santé, Paris',
+                phone=f'01 00 00 00 {h:02d}', email=f'{self.prefix}-hopital-{h}@example.org',
+            )
+            for h in range(scale.hospitals)
+        ])
+
+        users = []
+
+        def user(role, username, hospital):
+            first_name, last_name = self.name()
+            users.append(User(
+                username=username, role=role, hospital=hospital, password=password,
+                first_name=first_name, last_name=last_name, email=f'{username}@example.org',
+            ))
+
+        for h, hospital in enumerate(hospitals):
+            user(User.Role.HOSPITAL_ADMIN, f'{self.prefix}-admin-{h}', hospital)
+            for s in range(scale.secretaries):
+                user(User.Role.SECRETARY, f'{self.prefix}-secretary-{h}-{s}', hospital)
+            for d in range(scale.doctors):
+                user(User.Role.DOCTOR, f'{self.prefix}-doctor-{h}-{d}', hospital)
+                for p in range(scale.patients_per_doctor):
+                    user(User.Role.PATIENT, f'{self.prefix}-patient-{h}-{d}-{p}', hospital)
+        users = User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+
+        # Médecin principal de chaque patient : le dernier médecin créé avant lui
+        doctors_by_hospital = {}
+        primary_doctor = {}
+        doctor = None
+        for u in users:
+            if u.role == User.Role.DOCTOR:
+                doctor = u
+                doctors_by_hospital.setdefault(u.hospital_id, []).append(u)
+            elif u.role == User.Role.PATIENT:
+                primary_doctor[u] = doctor
+        patients = list(primary_doctor)
+
+        links = []
+        for patient, doctor in primary_doctor.items():
+            links.append(PatientDoctor(patient=patient, doctor=doctor))
+            colleagues = [d for d in doctors_by_hospital[patient.hospital_id] if d != doctor]
+            if colleagues and self.random.random() < 0.2:
+                links.append(PatientDoctor(patient=patient, doctor=self.random.choice(colleagues)))
+        PatientDoctor.objects.bulk_create(links, batch_size=BATCH_SIZE)
+
+        statuses = list(Appointment.Status.values)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, doctor=primary_doctor[patient],
+                date=datetime.combine(self.day(365), time(8 + self.random.randrange(10)), tzinfo=timezone.utc),
+                status=self.random.choice(statuses), notes='Consultation de suivi',
+            )
+            for patient in patients for _ in range(scale.appointments)
+        ], batch_size=BATCH_SIZE)
+
+        records = MedicalRecord.objects.bulk_create([
+            MedicalRecord(
+                patient=patient, doctor=primary_doctor[patient], record_date=self.day(3 * 365),
+                chief_complaint='Douleurs thoraciques', diagnosis=self.random.choice(CONDITIONS),
+                treatment_plan='Surveillance et traitement médicamenteux', is_active=self.random.random() < 0.8,
+            )
+            for patient in patients for _ in range(scale.records)
+        ], batch_size=BATCH_SIZE)
+        MedicalHistory.objects.bulk_create([
+            MedicalHistory(
+                medical_record=record, condition=self.random.choice(CONDITIONS),
+                description='Antécédent déclaré par le patient', start_date=record.record_date - timedelta(days=365),
+            )
+            for record in records for _ in range(scale.histories)
+        ], batch_size=BATCH_SIZE)
+        treatments = []
+        for record in records:
+            for _ in range(scale.treatments):
+                medication, dosage = self.random.choice(MEDICATIONS)
+                treatments.append(Treatment(
+                    medical_record=record, medication=medication, dosage=dosage, frequency='2 fois par jour',
+                    start_date=record.record_date, is_active=record.is_active,
+                ))
+        Treatment.objects.bulk_create(treatments, batch_size=BATCH_SIZE)
+        Examination.objects.bulk_create([
+            Examination(
+                medical_record=record, exam_type=self.random.choice(EXAM_TYPES), result='Normal',
+                exam_date=record.record_date,
+            )
+            for record in records for _ in range(scale.examinations)
+        ], batch_size=BATCH_SIZE)
+
+        counts = self.generate_dicom(patients, primary_doctor)
+        invalidate_caches([d.pk for doctors in doctors_by_hospital.values() for d in doctors])
+        return {
+            'hospitals': len(hospitals),
+            'users': len(users),
+            'patient_doctors': len(links),
+            'appointments': len(patients) * scale.appointments,
+            'medical_records': len(records),
+            'medical_histories': len(records) * scale.histories,
+            'treatments': len(treatments),
+            'examinations': len(records) * scale.examinations,
+            **counts,
+        }
+
+    def generate_dicom(self, patients, primary_doctor):
+        scale = self.scale
+        studies = DicomStudy.objects.bulk_create([
+            DicomStudy(
+                patient=patient, doctor=primary_doctor[patient],
+                study_instance_uid=self.uid('study', patient.username, k), study_date=self.day(3 * 365),
+                study_description=f'Étude {k + 1}', study_id=str(k + 1),
+                accession_number=f'ACC{self.random.randrange(10 ** 8):08d}',
+                patient_name=f'{patient.last_name}^{patient.first_name}', dicom_patient_id=patient.username,
+            )
+            for patient in patients for k in range(scale.studies)
+        ], batch_size=BATCH_SIZE)
+
+        series = []
+        sop_classes = {}
+        for study in studies:
+            for number in range(1, scale.series + 1):
+                modality, sop_class_uid = self.random.choice(MODALITIES)
+                s = DicomSeries(
+                    study=study, series_instance_uid=self.uid('series', study.study_instance_uid, number),
+                    series_number=number, series_description=modality, modality=modality,
+                    number_of_instances=scale.instances,
+                )
+                sop_classes[s.series_instance_uid] = sop_class_uid
+                series.append(s)
+        DicomSeries.objects.bulk_create(series, batch_size=BATCH_SIZE)
+
+        instances = []
+        documents = []
+        for s in series:
+            sop_class_uid = sop_classes[s.series_instance_uid]
+            entries = []
+            for number in range(1, scale.instances + 1):
+                sop_uid = self.uid('instance', s.series_instance_uid, number)
+                instance = DicomInstance(
+                    series=s, sop_instance_uid=sop_uid, sop_class_uid=sop_class_uid, instance_number=number,
+                )
+                if self.write_files:
+                    study = s.study
+                    ds = dicom_dataset(
+                        sop_class_uid, s.modality, study.study_instance_uid, s.series_instance_uid,
+                        sop_uid, number, patient_name=study.patient_name, patient_id=study.dicom_patient_id,
+                        study_date=study.study_date,
+                    )
+                    content = dicom_bytes(ds)
+                    instance.file_path, instance.content_hash = store_bytes(content)
+                    instance.file_size = len(content)
+                    entries.append(dataset_json(
+                        ds, instance_uri(study.study_instance_uid, s.series_instance_uid, sop_uid)
+                    ))
+                instances.append(instance)
+            if entries:
+                # Document de métadonnées que l'ingestion aurait construit
+                documents.append(DicomSeriesMetadata(
+                    series=s, document=series_metadata.compress(entries), instance_count=len(entries)
+                ))
+        DicomInstance.objects.bulk_create(instances, batch_size=BATCH_SIZE)
+        DicomSeriesMetadata.objects.bulk_create(documents, batch_size=BATCH_SIZE)
+        return {'dicom_studies': len(studies), 'dicom_series': len(series), 'dicom_instances': len(instances)}
+
+
+def invalidate_caches(doctor_ids):
+    """
+    Oublie les relations en cache des médecins et rend obsolètes les réponses
+    en cache, immédiatement (bulk_create n'émet pas de signal ; après une
+    transaction annulée, on_commit ne serait jamais appelé).
+    """
+    cache.delete_many([DOCTOR_PATIENTS_CACHE_KEY.format(doctor_id) for doctor_id in doctor_ids])
+    for namespace in ('hospitals', 'users', 'patient_doctors'):
+        response_cache.incr(response_cache.version_key(namespace))
+
+
+def flush(prefix='synth'):
+    """Supprime les données générées avec `prefix` (les fichiers stockés sont conservés)."""
+    doctor_ids = list(User.objects.filter(
+        username__startswith=f'{prefix}-', role=User.Role.DOCTOR
+    ).values_list('pk', flat=True))
+    # Études, dossiers, rendez-vous et relations suivent par cascade
+    deleted, _ = User.objects.filter(username__startswith=f'{prefix}-').delete()
+    hospitals, _ = Hospital.objects.filter(name__startswith=f'{prefix} Hôpital ').delete()
+    invalidate_caches(doctor_ids)
+    return deleted + hospitals
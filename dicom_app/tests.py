@@ -1,3 +1,696 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import pydicom
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pydicom.encaps import encapsulate
+from pydicom.uid import JPEGBaseline8Bit
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from medical.models import PatientDoctor, User
+from . import ingest, jobs, metadata, multipart, stow, wado_rs
+from .dicom_web import RangeNotSatisfiable, parse_range_header, plan_streaming_response
+from .models import DicomInstance, DicomSeries, DicomStudy, IngestJob
+from .orthanc import reset_orthanc_clients
+from .orthanc_ids import reset_orthanc_id_cache
+from .rendering import FrameNotFound, reset_render_cache
+from .storage import reset_dicom_storage
+from .synthetic import CT_IMAGE_STORAGE, dicom_bytes, dicom_dataset, store_bytes
+from .upload_handlers import OrthancStream
+
+# Orthanc injoignable par défaut : aucun test ne dépend d'un serveur réel
+ORTHANC_DOWN = 'http://127.0.0.1:9'
+
+
+class DicomTestCase(TestCase):
+    """Médecin, patient suivi, autre médecin, secrétaire ; stockage DICOM temporaire."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create(username='doctor', role=User.Role.DOCTOR)
+        cls.other_doctor = User.objects.create(username='other-doctor', role=User.Role.DOCTOR)
+        cls.patient = User.objects.create(username='patient', role=User.Role.PATIENT)
+        cls.other_patient = User.objects.create(username='other-patient', role=User.Role.PATIENT)
+        cls.secretary = User.objects.create(username='secretary', role=User.Role.SECRETARY)
+        PatientDoctor.objects.create(patient=cls.patient, doctor=cls.doctor)
+        PatientDoctor.objects.create(patient=cls.other_patient, doctor=cls.other_doctor)
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(
+            DICOM_STORAGE_BACKEND='local',
+            DICOM_STORAGE_ROOT=f'{root}/storage',
+            DICOM_INGEST_SPOOL_ROOT=f'{root}/spool',
+            DICOM_RENDER_CACHE_DIR=f'{root}/rendered',
+            DICOM_THUMBNAIL_PREWARM=False,
+            ORTHANC_URL=ORTHANC_DOWN,
+            ORTHANC_MAX_RETRIES=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for reset in (reset_dicom_storage, reset_render_cache, reset_orthanc_clients, reset_orthanc_id_cache):
+            reset()
+            self.addCleanup(reset)
+        cache.clear()
+        self.client = self.client_for(self.doctor)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def create_study(self, uid, series=1, instances=1, doctor=None, patient=None):
+        """Étude indexée (lignes seules, sans fichier)."""
+        study = DicomStudy.objects.create(
+            patient=patient or self.patient, doctor=doctor or self.doctor, study_instance_uid=uid,
+            study_date=date(2024, 1, 1), study_description=f'Étude {uid}', study_id=uid,
+        )
+        for s in range(series):
+            series_row = DicomSeries.objects.create(
+                study=study, series_instance_uid=f'{uid}.{s + 1}', series_number=s + 1,
+                series_description='Série', modality='CT', number_of_instances=instances,
+            )
+            DicomInstance.objects.bulk_create(
+                DicomInstance(
+                    series=series_row, sop_instance_uid=f'{uid}.{s + 1}.{i + 1}', sop_class_uid=CT_IMAGE_STORAGE,
+                    instance_number=i + 1, file_path='',
+                )
+                for i in range(instances)
+            )
+        return study
+
+    def dicom_file(self, study_uid, series_uid, sop_uid, number=1, **kwargs):
+        return dicom_bytes(dicom_dataset(CT_IMAGE_STORAGE, 'CT', study_uid, series_uid, sop_uid, number, **kwargs))
+
+
+class AsyncQidoTests(DicomTestCase):
+    def test_search_is_limited_to_accessible_studies(self):
+        self.create_study('1.2.1')
+        self.create_study('1.2.2', doctor=self.other_doctor, patient=self.other_patient)
+
+        response = self.client.get('/api/dicom/async/qido/', {'StudyInstanceUID': '1.2.1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['0020000D']['Value'] for r in response.json()], [['1.2.1']])
+
+        response = self.client.get('/api/dicom/async/qido/', {'StudyInstanceUID': '1.2.2'})
+        self.assertEqual(response.json(), [])
+
+    def test_requires_study_uid_and_authentication(self):
+        self.assertEqual(self.client.get('/api/dicom/async/qido/').status_code, 400)
+        self.assertEqual(APIClient().get('/api/dicom/async/qido/', {'StudyInstanceUID': '1'}).status_code, 401)
+
+
+class StudyAccessTests(DicomTestCase):
+    """Le médecin voit les études qu'il a créées pour les patients qui lui sont liés."""
+
+    def test_unlinked_patient_studies_are_hidden(self):
+        visible = self.create_study('1.4.1')
+        hidden = self.create_study('1.4.2', patient=self.other_patient)
+
+        body = self.client.get('/api/dicom/studies/?view=summary').json()
+        self.assertEqual([study['id'] for study in body['results']], [visible.pk])
+        self.assertEqual(self.client.get(f'/api/dicom/studies/{hidden.pk}/').status_code, 404)
+        series = hidden.series.get()
+        self.assertEqual(self.client.get(f'/api/dicom/series/{series.pk}/').status_code, 404)
+        instance = series.instances.get()
+        self.assertEqual(self.client.get(f'/api/dicom/instances/{instance.pk}/').status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PatientDoctor.objects.filter(patient=self.patient, doctor=self.doctor).delete()
+        self.assertEqual(self.client.get('/api/dicom/studies/?view=summary').json()['results'], [])
+
+
+class ListQueryCountTests(DicomTestCase):
+    """Nombre de requêtes des listes indépendant du nombre de lignes de la page."""
+
+    def add_studies(self, count):
+        start = DicomStudy.objects.count()
+        for n in range(start, start + count):
+            self.create_study(f'1.3.{n}', series=3, instances=4)
+
+    def assert_constant_queries(self, url):
+        self.add_studies(2)
+        self.client.get(url)  # caches de la requête (relations médecin-patient)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        small_page = response.json()['results']
+
+        self.add_studies(18)
+        with self.assertNumQueries(len(small)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.json()['results']), len(small_page))
+
+    def test_study_list_full(self):
+        self.assert_constant_queries('/api/dicom/studies/?page_size=50')
+
+    def test_study_list_series_view(self):
+        self.assert_constant_queries('/api/dicom/studies/?page_size=50&view=series')
+
+    def test_study_list_summary_view(self):
+        self.assert_constant_queries('/api/dicom/studies/?page_size=50&view=summary')
+
+    def test_series_list(self):
+        self.assert_constant_queries('/api/dicom/series/')
+
+    def test_series_list_summary_view(self):
+        self.assert_constant_queries('/api/dicom/series/?view=summary')
+
+    def test_instance_list(self):
+        self.assert_constant_queries('/api/dicom/instances/?page_size=100')
+
+    def test_study_list_counts(self):
+        self.add_studies(1)
+        study = self.client.get('/api/dicom/studies/?view=summary').json()['results'][0]
+        self.assertEqual((study['series_count'], study['instance_count']), (3, 12))
+
+
+class UploadBatchTests(DicomTestCase):
+    url = '/api/dicom/studies/upload_batch/'
+
+    def upload(self, patient, *files):
+        return self.client.post(self.url, {
+            'patient': patient,
+            'files': [SimpleUploadedFile(f'{n}.dcm', content) for n, content in enumerate(files)],
+        }, format='multipart')
+
+    def test_rejects_unknown_or_unrelated_patient(self):
+        content = self.dicom_file('1.4.1', '1.4.1.1', '1.4.1.1.1')
+        self.assertEqual(self.upload(999999, content).status_code, 400)
+        self.assertEqual(self.upload(self.secretary.pk, content).status_code, 400)
+        self.assertEqual(self.upload(self.other_patient.pk, content).status_code, 403)
+        self.assertFalse(DicomStudy.objects.exists())
+
+    def test_report_per_file(self):
+        self.create_study('1.4.2', doctor=self.other_doctor, patient=self.other_patient)
+        response = self.upload(
+            self.patient.pk,
+            self.dicom_file('1.4.1', '1.4.1.1', '1.4.1.1.1'),
+            self.dicom_file('1.4.2', '1.4.2.9', '1.4.2.9.1'),
+            b'not a dicom file',
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['stored'], body['duplicates'], body['failed']), (1, 0, 2))
+        self.assertEqual([f['status'] for f in body['files']], ['stored', 'failed', 'failed'])
+        self.assertEqual(DicomStudy.objects.get(study_instance_uid='1.4.1').patient, self.patient)
+        self.assertFalse(DicomSeries.objects.filter(series_instance_uid='1.4.2.9').exists())
+
+        body = self.upload(self.patient.pk, self.dicom_file('1.4.1', '1.4.1.1', '1.4.1.1.1')).json()
+        self.assertEqual(body['files'][0]['status'], 'duplicate')
+
+    def test_failed_series_leaves_no_stored_file(self):
+        contents = [self.dicom_file('1.4.1', '1.4.1.1', f'1.4.1.1.{n}', number=n) for n in (1, 2)]
+        with mock.patch('dicom_app.series_metadata.add_instances', side_effect=RuntimeError('disque plein')):
+            body = self.upload(self.patient.pk, *contents).json()
+        self.assertEqual(body['failed'], 2)
+        self.assertFalse(DicomInstance.objects.exists())
+        root = settings.DICOM_STORAGE_ROOT
+        self.assertEqual([files for _, _, files in os.walk(root) if files], [])
+
+        # Les mêmes fichiers ne sont pas pris pour des doublons au nouvel envoi
+        body = self.upload(self.patient.pk, *contents).json()
+        self.assertEqual(body['stored'], 2)
+
+    def test_large_batch_reads_headers_in_worker_processes(self):
+        # Au-delà de BATCH_MIN_FILES fichiers : pool de processus de metadata.py
+        count = metadata.BATCH_MIN_FILES + 2
+        contents = [self.dicom_file('1.4.1', '1.4.1.1', f'1.4.1.1.{n}', number=n) for n in range(count)]
+        with override_settings(DICOM_INGEST_WORKERS=2):
+            body = self.upload(self.patient.pk, *contents, b'not a dicom file').json()
+        self.assertEqual((body['stored'], body['failed']), (count, 1))
+        self.assertEqual(
+            set(DicomInstance.objects.values_list('content_hash', flat=True)),
+            {hashlib.sha256(content).hexdigest() for content in contents},
+        )
+
+
+class IngestJobTests(DicomTestCase):
+    url = '/api/dicom/jobs/'
+
+    def enqueue(self, patient, *files):
+        return self.client.post(self.url, {
+            'patient': patient,
+            'files': [SimpleUploadedFile(f'{n}.dcm', content) for n, content in enumerate(files)],
+        }, format='multipart')
+
+    def test_rejects_unknown_or_unrelated_patient(self):
+        content = self.dicom_file('1.5.1', '1.5.1.1', '1.5.1.1.1')
+        self.assertEqual(self.enqueue(999999, content).status_code, 400)
+        self.assertEqual(self.enqueue('abc', content).status_code, 400)
+        self.assertEqual(self.enqueue(self.other_patient.pk, content).status_code, 403)
+        self.assertFalse(IngestJob.objects.exists())
+
+    def test_enqueue(self):
+        response = self.enqueue(self.patient.pk, self.dicom_file('1.5.1', '1.5.1.1', '1.5.1.1.1'))
+        self.assertEqual(response.status_code, 202)
+        job = IngestJob.objects.get(pk=response.json()['id'])
+        self.assertEqual((job.status, job.files_total, job.patient), (IngestJob.Status.PENDING, 1, self.patient))
+
+
+class IngestJobStateTests(DicomTestCase):
+    """Cycle de vie d'une tâche : PENDING -> RUNNING -> RETRY / SUCCEEDED, reprise après arrêt du worker."""
+
+    def enqueue(self, *series_uids):
+        files = [
+            SimpleUploadedFile(f'{n}.dcm', self.dicom_file('1.6.1', uid, f'{uid}.1'))
+            for n, uid in enumerate(series_uids)
+        ]
+        return jobs.enqueue_ingest_job(files, self.patient.pk, self.doctor)
+
+    def make_available(self, job):
+        past = timezone.now() - timedelta(seconds=settings.DICOM_INGEST_LEASE_SECONDS + 1)
+        IngestJob.objects.filter(pk=job.pk).update(available_at=past, locked_at=past)
+
+    def test_retry_then_succeed(self):
+        job = self.enqueue('1.6.1.1', '1.6.1.2')
+        self.assertEqual(job.status, IngestJob.Status.PENDING)
+
+        # Orthanc injoignable : fichiers stockés, envoi reprogrammé
+        job = jobs.process_next_job()
+        self.assertEqual(job.status, IngestJob.Status.RETRY)
+        self.assertEqual((job.attempts, job.files_parsed, job.files_stored, job.files_forwarded), (1, 2, 2, 0))
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertIsNone(jobs.process_next_job())
+
+        self.make_available(job)
+        with mock.patch('dicom_app.jobs.push_to_orthanc', side_effect=lambda keys: {key: 200 for key in keys}):
+            job = jobs.process_next_job()
+        self.assertEqual(job.status, IngestJob.Status.SUCCEEDED)
+        self.assertEqual((job.attempts, job.files_stored, job.files_forwarded, job.error), (2, 2, 2, ''))
+        self.assertEqual([entry['orthanc'] for entry in job.report], [200, 200])
+        self.assertFalse(os.path.exists(job.spool_directory))
+        self.assertEqual(DicomInstance.objects.count(), 2)
+
+    def test_reclaimed_job_resumes_after_recorded_series(self):
+        job = self.enqueue('1.6.1.1', '1.6.1.2')
+        real_ingest_series = ingest.ingest_series
+        calls = []
+
+        def crash_on_second_series(*args, **kwargs):
+            calls.append(args[1])
+            if len(calls) == 2:
+                raise SystemExit('worker arrêté')
+            return real_ingest_series(*args, **kwargs)
+
+        with mock.patch('dicom_app.ingest.ingest_series', side_effect=crash_on_second_series):
+            with self.assertRaises(SystemExit):
+                jobs.process_next_job()
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestJob.Status.RUNNING)
+        self.assertEqual(job.report[0]['status'], 'stored')
+        self.assertIsNone(job.report[1])
+        self.assertEqual(job.files_stored, 1)
+
+        # Bail expiré : la tâche est reprise, seule la seconde série est ingérée
+        self.make_available(job)
+        calls.clear()
+        with mock.patch('dicom_app.ingest.ingest_series', side_effect=crash_on_second_series):
+            job = jobs.process_next_job()
+        self.assertEqual(calls, ['1.6.1.2'])
+        self.assertEqual(job.status, IngestJob.Status.RETRY)
+        self.assertEqual([entry['status'] for entry in job.report], ['stored', 'stored'])
+        self.assertEqual((job.attempts, job.files_stored, job.files_failed), (2, 2, 0))
+
+    def test_forward_renews_lease_after_each_batch(self):
+        job = self.enqueue('1.6.1.1', '1.6.1.2', '1.6.1.3')
+        jobs.process_next_job()
+        self.make_available(job)
+        saved = []
+
+        def push(keys):
+            # Lots précédents enregistrés et bail renouvelé avant chaque envoi
+            row = IngestJob.objects.get(pk=job.pk)
+            saved.append(([entry.get('orthanc') for entry in row.report].count(200), row.locked_at))
+            return {key: 200 for key in keys}
+
+        with mock.patch('dicom_app.jobs.FORWARD_BATCH_SIZE', 1), \
+                mock.patch('dicom_app.jobs.push_to_orthanc', side_effect=push):
+            job = jobs.process_next_job()
+        self.assertEqual([count for count, _ in saved], [0, 1, 2])
+        self.assertLess(saved[0][1], saved[1][1])
+        self.assertEqual((job.status, job.files_forwarded), (IngestJob.Status.SUCCEEDED, 3))
+
+    def test_deleted_instance_is_skipped(self):
+        job = self.enqueue('1.6.1.1', '1.6.1.2')
+        jobs.process_next_job()
+        DicomInstance.objects.filter(sop_instance_uid='1.6.1.1.1').delete()
+        self.make_available(job)
+        with mock.patch('dicom_app.jobs.push_to_orthanc', side_effect=lambda keys: {key: 200 for key in keys}) as push:
+            job = jobs.process_next_job()
+        self.assertEqual(push.call_count, 1)
+        self.assertEqual(job.status, IngestJob.Status.SUCCEEDED)
+        self.assertEqual([entry['orthanc'] for entry in job.report], [jobs.SKIPPED, 200])
+        self.assertEqual((job.files_forwarded, job.error), (1, ''))
+
+    def test_unreadable_manifest_fails_job(self):
+        job = self.enqueue('1.6.1.1')
+        os.remove(os.path.join(job.spool_directory, jobs.MANIFEST_NAME))
+        job = jobs.process_next_job()
+        self.assertEqual(job.status, IngestJob.Status.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+
+class UploadDicomTests(DicomTestCase):
+    url = '/api/dicom/studies/upload_dicom/'
+
+    def upload(self, content, patient=None, in_url=True):
+        """Patient dans l'URL (envoi à Orthanc pendant la réception) ou seulement dans le formulaire."""
+        patient = patient or self.patient.pk
+        return self.client.post(f'{self.url}?patient={patient}' if in_url else self.url, {
+            'patient': patient,
+            'file': SimpleUploadedFile('image.dcm', content),
+        }, format='multipart')
+
+    def fake_orthanc(self, bodies):
+        def post(path, data=None, headers=None):
+            bodies.append(b''.join(data))
+            return mock.Mock(status_code=200, json=lambda: {
+                'ID': 'i1', 'ParentSeries': 's1', 'ParentStudy': 'st1', 'Status': 'Success',
+            })
+        return mock.Mock(post=post, delete=mock.Mock(return_value=mock.Mock(status_code=200)))
+
+    def test_duplicate_is_not_forwarded_to_orthanc(self):
+        content = self.dicom_file('1.7.1', '1.7.1.1', '1.7.1.1.1')
+        with mock.patch('dicom_app.upload_handlers.OrthancStream', wraps=OrthancStream) as stream:
+            self.assertEqual(self.upload(content).status_code, 200)
+            self.assertEqual(stream.call_count, 1)
+            self.assertEqual(self.upload(content).status_code, 409)
+            self.assertEqual(stream.call_count, 1)
+        self.assertEqual(DicomInstance.objects.count(), 1)
+
+    def test_forwarded_body_is_the_whole_file(self):
+        # Plus long que l'en-tête lu avant de décider de l'envoi
+        content = self.dicom_file('1.7.1', '1.7.1.1', '1.7.1.1.1', rows=256)
+        bodies = []
+        with mock.patch('dicom_app.upload_handlers.get_orthanc_client', return_value=self.fake_orthanc(bodies)):
+            self.assertEqual(self.upload(content).status_code, 200)
+        self.assertEqual(bodies, [content])
+        self.assertEqual(DicomInstance.objects.get().orthanc_id, 'i1')
+
+    def test_patient_in_form_is_forwarded_after_save(self):
+        content = self.dicom_file('1.7.1', '1.7.1.1', '1.7.1.1.1')
+        with mock.patch('dicom_app.upload_handlers.OrthancStream') as stream, \
+                mock.patch('dicom_app.views.push_to_orthanc') as push:
+            self.assertEqual(self.upload(content, in_url=False).status_code, 200)
+        stream.assert_not_called()
+        push.assert_called_once_with([DicomInstance.objects.get().file_path])
+
+    def test_rejected_upload_never_reaches_orthanc(self):
+        content = self.dicom_file('1.7.1', '1.7.1.1', '1.7.1.1.1')
+        with mock.patch('dicom_app.upload_handlers.OrthancStream') as stream, \
+                mock.patch('dicom_app.views.push_to_orthanc') as push:
+            for in_url in (True, False):
+                self.assertEqual(self.upload(content, self.other_patient.pk, in_url).status_code, 403)
+                self.assertEqual(self.upload(content, 999999, in_url).status_code, 400)
+        stream.assert_not_called()
+        push.assert_not_called()
+        self.assertFalse(DicomStudy.objects.exists())
+
+    def test_failed_save_removes_forwarded_instance(self):
+        content = self.dicom_file('1.7.1', '1.7.1.1', '1.7.1.1.1')
+        orthanc = self.fake_orthanc([])
+        with mock.patch('dicom_app.upload_handlers.get_orthanc_client', return_value=orthanc), \
+                mock.patch('dicom_app.series_metadata.add_instances', side_effect=RuntimeError('disque plein')):
+            self.assertEqual(self.upload(content).status_code, 500)
+        orthanc.delete.assert_called_once_with('/instances/i1')
+        self.assertFalse(DicomInstance.objects.exists())
+
+
+def orthanc_response(status_code=200, content=b'', **headers):
+    """Réponse Orthanc ouverte en stream (requests), comme celle de OrthancClient.get(stream=True)."""
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update({'Content-Length': str(len(content)), **headers})
+    response.raw = io.BytesIO(content)
+    return response
+
+
+class WadoProxyTests(DicomTestCase):
+    """WADO-URI relayé depuis Orthanc : plages (206/416) et revalidation (ETag/304)."""
+    content = bytes(range(256)) * 4
+
+    def test_parse_range_header(self):
+        self.assertEqual(parse_range_header('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range_header('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range_header('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range_header('bytes=990-2000', 1000), (990, 999))
+        # Absent ou non géré (plages multiples, autre unité) : réponse entière
+        for header in (None, '', 'bytes=0-1,5-6', 'items=0-1', 'bytes=-'):
+            self.assertIsNone(parse_range_header(header, 1000))
+        for header in ('bytes=1000-', 'bytes=5-4', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range_header(header, 1000)
+
+    def test_plan_streaming_response(self):
+        response = orthanc_response(content=self.content, ETag='"v1"')
+        status_code, headers, start, end = plan_streaming_response(response, 'bytes=10-19')
+        self.assertEqual((status_code, start, end), (206, 10, 19))
+        self.assertEqual(headers['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual((headers['Content-Length'], headers['ETag']), ('10', '"v1"'))
+
+        # Plage déjà appliquée par Orthanc : relayée telle quelle
+        partial = orthanc_response(206, self.content[:10], **{'Content-Range': 'bytes 0-9/1024'})
+        self.assertEqual(plan_streaming_response(partial, 'bytes=0-9')[0], 206)
+        self.assertEqual(plan_streaming_response(partial, 'bytes=0-9')[1]['Content-Range'], 'bytes 0-9/1024')
+        self.assertEqual(plan_streaming_response(response)[0::2], (200, 0))
+
+        with self.assertRaises(RangeNotSatisfiable) as raised:
+            plan_streaming_response(response, 'bytes=2000-')
+        self.assertEqual(raised.exception.total_length, 1024)
+
+    def wado(self, response, **headers):
+        client = mock.Mock()
+        client.get.return_value = response
+        with mock.patch('dicom_app.dicom_web.get_orthanc_client', return_value=client):
+            result = self.client.get('/api/dicom/wado/', {
+                'studyUID': '1.2.3', 'seriesUID': '1.2.3.4', 'objectUID': '1.2.3.4.5',
+            }, **headers)
+        return result, client.get.call_args.kwargs['headers']
+
+    def test_sync_range(self):
+        response, sent = self.wado(orthanc_response(content=self.content), HTTP_RANGE='bytes=100-199')
+        self.assertEqual(sent['Range'], 'bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1024')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response, _ = self.wado(orthanc_response(content=self.content), HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_sync_etag_revalidation(self):
+        response, _ = self.wado(orthanc_response(content=self.content, ETag='"v1"'))
+        self.assertEqual((response.status_code, response['ETag']), (200, '"v1"'))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response, sent = self.wado(orthanc_response(304, ETag='"v1"'), HTTP_IF_NONE_MATCH='"v1"')
+        self.assertEqual(sent['If-None-Match'], '"v1"')
+        self.assertEqual((response.status_code, response['ETag']), (304, '"v1"'))
+
+    async def async_wado(self, response, **headers):
+        client = mock.Mock()
+        client.get = mock.AsyncMock(return_value=response)
+        with mock.patch('dicom_app.async_views.get_async_orthanc_client', return_value=client):
+            result = await AsyncClient().get('/api/dicom/async/wado/', {
+                'studyUID': '1.2.3', 'seriesUID': '1.2.3.4', 'objectUID': '1.2.3.4.5',
+            }, headers={'Authorization': f'Bearer {AccessToken.for_user(self.doctor)}', **headers})
+            body = b''.join([chunk async for chunk in result.streaming_content]) if result.streaming else b''
+        return result, body, client.get.call_args.kwargs['headers']
+
+    async def test_async_range_and_etag(self):
+        response, body, sent = await self.async_wado(
+            httpx.Response(200, content=self.content, headers={'ETag': '"v1"'}), Range='bytes=-24'
+        )
+        self.assertEqual(sent['Range'], 'bytes=-24')
+        self.assertEqual((response.status_code, response['ETag']), (206, '"v1"'))
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+        self.assertEqual(body, self.content[1000:])
+
+        response, _, _ = await self.async_wado(httpx.Response(200, content=self.content), Range='bytes=1024-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1024'))
+
+        response, body, sent = await self.async_wado(
+            httpx.Response(304, headers={'ETag': '"v1"'}), **{'If-None-Match': '"v1"'}
+        )
+        self.assertEqual(sent['If-None-Match'], '"v1"')
+        self.assertEqual((response.status_code, response['ETag'], body), (304, '"v1"', b''))
+
+
+class WadoFrameTests(DicomTestCase):
+    """Frames lues à leur position dans PixelData, sans charger l'élément entier."""
+
+    def instance_ref(self, ds):
+        key, _ = store_bytes(dicom_bytes(ds))
+        return wado_rs.InstanceRef(ds.StudyInstanceUID, ds.SeriesInstanceUID, ds.SOPInstanceUID, key)
+
+    def read_frames(self, ref, numbers):
+        with mock.patch('dicom_app.wado_rs.pydicom.dcmread', wraps=pydicom.dcmread) as dcmread:
+            frames = wado_rs.read_frames(ref, numbers)
+        self.assertTrue(all(call.kwargs.get('stop_before_pixels') for call in dcmread.call_args_list))
+        return frames
+
+    def test_native_frames(self):
+        ds = dicom_dataset(CT_IMAGE_STORAGE, 'CT', '1.8.1', '1.8.1.1', '1.8.1.1.1', 1, rows=4, frames=3)
+        ds.PixelData = b''.join(bytes([n]) * 32 for n in (1, 2, 3))
+        part_type, _, frames = self.read_frames(self.instance_ref(ds), [3, 1])
+        self.assertEqual(part_type, 'application/octet-stream')
+        self.assertEqual(frames, [b'\3' * 32, b'\1' * 32])
+
+    def test_encapsulated_frames(self):
+        ds = dicom_dataset(CT_IMAGE_STORAGE, 'CT', '1.8.1', '1.8.1.1', '1.8.1.1.1', 1, rows=4, frames=3)
+        ds.file_meta.TransferSyntaxUID = JPEGBaseline8Bit
+        ds.PixelData = encapsulate([b'frame-1\0', b'frame-2\0', b'frame-3\0'], has_bot=True)
+        ds['PixelData'].VR = 'OB'
+        ds['PixelData'].is_undefined_length = True
+        part_type, _, frames = self.read_frames(self.instance_ref(ds), [2])
+        self.assertEqual(part_type, 'image/jpeg')
+        self.assertEqual(frames, [b'frame-2\0'])
+
+    def test_missing_frame(self):
+        ds = dicom_dataset(CT_IMAGE_STORAGE, 'CT', '1.8.1', '1.8.1.1', '1.8.1.1.1', 1, rows=4, frames=2)
+        with self.assertRaises(FrameNotFound):
+            wado_rs.read_frames(self.instance_ref(ds), [3])
+
+
+class StowTests(DicomTestCase):
+    url = '/api/dicom/dicom-web/studies'
+
+    def stow(self, *contents, url=None, patient=None):
+        boundary = multipart.new_boundary()
+        body = b''.join(multipart.iter_multipart(
+            (('application/dicom', {}, [content]) for content in contents), boundary
+        ))
+        return self.client.post(
+            f'{url or self.url}?patient={patient or self.patient.pk}', data=body,
+            content_type=multipart.content_type(boundary, 'application/dicom'),
+        )
+
+    def test_all_stored(self):
+        response = self.stow(
+            self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.1'),
+            self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.2', number=2),
+        )
+        self.assertEqual(response.status_code, 200)
+        dataset = response.json()
+        self.assertEqual(len(dataset['00081199']['Value']), 2)
+        self.assertNotIn('00081198', dataset)
+        self.assertTrue(dataset['00081190']['Value'][0].endswith('/dicom-web/studies/1.9.1'))
+        self.assertEqual(DicomInstance.objects.filter(series__study__patient=self.patient).count(), 2)
+
+        # Doublon : référencé comme déjà présent, sans nouvelle ligne
+        response = self.stow(self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.1'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DicomInstance.objects.count(), 2)
+
+    def test_partial_failure(self):
+        response = self.stow(self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.1'), b'not a dicom file')
+        self.assertEqual(response.status_code, 202)
+        dataset = response.json()
+        self.assertEqual(len(dataset['00081199']['Value']), 1)
+        self.assertEqual(dataset['00081198']['Value'][0]['00081197']['Value'], [0xC000])
+
+    def test_all_failed(self):
+        content = self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.1')
+        response = self.stow(content, url=f'{self.url}/1.9.2')
+        self.assertEqual(response.status_code, 409)
+        failed = response.json()['00081198']['Value']
+        self.assertEqual(failed[0]['00081155']['Value'], ['1.9.1.1.1'])
+        self.assertFalse(DicomInstance.objects.exists())
+
+    def test_truncated_body_names_the_interrupted_part(self):
+        boundary = multipart.new_boundary()
+        body = b''.join(multipart.iter_multipart((
+            ('application/dicom', {}, [self.dicom_file('1.9.1', '1.9.1.1', f'1.9.1.1.{n}', number=n)])
+            for n in (1, 2, 3)
+        ), boundary))
+        # Corps coupé au milieu de la troisième partie
+        results = stow.receive(io.BytesIO(body[:len(body) - 200]), boundary, self.patient.pk, self.doctor)
+        self.assertEqual([r['file'] for r in results], ['part-1', 'part-2', 'part-3'])
+        self.assertEqual([r['status'] for r in results], ['stored', 'stored', 'failed'])
+
+    def test_instance_of_another_patient_is_not_referenced(self):
+        content = self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.1')
+        self.assertEqual(self.stow(content).status_code, 200)
+
+        # Même SOP Instance UID, sous une autre étude, pour un autre patient
+        other = self.client_for(self.other_doctor)
+        boundary = multipart.new_boundary()
+        response = other.post(
+            f'{self.url}?patient={self.other_patient.pk}',
+            data=b''.join(multipart.iter_multipart(
+                [('application/dicom', {}, [self.dicom_file('1.9.2', '1.9.2.1', '1.9.1.1.1')])], boundary
+            )),
+            content_type=multipart.content_type(boundary, 'application/dicom'),
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn('00081199', response.json())
+        failed = response.json()['00081198']['Value']
+        self.assertEqual(failed[0]['00081155']['Value'], ['1.9.1.1.1'])
+        self.assertEqual(DicomInstance.objects.get().series.study.patient, self.patient)
+
+    def test_patient_checks(self):
+        content = self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.1')
+        self.assertEqual(self.stow(content, patient=999999).status_code, 400)
+        self.assertEqual(self.stow(content, patient=self.other_patient.pk).status_code, 403)
+        self.assertEqual(self.client_for(self.secretary).post(self.url).status_code, 403)
+
+    def test_async_stow_ingests_locally(self):
+        url = '/api/dicom/async/studies/'
+        response = self.stow(self.dicom_file('1.9.1', '1.9.1.1', '1.9.1.1.1'), url=url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/dicom+json')
+        self.assertTrue(response.json()['00081190']['Value'][0].endswith('/dicom-web/studies/1.9.1'))
+        self.assertEqual(DicomInstance.objects.filter(series__study__patient=self.patient).count(), 1)
+
+        content = self.dicom_file('1.9.2', '1.9.2.1', '1.9.2.1.1')
+        self.assertEqual(self.stow(content, url=url, patient=self.other_patient.pk).status_code, 403)
+        self.assertEqual(self.client_for(self.secretary).post(url).status_code, 403)
+        self.assertEqual(APIClient().post(url).status_code, 401)
+        self.assertEqual(self.client.post(url, data=b'', content_type='application/dicom').status_code, 415)
+        self.assertEqual(DicomInstance.objects.count(), 1)
+
+
+class QueryPlanTests(TestCase):
+    """Les listes filtrées par rôle ne parcourent aucune table volumineuse en entier (EXPLAIN)."""
+
+    def test_no_full_scan_on_hot_tables(self):
+        out = StringIO()
+        # CommandError (code de sortie non nul) au moindre parcours complet. Un
+        # dixième du volume par défaut (100 patients) suffit à écarter les
+        # parcours complets ; `manage.py check_query_plans` vérifie le volume entier.
+        call_command('check_query_plans', scale=0.1, stdout=out)
+        self.assertIn('Aucun parcours complet', out.getvalue())
+
+
+class InstanceCursorTests(DicomTestCase):
+    def test_series_instances_follow_stack_order(self):
+        series = self.create_study('1.10.1', instances=7).series.get()
+        # Numéros d'instance en double : départagés par l'id
+        DicomInstance.objects.filter(instance_number__in=[5, 6]).update(instance_number=2)
+        expected = list(series.instances.order_by('instance_number', 'id').values_list('sop_instance_uid', flat=True))
+
+        url, uids = f'/api/dicom/series/{series.pk}/instances/?page_size=3&view=summary', []
+        while url:
+            body = self.client.get(url).json()
+            uids.extend(item['sop_instance_uid'] for item in body['results'])
+            url = body['next']
+        self.assertEqual(uids, expected)
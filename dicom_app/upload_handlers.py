@@ -0,0 +1,222 @@
+"""Réception des fichiers DICOM en un seul passage.
+
+Le gestionnaire d'upload par défaut de Django écrit le fichier dans un
+temporaire, que la vue recopiait ensuite dans un second temporaire avant de
+le relire pour Orthanc. Ici chaque bloc reçu est, au fil de l'eau :
+haché (SHA-256), conservé pour l'analyse de l'en-tête tant que celui-ci
+n'est pas complet, écrit dans le stockage définitif et transmis à Orthanc.
+
+L'envoi à Orthanc ne commence qu'une fois l'en-tête reçu : une instance
+dont le SOP Instance UID est déjà indexé (même fichier envoyé deux fois)
+n'est pas transmise, la vue la refusera comme doublon.
+"""
+import contextvars
+import hashlib
+import io
+import logging
+import os
+import queue
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .metadata import HEADER_READ_BYTES, parse_header, read_dataset
+from .models import DicomInstance
+from .orthanc import get_orthanc_client
+
+logger = logging.getLogger(__name__)
+
+# Blocs en attente d'envoi à Orthanc : au-delà, la réception attend Orthanc
+ORTHANC_QUEUE_CHUNKS = 64
+ORTHANC_UPLOAD_TIMEOUT = 300
+
+
+class OrthancStream:
+    """Envoi à Orthanc d'un corps reçu par blocs (transfert chunked), dans un thread."""
+
+    def __init__(self, client):
+        self.client = client
+        self.queue = queue.Queue(maxsize=ORTHANC_QUEUE_CHUNKS)
+        self.result = None
+        # Réponse d'Orthanc (identifiants de l'instance et de ses parents)
+        self.payload = None
+        # Le contexte (métriques de la requête en cours) suit l'envoi dans le thread
+        self.thread = threading.Thread(target=contextvars.copy_context().run, args=(self.run,), daemon=True)
+        self.thread.start()
+
+    def body(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def run(self):
+        try:
+            response = self.client.post(
+                '/instances', data=self.body(), headers={'Content-Type': 'application/dicom'}
+            )
+            self.result = response.status_code
+            if response.status_code == 200:
+                self.payload = response.json()
+        except Exception as e:
+            logger.warning("Envoi à Orthanc impossible: %s", e)
+            self.result = str(e)
+
+    def write(self, chunk):
+        # Si l'envoi a échoué, plus personne ne vide la file : on abandonne le bloc
+        while self.thread.is_alive():
+            try:
+                self.queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """Termine le corps et retourne le code HTTP d'Orthanc ou le message d'erreur."""
+        self.write(None)
+        self.thread.join(ORTHANC_UPLOAD_TIMEOUT)
+        return self.result
+
+
+def is_known_instance(head):
+    """Vrai si l'en-tête `head` désigne une instance déjà indexée."""
+    try:
+        dataset, _ = parse_header(io.BytesIO(head), ['SOPInstanceUID'])
+        sop_uid = dataset.get('SOPInstanceUID')
+    except Exception:
+        # En-tête illisible ou tronqué : la vue en décidera une fois le fichier reçu
+        return False
+    return bool(sop_uid) and DicomInstance.objects.filter(sop_instance_uid=str(sop_uid)).exists()
+
+
+class TeeUploadedFile(UploadedFile):
+    """Fichier déjà écrit dans le stockage, avec son empreinte et son en-tête DICOM.
+
+    `dataset` vaut None si le fichier n'a pas pu être lu comme DICOM ;
+    `orthanc_status` est le code HTTP d'Orthanc (ou le message d'erreur),
+    None si l'envoi n'était pas demandé ou si l'instance est déjà indexée ;
+    `orthanc_payload` sa réponse JSON
+    si l'instance a été acceptée.
+    """
+
+    def __init__(self, path, name, content_type, size, charset, sha256, dataset, orthanc_status,
+                 orthanc_payload=None):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset)
+        self.staged_path = path
+        self.sha256 = sha256
+        self.dataset = dataset
+        self.orthanc_status = orthanc_status
+        self.orthanc_payload = orthanc_payload
+
+    def temporary_file_path(self):
+        return self.staged_path
+
+    def discard(self):
+        """
+        Supprime le fichier reçu (upload refusé ou erreur) et, si l'envoi à
+        Orthanc vient de la créer, l'instance correspondante dans Orthanc.
+        """
+        self.close()
+        if os.path.exists(self.staged_path):
+            os.unlink(self.staged_path)
+        # « AlreadyStored » : l'instance existait déjà dans Orthanc, elle est conservée
+        if self.orthanc_payload and self.orthanc_payload.get('Status') == 'Success':
+            try:
+                response = get_orthanc_client().delete(f"/instances/{self.orthanc_payload['ID']}")
+                if response.status_code not in (200, 404):
+                    logger.warning("Instance Orthanc %s non supprimée (%s)", self.orthanc_payload['ID'],
+                                   response.status_code)
+            except Exception as e:
+                logger.warning("Instance Orthanc %s non supprimée : %s", self.orthanc_payload['ID'], e)
+            self.orthanc_payload = None
+
+
+class DicomTeeUploadHandler(FileUploadHandler):
+    """Gestionnaire d'upload écrivant directement dans DICOM_STORAGE_ROOT.
+
+    Le fichier est créé sous DICOM_STORAGE_ROOT/.incoming/ : avec le
+    stockage local, le ranger ensuite sous sa clé (ingest.store_file) est
+    un simple renommage sur le même système de fichiers.
+    """
+
+    def __init__(self, request=None, forward_to_orthanc=True):
+        super().__init__(request)
+        self.forward_to_orthanc = forward_to_orthanc
+        self.incoming = os.path.join(settings.DICOM_STORAGE_ROOT, '.incoming')
+        self.path = None
+        self.stream = None
+        # Blocs reçus avant que l'en-tête permette de décider de l'envoi
+        self.pending = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        os.makedirs(self.incoming, exist_ok=True)
+        self.path = os.path.join(self.incoming, uuid.uuid4().hex)
+        self.file = open(self.path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.header = bytearray()
+        self.stream = None
+        self.pending = [] if self.forward_to_orthanc else None
+
+    def start_forward(self):
+        """En-tête reçu : ouvre l'envoi à Orthanc avec les blocs en attente, sauf doublon."""
+        pending, self.pending = self.pending, None
+        if is_known_instance(bytes(self.header)):
+            logger.info("Instance déjà indexée : %s n'est pas transmis à Orthanc", self.file_name)
+            return
+        self.stream = OrthancStream(get_orthanc_client())
+        for chunk in pending:
+            self.stream.write(chunk)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        # Premiers octets conservés pour lire l'en-tête sans relire le fichier
+        if len(self.header) < HEADER_READ_BYTES:
+            self.header += raw_data[:HEADER_READ_BYTES - len(self.header)]
+        self.file.write(raw_data)
+        if self.pending is not None:
+            self.pending.append(raw_data)
+            if len(self.header) >= HEADER_READ_BYTES:
+                self.start_forward()
+        elif self.stream:
+            self.stream.write(raw_data)
+        # Bloc consommé : les gestionnaires suivants ne le reçoivent pas
+        return None
+
+    def file_complete(self, file_size):
+        self.file.close()
+        if self.pending is not None:
+            self.start_forward()
+        orthanc_status = self.stream.close() if self.stream else None
+        orthanc_payload = self.stream.payload if self.stream else None
+        path, self.path, self.stream = self.path, None, None
+        try:
+            dataset = read_dataset(path, head=bytes(self.header))
+        except Exception:
+            dataset = None
+        return TeeUploadedFile(
+            path,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.sha256.hexdigest(),
+            dataset,
+            orthanc_status,
+            orthanc_payload,
+        )
+
+    def upload_interrupted(self):
+        # Appelé aussi lorsque la requête ne contenait aucun fichier
+        if self.path is None:
+            return
+        if self.stream:
+            self.stream.close()
+        self.file.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.path = self.stream = self.pending = None
@@ -1,15 +1,43 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DicomStudyViewSet, DicomSeriesViewSet, DicomInstanceViewSet
-from .dicom_web import WADOView, QIDOView
+from .views import DicomStudyViewSet, DicomSeriesViewSet, DicomInstanceViewSet, IngestJobViewSet
+from .dicom_web import (
+    WADOView, QIDOView, SeriesQidoView, InstancesQidoView,
+    WadoRSView, FramesRSView, MetadataRSView, StudiesRSView, StudyRSView
+)
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'studies', DicomStudyViewSet)
 router.register(r'series', DicomSeriesViewSet)
 router.register(r'instances', DicomInstanceViewSet)
+router.register(r'jobs', IngestJobViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('wado/', WADOView.as_view(), name='wado'),
     path('qido/', QIDOView.as_view(), name='qido'),
+    # QIDO-RS (et STOW-RS sur /studies)
+    path('dicom-web/studies', StudiesRSView.as_view(), name='qido-studies'),
+    path('dicom-web/studies/<str:study_uid>/series', SeriesQidoView.as_view(), name='qido-study-series'),
+    path('dicom-web/studies/<str:study_uid>/series/<str:series_uid>/instances',
+         InstancesQidoView.as_view(), name='qido-series-instances'),
+    path('dicom-web/studies/<str:study_uid>/instances', InstancesQidoView.as_view(), name='qido-study-instances'),
+    path('dicom-web/series', SeriesQidoView.as_view(), name='qido-series'),
+    path('dicom-web/instances', InstancesQidoView.as_view(), name='qido-instances'),
+    # WADO-RS
+    path('dicom-web/studies/<str:study_uid>', StudyRSView.as_view(), name='wado-rs-study'),
+    path('dicom-web/studies/<str:study_uid>/metadata', MetadataRSView.as_view(), name='wado-rs-study-metadata'),
+    path('dicom-web/studies/<str:study_uid>/series/<str:series_uid>', WadoRSView.as_view(), name='wado-rs-series'),
+    path('dicom-web/studies/<str:study_uid>/series/<str:series_uid>/metadata',
+         MetadataRSView.as_view(), name='wado-rs-series-metadata'),
+    path('dicom-web/studies/<str:study_uid>/series/<str:series_uid>/instances/<str:instance_uid>',
+         WadoRSView.as_view(), name='wado-rs-instance'),
+    path('dicom-web/studies/<str:study_uid>/series/<str:series_uid>/instances/<str:instance_uid>/metadata',
+         MetadataRSView.as_view(), name='wado-rs-instance-metadata'),
+    path('dicom-web/studies/<str:study_uid>/series/<str:series_uid>/instances/<str:instance_uid>/frames/<str:frames>',
+         FramesRSView.as_view(), name='wado-rs-frames'),
+    path('async/wado/', async_views.wado, name='async-wado'),
+    path('async/qido/', async_views.qido, name='async-qido'),
+    path('async/studies/', async_views.stow, name='async-stow'),
 ] 
\ No newline at end of file
@@ -3,32 +3,101 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-import os
-import tempfile
-import requests
+from rest_framework.exceptions import ValidationError
+import logging
 from django.conf import settings
-from .models import DicomStudy, DicomSeries, DicomInstance
-from .serializers import DicomStudySerializer, DicomSeriesSerializer, DicomInstanceSerializer
-from .permissions import IsDicomStudyParticipant, CanUploadDicom, CanDeleteDicom
-from .utils import extract_dicom_metadata
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from .models import DicomStudy, DicomSeries, DicomInstance, IngestJob
+from .serializers import (
+    DicomStudySerializer, DicomStudySeriesSerializer, DicomStudySummarySerializer,
+    DicomSeriesSerializer, DicomSeriesSummarySerializer,
+    DicomInstanceSerializer, DicomInstanceSummarySerializer, IngestJobSerializer
+)
+from medical.cache import etag_matches
+from medical.pagination import KeysetPagination
+from .pagination import InstanceCursorPagination
+from .permissions import IsDicomStudyParticipant, CanUploadDicom, CanDeleteDicom, upload_patient_error
+from .ingest import ingest_uploads, push_to_orthanc, store_file, STORED, DUPLICATE, FAILED
+from . import series_metadata
+from .deletion import delete_objects, delete_unreferenced_files
+from .orthanc_ids import record_stored
+from .jobs import enqueue_ingest_job
+from .upload_handlers import DicomTeeUploadHandler
+from .rendering import (
+    FrameNotFound, RenderingError, parse_int, parse_render_params, prewarm_thumbnails,
+    render_key, rendered_image, thumbnail_params,
+)
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
-class DicomStudyViewSet(viewsets.ModelViewSet):
+def deletion_error(error, message):
+    """Réponse d'erreur d'une suppression refusée ou échouée côté Orthanc."""
+    if error.status_code == status.HTTP_403_FORBIDDEN:
+        logger.warning("Suppression refusée par Orthanc : %s", error)
+        return Response(
+            {'error': 'Permission refusée par le serveur DICOM'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return Response(
+        {'error': f'{message}: {error}'},
+        status=status.HTTP_500_INTERNAL_SERVER_ERROR
+    )
+
+class RepresentationModeMixin:
+    """
+    Choix de la représentation en lecture via ?view=<mode>.
+    `view_modes` associe chaque mode accepté à un serializer ; les autres
+    actions (création, mise à jour...) gardent `serializer_class`.
+    """
+    view_modes = {}
+    default_view_mode = 'full'
+
+    def get_view_mode(self):
+        if self.request is None:
+            return self.default_view_mode
+        mode = self.request.query_params.get('view', self.default_view_mode)
+        if mode not in self.view_modes:
+            raise ValidationError({'view': f"Valeurs possibles : {', '.join(self.view_modes)}"})
+        return mode
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            return self.view_modes[self.get_view_mode()]
+        return super().get_serializer_class()
+
+class DicomStudyViewSet(RepresentationModeMixin, viewsets.ModelViewSet):
+    """
+    Études DICOM du patient ou du médecin connecté.
+    ?view=summary : colonnes de l'étude et compteurs uniquement (listes de travail),
+    ?view=series : avec les séries sans leurs instances, ?view=full (défaut) : tout.
+    """
     queryset = DicomStudy.objects.all()
     serializer_class = DicomStudySerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsDicomStudyParticipant, CanDeleteDicom]
+    view_modes = {
+        'summary': DicomStudySummarySerializer,
+        'series': DicomStudySeriesSerializer,
+        'full': DicomStudySerializer,
+    }
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return DicomStudy.objects.filter(patient=user)
-        elif user.role == 'DOCTOR':
-            return DicomStudy.objects.filter(doctor=user)
         # Les secrétaires n'ont pas accès aux études DICOM
-        return DicomStudy.objects.none()
+        queryset = IsDicomStudyParticipant().filter_queryset(self.request, DicomStudy.objects.all())
+        if self.action in ('list', 'retrieve'):
+            # Participants, séries et instances chargés en requêtes groupées
+            mode = self.get_view_mode()
+            if mode == 'summary':
+                queryset = queryset.with_counts()
+            elif mode == 'series':
+                queryset = queryset.with_series()
+            else:
+                queryset = queryset.with_details()
+        return queryset
 
     @action(detail=True, methods=['get'])
     def viewer_url(self, request, pk=None):
@@ -41,7 +110,7 @@ class DicomStudyViewSet(viewsets.ModelViewSet):
         study_params = {
             'studyInstanceUID': study.study_instance_uid,
             'wadoURL': f"{settings.DICOM_WEB_URL}/wado",  # URL du serveur DICOM Web
-            'qidoURL': f"{settings.DICOM_WEB_URL}/qido",  # URL pour les requêtes QIDO
+            'qidoURL': f"{settings.DICOM_WEB_URL}/dicom-web",  # Racine QIDO-RS (studies, series, instances)
             'wadoURL': f"{settings.DICOM_WEB_URL}/wado",  # URL pour les requêtes WADO
         }
         
@@ -59,77 +128,78 @@ class DicomStudyViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def upload_dicom(self, request):
-        print("=== Début de l'upload DICOM (UIDs minimaux) ===")
-        print(f"Utilisateur: {request.user}")
-        print(f"Rôle: {request.user.role}")
-
         if not CanUploadDicom().has_permission(request, self):
-            print("Permission refusée pour l'upload")
+            logger.info("Upload DICOM refusé pour l'utilisateur %s (rôle %s)", request.user.pk, request.user.role)
             return Response(
                 {'error': 'Permission denied'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
+        # Patient dans l'URL (?patient=) : contrôlé avant la réception, le
+        # fichier peut être envoyé à Orthanc au fil de l'eau. Sinon (champ du
+        # formulaire), il n'est transmis qu'une fois le patient vérifié et
+        # l'instance enregistrée.
+        patient_id = request.query_params.get('patient')
+        streamed = bool(patient_id)
+        if streamed:
+            refusal = upload_patient_error(request.user, patient_id)
+            if refusal:
+                return Response({'error': refusal[0]}, status=refusal[1])
+
+        # Doit précéder la lecture de request.FILES : le fichier est haché,
+        # analysé et écrit dans le stockage pendant la réception.
+        request.upload_handlers = [DicomTeeUploadHandler(request, forward_to_orthanc=streamed)]
         dicom_file = request.FILES.get('file')
-        patient_id = request.POST.get('patient')
+        form_patient_id = request.POST.get('patient')
+        if streamed and form_patient_id and form_patient_id != patient_id:
+            if dicom_file:
+                dicom_file.discard()
+            return Response(
+                {'error': "Patient différent dans l'URL et dans le formulaire"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        patient_id = patient_id or form_patient_id
 
-        print(f"Fichier reçu: {dicom_file.name if dicom_file else 'None'}")
-        print(f"ID du patient: {patient_id}")
+        logger.debug("Upload DICOM: fichier %s, patient %s", dicom_file.name if dicom_file else None, patient_id)
 
         if not dicom_file:
-            print("Erreur: Aucun fichier fourni")
             return Response(
                 {'error': 'No file provided'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if not patient_id:
-            print("Erreur: ID du patient manquant")
-            return Response(
-                {'error': 'Patient ID is required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        refusal = upload_patient_error(request.user, patient_id)
+        if refusal:
+            dicom_file.discard()
+            return Response({'error': refusal[0]}, status=refusal[1])
 
         import uuid
         from datetime import date
+        saved = False
         try:
-            # Sauvegarder temporairement le fichier
-            print("Sauvegarde temporaire du fichier...")
-            temp_file = tempfile.NamedTemporaryFile(delete=False)
-            for chunk in dicom_file.chunks():
-                temp_file.write(chunk)
-            temp_file.close()
-            print(f"Fichier temporaire créé: {temp_file.name}")
-
-            # Fonction utilitaire locale pour extraire les UIDs minimaux
-            def extract_minimal_dicom_uids(file_path):
-                try:
-                    import pydicom
-                    ds = pydicom.dcmread(file_path, stop_before_pixels=True)
-                    study_uid = getattr(ds, 'StudyInstanceUID', None)
-                    series_uid = getattr(ds, 'SeriesInstanceUID', None)
-                    sop_uid = getattr(ds, 'SOPInstanceUID', None)
-                    return {
-                        'study_instance_uid': str(study_uid) if study_uid else None,
-                        'series_instance_uid': str(series_uid) if series_uid else None,
-                        'sop_instance_uid': str(sop_uid) if sop_uid else None,
-                    }
-                except Exception as e:
-                    print(f"Impossible d'extraire les UIDs DICOM: {e}")
-                    return {
-                        'study_instance_uid': None,
-                        'series_instance_uid': None,
-                        'sop_instance_uid': None,
-                    }
-
-            # Extraire les UIDs minimaux
-            uids = extract_minimal_dicom_uids(temp_file.name)
-            print(f"UIDs extraits: {uids}")
+            # UIDs minimaux, lus dans l'en-tête pendant la réception
+            ds = dicom_file.dataset
+            uids = {
+                'study_instance_uid': getattr(ds, 'StudyInstanceUID', None),
+                'series_instance_uid': getattr(ds, 'SeriesInstanceUID', None),
+                'sop_instance_uid': getattr(ds, 'SOPInstanceUID', None),
+            }
+            logger.debug("UIDs extraits: %s", uids)
 
             # Générer des identifiants si absents
-            study_instance_uid = uids['study_instance_uid'] or str(uuid.uuid4())
-            series_instance_uid = uids['series_instance_uid'] or str(uuid.uuid4())
-            sop_instance_uid = uids['sop_instance_uid'] or str(uuid.uuid4())
+            study_instance_uid = str(uids['study_instance_uid'] or uuid.uuid4())
+            series_instance_uid = str(uids['series_instance_uid'] or uuid.uuid4())
+            sop_instance_uid = str(uids['sop_instance_uid'] or uuid.uuid4())
+
+            # Même instance ou même contenu déjà stocké : une seule requête, aucune écriture
+            if DicomInstance.objects.filter(
+                Q(sop_instance_uid=sop_instance_uid) | Q(content_hash=dicom_file.sha256)
+            ).exists():
+                dicom_file.discard()
+                return Response(
+                    {'error': 'Instance DICOM déjà importée'},
+                    status=status.HTTP_409_CONFLICT
+                )
 
             # Créer l'étude DICOM (ou la retrouver si déjà existante pour ce patient et ce fichier)
             study, created = DicomStudy.objects.get_or_create(
@@ -140,10 +210,12 @@ class DicomStudyViewSet(viewsets.ModelViewSet):
                     'study_date': date.today(),
                     'study_description': 'Étude DICOM (UIDs minimaux)',
                     'study_id': study_instance_uid,
-                    'accession_number': ''
+                    'accession_number': '',
+                    'patient_name': str(getattr(ds, 'PatientName', '')),
+                    'dicom_patient_id': str(getattr(ds, 'PatientID', ''))
                 }
             )
-            print(f"Étude {'créée' if created else 'récupérée'}: {study}")
+            logger.debug("Étude %s %s", study.pk, 'créée' if created else 'récupérée')
 
             # Créer la série DICOM
             series, created = DicomSeries.objects.get_or_create(
@@ -156,171 +228,314 @@ class DicomStudyViewSet(viewsets.ModelViewSet):
                     'number_of_instances': 1
                 }
             )
-            print(f"Série {'créée' if created else 'récupérée'}: {series}")
+            logger.debug("Série %s %s", series.pk, 'créée' if created else 'récupérée')
 
-            # Envoyer le fichier à Orthanc (optionnel, peut être commenté si non utilisé)
-            try:
-                print("Envoi du fichier à Orthanc...")
-                orthanc_url = 'http://localhost:8042/instances'
-                with open(temp_file.name, 'rb') as f:
-                    response = requests.post(orthanc_url, data=f)
-                    print(f"Réponse Orthanc: {response.status_code} - {response.text}")
-            except Exception as e:
-                print(f"Erreur lors de l'envoi à Orthanc (ignorée): {e}")
-
-            # Créer l'instance DICOM
-            instance = DicomInstance.objects.create(
+            # Avec ?patient=, l'envoi à Orthanc a eu lieu pendant la réception (erreur ignorée)
+            logger.debug("Réponse Orthanc: %s", dicom_file.orthanc_status)
+
+            # Le fichier reçu est déjà sur le disque : simple renommage vers sa clé
+            instance = DicomInstance(
                 series=series,
                 sop_instance_uid=sop_instance_uid,
+                sop_class_uid=str(getattr(ds, 'SOPClassUID', '')),
                 instance_number=1,
-                file_path=temp_file.name,  # Chemin local temporaire
-                file_size=dicom_file.size
+                file_size=dicom_file.size,
+                content_hash=dicom_file.sha256
             )
-            print(f"Instance créée: {instance}")
+            dicom_file.close()
+            metadata_entry = series_metadata.file_entry(
+                dicom_file.staged_path, study_instance_uid, series_instance_uid, sop_instance_uid
+            )
+            instance.file_path = store_file(dicom_file.staged_path, instance)
+            try:
+                with transaction.atomic():
+                    instance.save()
+                    series_metadata.add_instances(series, [metadata_entry])
+                saved = True
+            except Exception:
+                # Fichier rangé mais instance non enregistrée : il resterait orphelin
+                delete_unreferenced_files({instance.file_path})
+                raise
+            if dicom_file.orthanc_payload:
+                record_stored({instance.file_path: dicom_file.orthanc_payload})
+            elif not streamed:
+                # Patient vérifié et instance enregistrée : envoi à Orthanc (erreur ignorée)
+                push_to_orthanc([instance.file_path])
+            logger.info("Instance DICOM %s importée (série %s)", instance.pk, series.pk)
+            prewarm_thumbnails([instance.file_path])
 
             # Retourner les données de l'étude avec les séries
             serializer = self.get_serializer(study)
-            print("=== Upload DICOM terminé avec succès (UIDs minimaux) ===")
             return Response({
                 'message': 'DICOM file uploaded successfully (minimal UIDs)',
                 'study': serializer.data
             })
 
         except Exception as e:
-            print(f"=== Erreur lors de l'upload DICOM: {str(e)} ===")
-            if 'temp_file' in locals():
-                print("Nettoyage du fichier temporaire après erreur...")
-                os.unlink(temp_file.name)
+            logger.exception("Échec de l'upload DICOM")
+            if not saved:
+                dicom_file.discard()
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """
+        Suppression groupée : {"ids": [...]}. Les études sont supprimées
+        d'Orthanc en parallèle, puis de la base en une transaction. Retourne
+        les études supprimées et, pour les autres, la raison de l'échec.
+        """
+        ids = request.data.get('ids')
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in ids)) if isinstance(ids, list) else None
+        except (TypeError, ValueError):
+            ids = None
+        if not ids:
+            return Response(
+                {'error': "Une liste d'identifiants d'études (ids) est requise"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ids) > settings.DICOM_BULK_DELETE_MAX:
+            return Response(
+                {'error': f'Au plus {settings.DICOM_BULK_DELETE_MAX} études par requête'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        studies = {study.pk: study for study in self.get_queryset().filter(pk__in=ids)}
+        failed = [{'id': pk, 'error': 'Not found'} for pk in ids if pk not in studies]
+        allowed = []
+        for study in studies.values():
+            if CanDeleteDicom().has_object_permission(request, self, study):
+                allowed.append(study)
+            else:
+                failed.append({'id': study.pk, 'error': 'Permission denied'})
+
+        deleted, failures = delete_objects('studies', allowed)
+        failed.extend({'id': pk, 'error': str(error)} for pk, error in failures.items())
+        return Response({'deleted': deleted, 'failed': failed})
+
+    @action(detail=False, methods=['post'])
+    def upload_batch(self, request):
+        """
+        Ingestion groupée : plusieurs fichiers DICOM (champ `files`) et/ou des
+        archives ZIP, pour un patient. Retourne un rapport par fichier.
+        """
+        if not CanUploadDicom().has_permission(request, self):
+            return Response(
+                {'error': 'Permission denied'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        uploaded_files = request.FILES.getlist('files') + request.FILES.getlist('archive')
+        patient_id = request.POST.get('patient')
+
+        if not uploaded_files:
+            return Response(
+                {'error': 'No file provided'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        refusal = upload_patient_error(request.user, patient_id)
+        if refusal:
+            return Response({'error': refusal[0]}, status=refusal[1])
+
+        report = ingest_uploads(uploaded_files, patient_id, request.user)
+        return Response({
+            'stored': sum(1 for r in report if r['status'] == STORED),
+            'duplicates': sum(1 for r in report if r['status'] == DUPLICATE),
+            'failed': sum(1 for r in report if r['status'] == FAILED),
+            'files': report,
+        })
+
     def destroy(self, request, *args, **kwargs):
-        print("=== Début de la suppression de l'étude DICOM ===")
         try:
             # Récupérer l'étude
             study = self.get_object()
-            print(f"Étude à supprimer: {study}")
-            print(f"UID de l'étude: {study.study_instance_uid}")
-            print(f"Patient: {study.patient}")
-            print(f"Médecin: {study.doctor}")
-            print(f"Utilisateur actuel: {request.user}")
+            logger.debug("Suppression de l'étude %s (%s)", study.pk, study.study_instance_uid)
             
             # Vérifier les permissions
             if not CanDeleteDicom().has_object_permission(request, self, study):
-                print("Permission refusée pour la suppression")
+                logger.info("Suppression de l'étude %s refusée pour l'utilisateur %s", study.pk, request.user.pk)
                 return Response(
                     {'error': 'Vous n\'avez pas la permission de supprimer cette étude DICOM'},
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Vérifier si l'étude existe dans Orthanc
-            print("Vérification de l'existence de l'étude dans Orthanc...")
-            check_url = f'http://localhost:8042/studies/{study.study_instance_uid}'
-            check_response = requests.get(check_url)
-            
-            if check_response.status_code == 404:
-                print("L'étude n'existe pas dans Orthanc, suppression uniquement de la base de données")
-                study.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            
-            # Supprimer l'étude d'Orthanc
-            print("Suppression de l'étude d'Orthanc...")
-            orthanc_url = f'http://localhost:8042/studies/{study.study_instance_uid}'
-            print(f"URL Orthanc: {orthanc_url}")
-            
-            response = requests.delete(orthanc_url)
-            print(f"Réponse Orthanc: {response.status_code} - {response.text}")
-            
-            if response.status_code == 200:
-                print("Suppression de l'étude de la base de données...")
-                study.delete()
-                print("=== Suppression de l'étude DICOM terminée avec succès ===")
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            
-            # Gestion des erreurs spécifiques d'Orthanc
-            if response.status_code == 404:
-                print("L'étude n'existe pas dans Orthanc, suppression uniquement de la base de données")
-                study.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            elif response.status_code == 403:
-                print("Permission refusée par Orthanc")
-                return Response(
-                    {'error': 'Permission refusée par le serveur DICOM'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-            else:
-                print(f"Erreur Orthanc: {response.text}")
-                return Response(
-                    {'error': f'Erreur lors de la suppression de l\'étude: {response.text}'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-                
+            deleted, failures = delete_objects('studies', [study])
+            if failures:
+                return deletion_error(failures[study.pk], "Erreur lors de la suppression de l'étude")
+            logger.info("Étude DICOM %s supprimée", study.study_instance_uid)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
         except Exception as e:
-            print(f"=== Erreur lors de la suppression de l'étude DICOM: {str(e)} ===")
+            logger.exception("Échec de la suppression de l'étude DICOM")
             return Response(
                 {'error': f'Une erreur est survenue lors de la suppression: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class DicomSeriesViewSet(viewsets.ModelViewSet):
+class DicomSeriesViewSet(RepresentationModeMixin, viewsets.ModelViewSet):
+    """
+    Séries DICOM. ?view=summary omet les instances, à parcourir ensuite
+    page par page via /series/<id>/instances/ (pagination par curseur).
+    """
     queryset = DicomSeries.objects.all()
     serializer_class = DicomSeriesSerializer
     permission_classes = [IsAuthenticated, IsDicomStudyParticipant]
+    view_modes = {
+        'summary': DicomSeriesSummarySerializer,
+        'full': DicomSeriesSerializer,
+    }
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return DicomSeries.objects.filter(study__patient=user)
-        elif user.role == 'DOCTOR':
-            return DicomSeries.objects.filter(study__doctor=user)
         # Les secrétaires n'ont pas accès aux séries DICOM
-        return DicomSeries.objects.none()
+        queryset = IsDicomStudyParticipant().filter_queryset(
+            self.request, DicomSeries.objects.all(), 'study__patient', 'study__doctor'
+        )
+        if self.action in ('list', 'retrieve'):
+            if self.get_view_mode() == 'summary':
+                queryset = queryset.with_instance_count()
+            else:
+                queryset = queryset.with_instances()
+        return queryset
+
+    def destroy(self, request, *args, **kwargs):
+        series = self.get_object()
+        if not CanDeleteDicom().has_object_permission(request, self, series):
+            return Response(
+                {'error': 'Vous n\'avez pas la permission de supprimer cette série DICOM'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            deleted, failures = delete_objects('series', [series])
+            if failures:
+                return deletion_error(failures[series.pk], 'Erreur lors de la suppression de la série')
+            logger.info("Série DICOM %s supprimée", series.series_instance_uid)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        except Exception as e:
+            logger.exception("Échec de la suppression de la série DICOM")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=True, methods=['get'], pagination_class=InstanceCursorPagination)
+    def instances(self, request, pk=None):
+        series = self.get_object()
+        summary = request.query_params.get('view') == 'summary'
+        serializer_class = DicomInstanceSummarySerializer if summary else DicomInstanceSerializer
+        page = self.paginate_queryset(series.instances.all())
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
-class DicomInstanceViewSet(viewsets.ModelViewSet):
+class DicomInstanceViewSet(RepresentationModeMixin, viewsets.ModelViewSet):
     queryset = DicomInstance.objects.all()
     serializer_class = DicomInstanceSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsDicomStudyParticipant, CanDeleteDicom]
+    view_modes = {
+        'summary': DicomInstanceSummarySerializer,
+        'full': DicomInstanceSerializer,
+    }
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return DicomInstance.objects.filter(series__study__patient=user)
-        elif user.role == 'DOCTOR':
-            return DicomInstance.objects.filter(series__study__doctor=user)
         # Les secrétaires n'ont pas accès aux instances DICOM
-        return DicomInstance.objects.none()
+        return IsDicomStudyParticipant().filter_queryset(
+            self.request, DicomInstance.objects.all(), 'series__study__patient', 'series__study__doctor'
+        )
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, IsDicomStudyParticipant])
+    def rendered(self, request, pk=None):
+        """
+        Frame rendue en JPEG ou PNG, avec les paramètres de WADO-URI :
+        frameNumber, windowCenter/windowWidth, rows/columns, contentType,
+        imageQuality.
+        """
+        instance = self.get_object()
+        try:
+            params = parse_render_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.image_response(request, instance, params)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, IsDicomStudyParticipant])
+    def thumbnail(self, request, pk=None):
+        """Vignette JPEG de la première frame (?size=, côté maximal en pixels)."""
+        instance = self.get_object()
+        try:
+            size = parse_int(request.query_params, 'size', maximum=settings.DICOM_RENDER_MAX_SIZE)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.image_response(request, instance, thumbnail_params(size))
+
+    def image_response(self, request, instance, params):
+        if not instance.file_path:
+            return Response({'error': 'Fichier DICOM non disponible'}, status=status.HTTP_404_NOT_FOUND)
+        # Le contenu stocké ne change jamais : l'ETag se calcule sans rendu
+        etag = '"%s"' % render_key(instance.file_path, params)
+        headers = {'ETag': etag, 'Cache-Control': 'private, max-age=86400'}
+        if etag_matches(request, etag):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        try:
+            data = rendered_image(instance.file_path, params)
+        except FileNotFoundError:
+            return Response({'error': 'Fichier DICOM non disponible'}, status=status.HTTP_404_NOT_FOUND)
+        except FrameNotFound as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except RenderingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return HttpResponse(data, content_type=params['content_type'], headers=headers)
 
     def destroy(self, request, *args, **kwargs):
-        print("=== Début de la suppression DICOM ===")
         instance = self.get_object()
-        print(f"Instance à supprimer: {instance}")
-        print(f"UID de l'instance: {instance.sop_instance_uid}")
+        logger.debug("Suppression de l'instance %s (%s)", instance.pk, instance.sop_instance_uid)
         
         try:
-            # Supprimer l'instance d'Orthanc
-            print("Suppression de l'instance d'Orthanc...")
-            orthanc_url = f'http://localhost:8042/instances/{instance.sop_instance_uid}'
-            print(f"URL Orthanc: {orthanc_url}")
-            
-            response = requests.delete(orthanc_url)
-            print(f"Réponse Orthanc: {response.status_code} - {response.text}")
-            
-            if response.status_code == 200:
-                print("Suppression de l'instance de la base de données...")
-                instance.delete()
-                print("=== Suppression DICOM terminée avec succès ===")
-                return Response(status=status.HTTP_204_NO_CONTENT)
-                
-            print(f"Erreur Orthanc: {response.text}")
-            return Response(
-                {'error': 'Failed to delete instance from Orthanc'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            deleted, failures = delete_objects('instances', [instance])
+            if failures:
+                return deletion_error(failures[instance.pk], 'Failed to delete instance from Orthanc')
+            logger.info("Instance DICOM %s supprimée", instance.sop_instance_uid)
+            return Response(status=status.HTTP_204_NO_CONTENT)
         except Exception as e:
-            print(f"=== Erreur lors de la suppression DICOM: {str(e)} ===")
+            logger.exception("Échec de la suppression de l'instance DICOM")
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+class IngestJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Ingestion DICOM en arrière-plan : POST dépose les fichiers et retourne
+    immédiatement l'identifiant de la tâche (202), GET /jobs/<id>/ suit
+    l'avancement. Les tâches sont traitées par `manage.py run_ingest_worker`.
+    """
+    queryset = IngestJob.objects.all()
+    serializer_class = IngestJobSerializer
+    pagination_class = KeysetPagination
+    permission_classes = [IsAuthenticated, CanUploadDicom]
+
+    def get_queryset(self):
+        return IngestJob.objects.filter(created_by=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        uploaded_files = request.FILES.getlist('files') + request.FILES.getlist('archive')
+        patient_id = request.POST.get('patient')
+
+        if not uploaded_files:
+            return Response(
+                {'error': 'No file provided'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Contrôlé avant la mise en file : le worker ne peut plus répondre au client
+        refusal = upload_patient_error(request.user, patient_id)
+        if refusal:
+            return Response({'error': refusal[0]}, status=refusal[1])
+
+        job = enqueue_ingest_job(uploaded_files, patient_id, request.user)
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
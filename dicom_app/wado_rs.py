@@ -0,0 +1,297 @@
+"""Moteur WADO-RS : instances, frames et métadonnées d'une étude, série ou instance.
+
+Les fichiers sont lus dans le stockage DICOM (local ou S3) ; une instance
+absente du stockage est demandée à Orthanc (WADO-URI). Les instances sont
+relayées par blocs, sans charger d'objet complet en mémoire ; seules les
+frames et les métadonnées demandent de lire le fichier avec pydicom. Pour
+les frames, seul l'en-tête est analysé : les octets des frames demandées
+sont ensuite lus à leur position dans l'élément PixelData.
+"""
+import logging
+import struct
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from io import BytesIO
+
+import pydicom
+import requests
+from django.urls import reverse
+from pydicom.errors import InvalidDicomError
+from pydicom.uid import ExplicitVRLittleEndian
+
+from .models import DicomInstance
+from .multipart import iter_file
+from .orthanc import get_orthanc_client
+from .rendering import FrameNotFound
+from .storage import get_dicom_storage
+
+try:
+    from pydicom.encaps import generate_frames
+except ImportError:  # pydicom < 3
+    from pydicom.encaps import generate_pixel_data_frame
+
+    def generate_frames(buffer, *, number_of_frames=None):
+        # pydicom 2 ne lit les fragments que depuis des octets
+        if not isinstance(buffer, bytes):
+            buffer = buffer.read()
+        return generate_pixel_data_frame(buffer, number_of_frames)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Éléments plus longs remplacés par un BulkDataURI dans les métadonnées
+BULK_DATA_THRESHOLD = 1024
+
+# Syntaxe de transfert compressée -> type MIME des frames (PS3.18, table 8.7.3-2)
+FRAME_MEDIA_TYPES = {
+    '1.2.840.10008.1.2.4.50': 'image/jpeg',
+    '1.2.840.10008.1.2.4.51': 'image/jpeg',
+    '1.2.840.10008.1.2.4.57': 'image/jpeg',
+    '1.2.840.10008.1.2.4.70': 'image/jpeg',
+    '1.2.840.10008.1.2.4.80': 'image/jls',
+    '1.2.840.10008.1.2.4.81': 'image/jls',
+    '1.2.840.10008.1.2.4.90': 'image/jp2',
+    '1.2.840.10008.1.2.4.91': 'image/jp2',
+    '1.2.840.10008.1.2.5': 'image/x-dicom-rle',
+}
+NATIVE_FRAME_MEDIA_TYPE = 'application/octet-stream'
+
+InstanceRef = namedtuple('InstanceRef', 'study_uid series_uid sop_uid file_path')
+
+
+class InstanceUnavailable(Exception):
+    """Instance ni dans le stockage ni dans Orthanc."""
+
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def select_instances(studies, study_uid, series_uid=None, sop_uid=None):
+    """Instances de `studies` désignées par les UID, dans l'ordre des séries puis des instances."""
+    instances = DicomInstance.objects.filter(
+        series__study__in=studies, series__study__study_instance_uid=study_uid
+    )
+    if series_uid:
+        instances = instances.filter(series__series_instance_uid=series_uid)
+    if sop_uid:
+        instances = instances.filter(sop_instance_uid=sop_uid)
+    return [
+        InstanceRef(*row) for row in instances.order_by(
+            'series__series_number', 'series_id', 'instance_number', 'id'
+        ).values_list(
+            'series__study__study_instance_uid', 'series__series_instance_uid', 'sop_instance_uid', 'file_path'
+        )
+    ]
+
+
+@contextmanager
+def orthanc_instance(ref):
+    try:
+        response = get_orthanc_client().get('/wado', params={
+            'requestType': 'WADO',
+            'studyUID': ref.study_uid,
+            'seriesUID': ref.series_uid,
+            'objectUID': ref.sop_uid,
+            'contentType': 'application/dicom',
+        }, headers={'Accept-Encoding': 'identity'}, stream=True)
+    except requests.exceptions.RequestException as e:
+        raise InstanceUnavailable(f"Orthanc injoignable : {e}")
+    try:
+        if response.status_code != 200:
+            raise InstanceUnavailable(
+                f"Instance {ref.sop_uid} introuvable (Orthanc : {response.status_code})",
+                status_code=404 if response.status_code == 404 else 502,
+            )
+        yield response.raw
+    finally:
+        response.close()
+
+
+@contextmanager
+def open_instance(ref):
+    """Fichier de l'instance, depuis le stockage ou, à défaut, depuis Orthanc."""
+    with ExitStack() as stack:
+        source = None
+        if ref.file_path:
+            try:
+                source = stack.enter_context(get_dicom_storage().open(ref.file_path))
+            except FileNotFoundError:
+                logger.info("Instance %s absente du stockage, lue dans Orthanc", ref.sop_uid)
+        if source is None:
+            source = stack.enter_context(orthanc_instance(ref))
+        yield source
+
+
+@contextmanager
+def open_seekable(ref):
+    with open_instance(ref) as source:
+        # pydicom a besoin de se déplacer dans le fichier (flux S3 ou Orthanc)
+        yield source if source.seekable() else BytesIO(source.read())
+
+
+def parse_dataset(ref, source, **kwargs):
+    try:
+        return pydicom.dcmread(source, **kwargs)
+    except InvalidDicomError as e:
+        raise InstanceUnavailable(f"Instance {ref.sop_uid} illisible : {e}")
+
+
+def read_dataset(ref, **kwargs):
+    with open_seekable(ref) as source:
+        return parse_dataset(ref, source, **kwargs)
+
+
+def instance_parts(refs, location):
+    """
+    Parties application/dicom des instances `refs`, lues par blocs ;
+    `location(ref)` donne leur Content-Location. Une instance introuvable
+    est omise : le statut de la réponse est déjà parti.
+    """
+    for ref in refs:
+        try:
+            with open_instance(ref) as source:
+                yield 'application/dicom', {'Content-Location': location(ref)}, iter_file(source, CHUNK_SIZE)
+        except InstanceUnavailable as e:
+            logger.warning("Instance %s omise de la réponse WADO-RS : %s", ref.sop_uid, e)
+
+
+def parse_frame_list(value):
+    """'1,3,5' -> [1, 3, 5] ; lève ValueError."""
+    try:
+        numbers = [int(part) for part in value.split(',')]
+    except ValueError:
+        raise ValueError(f"Liste de frames invalide : {value}")
+    if not numbers or min(numbers) < 1:
+        raise ValueError(f"Liste de frames invalide : {value}")
+    return numbers
+
+
+def frame_media_type(transfer_syntax):
+    if transfer_syntax.is_compressed:
+        media_type = FRAME_MEDIA_TYPES.get(transfer_syntax, NATIVE_FRAME_MEDIA_TYPE)
+        return media_type, f'{media_type}; transfer-syntax={transfer_syntax}'
+    # Pixels natifs : même contenu en Explicit et Implicit VR Little Endian
+    if transfer_syntax.is_little_endian:
+        return NATIVE_FRAME_MEDIA_TYPE, f'{NATIVE_FRAME_MEDIA_TYPE}; transfer-syntax={ExplicitVRLittleEndian}'
+    return NATIVE_FRAME_MEDIA_TYPE, NATIVE_FRAME_MEDIA_TYPE
+
+
+def pixel_data_length(fp, transfer_syntax):
+    """
+    Lit l'en-tête de l'élément PixelData qui commence à la position de `fp`
+    et laisse `fp` au début de sa valeur. Retourne la longueur de la valeur
+    (0xFFFFFFFF si encapsulée), ou None si l'élément n'est pas PixelData.
+    """
+    endian = '<' if transfer_syntax.is_little_endian else '>'
+    header = fp.read(8)
+    if len(header) < 8 or struct.unpack(f'{endian}HH', header[:4]) != (0x7FE0, 0x0010):
+        return None
+    if transfer_syntax.is_implicit_VR:
+        return struct.unpack(f'{endian}L', header[4:])[0]
+    # VR explicite OB/OW : 2 octets réservés, puis la longueur sur 4 octets
+    length = fp.read(4)
+    return struct.unpack(f'{endian}L', length)[0] if len(length) == 4 else None
+
+
+def read_frames(ref, numbers):
+    """
+    Frames `numbers` (à partir de 1) de l'instance, telles qu'encodées dans
+    le fichier : (type des parties, type MIME de chaque frame, [octets]).
+    L'en-tête est lu jusqu'à PixelData, puis seules les frames demandées
+    (natives) ou les fragments qui les précèdent (encapsulées) sont lus.
+    """
+    with open_seekable(ref) as source:
+        ds = parse_dataset(ref, source, stop_before_pixels=True)
+        transfer_syntax = ds.file_meta.TransferSyntaxUID
+        if transfer_syntax.is_deflated:
+            # Les positions dans le fichier ne sont pas celles du dataset décompressé
+            source.seek(0)
+            return dataset_frames(parse_dataset(ref, source), numbers)
+        if pixel_data_length(source, transfer_syntax) is None:
+            raise FrameNotFound("Instance sans données de pixels")
+        frame_count = check_frame_numbers(ds, numbers)
+        part_type, media_type = frame_media_type(transfer_syntax)
+
+        if transfer_syntax.is_compressed:
+            frames = generate_frames(source, number_of_frames=frame_count)
+            return part_type, media_type, select_frames(frames, numbers)
+
+        frame_length = native_frame_length(ds)
+        value_start = source.tell()
+        frames = []
+        for number in numbers:
+            source.seek(value_start + (number - 1) * frame_length)
+            frame = source.read(frame_length)
+            if len(frame) < frame_length:
+                raise InstanceUnavailable(f"Instance {ref.sop_uid} tronquée")
+            frames.append(frame)
+        return part_type, media_type, frames
+
+
+def dataset_frames(ds, numbers):
+    """Frames `numbers` d'un dataset entièrement lu (syntaxe de transfert deflate, pixels natifs)."""
+    if 'PixelData' not in ds:
+        raise FrameNotFound("Instance sans données de pixels")
+    check_frame_numbers(ds, numbers)
+    part_type, media_type = frame_media_type(ds.file_meta.TransferSyntaxUID)
+    frame_length = native_frame_length(ds)
+    pixel_data = ds.PixelData
+    return part_type, media_type, [
+        pixel_data[(number - 1) * frame_length:number * frame_length] for number in numbers
+    ]
+
+
+def check_frame_numbers(ds, numbers):
+    """Nombre de frames de `ds` ; lève FrameNotFound si un numéro le dépasse."""
+    frame_count = int(ds.get('NumberOfFrames', 1) or 1)
+    missing = [number for number in numbers if number > frame_count]
+    if missing:
+        raise FrameNotFound(f"Frame(s) {missing} inexistante(s) ({frame_count} frame(s))")
+    return frame_count
+
+
+def native_frame_length(ds):
+    return ds.Rows * ds.Columns * ds.get('SamplesPerPixel', 1) * ds.BitsAllocated // 8
+
+
+def select_frames(frames, numbers):
+    """Frames `numbers` parmi `frames` (itérable, à partir de 1), lues jusqu'à la dernière demandée."""
+    wanted = set(numbers)
+    selected = {}
+    for number, frame in enumerate(frames, start=1):
+        if number in wanted:
+            selected[number] = frame
+        if len(selected) == len(wanted):
+            break
+    return [selected[number] for number in numbers]
+
+
+def instance_uri(study_uid, series_uid, sop_uid):
+    """Chemin WADO-RS de l'instance, indépendant de l'hôte : BulkDataURI des métadonnées."""
+    return reverse('wado-rs-instance', kwargs={
+        'study_uid': study_uid, 'series_uid': series_uid, 'instance_uid': sop_uid,
+    })
+
+
+def dataset_json(ds, uri):
+    """
+    DICOM JSON d'un dataset lu sans ses pixels : les éléments volumineux et
+    les pixels sont remplacés par un BulkDataURI vers l'instance (`uri`).
+    """
+    data = ds.to_json_dict(
+        bulk_data_threshold=BULK_DATA_THRESHOLD,
+        bulk_data_element_handler=lambda element: uri,
+        suppress_invalid_tags=True,
+    )
+    if 'Rows' in ds:
+        transfer_syntax = ds.file_meta.get('TransferSyntaxUID')
+        vr = 'OB' if transfer_syntax is not None and transfer_syntax.is_compressed else 'OW'
+        data['7FE00010'] = {'vr': vr, 'BulkDataURI': uri}
+    return data
+
+
+def instance_metadata(ref):
+    """Métadonnées DICOM JSON de l'instance, lues dans son fichier."""
+    ds = read_dataset(ref, stop_before_pixels=True)
+    return dataset_json(ds, instance_uri(ref.study_uid, ref.series_uid, ref.sop_uid))
@@ -303,7 +303,7 @@ const PatientMedicalRecord = () => {
             const formData = new FormData();
             formData.append('file', selectedFile);
             formData.append('patient', patientId);
-            const response = await axios.post('http://localhost:8000/api/dicom/studies/upload_dicom/', formData, {
+            const response = await axios.post(`http://localhost:8000/api/dicom/studies/upload_dicom/?patient=${patientId}`, formData, {
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Content-Type': 'multipart/form-data'
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MedicalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'medical'
+
+    def ready(self):
+        # Invalidation du cache des relations patient-médecin
+        from . import signals  # noqa: F401
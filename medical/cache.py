@@ -0,0 +1,138 @@
+"""Cache partagé des réponses des endpoints lus en boucle (hôpitaux, médecins, profil).
+
+Une réponse est mise en cache sous une clé formée de l'endpoint, de la
+portée de l'utilisateur (rôle, hôpital, voire identifiant quand la réponse
+lui est propre), des paramètres de requête et de la version des données
+dont elle dépend. Toute écriture sur Hospital, User ou PatientDoctor
+incrémente la version correspondante (medical.signals) : les anciennes
+entrées ne sont plus jamais lues et expirent d'elles-mêmes. Le mécanisme
+ne repose que sur get/set/incr et fonctionne avec LocMemCache comme avec
+Redis (CACHES, cf. settings).
+
+Chaque réponse porte un ETag ; un client qui renvoie If-None-Match reçoit
+304 sans corps. Les succès et défauts de cache sont comptés par endpoint
+(commande response_cache_stats).
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+KEY_PREFIX = 'respcache'
+# Endpoints décorés, pour les statistiques
+CACHED_ENDPOINTS = []
+
+
+def version_key(namespace):
+    return f'{KEY_PREFIX}:version:{namespace}'
+
+
+def stats_key(endpoint, outcome):
+    return f'{KEY_PREFIX}:stats:{endpoint}:{outcome}'
+
+
+def incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Clé absente (premier appel ou éviction)
+        if cache.add(key, 1, None):
+            return 1
+        return cache.incr(key)
+
+
+def data_versions(namespaces):
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+def invalidate(namespace):
+    """Rend obsolètes toutes les réponses qui dépendent de `namespace`, une fois la transaction validée."""
+    transaction.on_commit(lambda: incr(version_key(namespace)))
+
+
+def compute_etag(data):
+    payload = json.dumps(data, sort_keys=True, default=str, separators=(',', ':'))
+    return '"%s"' % hashlib.sha1(payload.encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    candidates = [value.strip() for value in header.split(',')]
+    return etag in candidates or '*' in candidates
+
+
+def cache_response(endpoint, depends_on, scope):
+    """
+    Met en cache la réponse 200 d'une action de viewset.
+
+    `depends_on` liste les espaces de données (hospitals, users,
+    patient_doctors) dont la réponse dépend ; `scope(request)` retourne les
+    éléments de l'utilisateur qui la font varier.
+    """
+    CACHED_ENDPOINTS.append(endpoint)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            params = sorted(
+                (name, value) for name, values in request.query_params.lists() for value in values
+            )
+            parts = [endpoint, request.get_host(), request.path, scope(request), params, data_versions(depends_on)]
+            key = f'{KEY_PREFIX}:{endpoint}:' + hashlib.sha1(repr(parts).encode()).hexdigest()
+
+            entry = cache.get(key)
+            if entry is None:
+                incr(stats_key(endpoint, 'miss'))
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                data = response.data
+                etag = compute_etag(data)
+                cache.set(key, (data, etag), settings.RESPONSE_CACHE_TIMEOUT)
+            else:
+                incr(stats_key(endpoint, 'hit'))
+                data, etag = entry
+
+            headers = {
+                'ETag': etag,
+                # Réponses propres à l'utilisateur : pas de cache partagé (proxy)
+                'Cache-Control': 'private, no-cache',
+                'Vary': 'Authorization',
+            }
+            if etag_matches(request, etag):
+                incr(stats_key(endpoint, 'not_modified'))
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            return Response(data, headers=headers)
+        return wrapper
+    return decorator
+
+
+def endpoint_stats():
+    """Compteurs par endpoint : succès, défauts, 304 et taux de succès."""
+    stats = {}
+    for endpoint in CACHED_ENDPOINTS:
+        keys = [stats_key(endpoint, outcome) for outcome in ('hit', 'miss', 'not_modified')]
+        values = cache.get_many(keys)
+        hits, misses, not_modified = (values.get(key, 0) for key in keys)
+        total = hits + misses
+        stats[endpoint] = {
+            'hits': hits,
+            'misses': misses,
+            'not_modified': not_modified,
+            'hit_ratio': round(hits / total, 3) if total else None,
+        }
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([
+        stats_key(endpoint, outcome)
+        for endpoint in CACHED_ENDPOINTS for outcome in ('hit', 'miss', 'not_modified')
+    ])
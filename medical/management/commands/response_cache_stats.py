@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from medical import views  # noqa: F401  (enregistre les endpoints en cache)
+from medical.cache import endpoint_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Taux de succès du cache de réponses, par endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Sortie JSON uniquement")
+        parser.add_argument('--reset', action='store_true', help="Remet les compteurs à zéro après affichage")
+
+    def handle(self, *args, **options):
+        stats = endpoint_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            for endpoint, s in stats.items():
+                ratio = f"{s['hit_ratio']:.1%}" if s['hit_ratio'] is not None else '-'
+                self.stdout.write(
+                    f"{endpoint:>15} : {s['hits']} succès, {s['misses']} défauts ({ratio}), "
+                    f"{s['not_modified']} réponses 304"
+                )
+        if options['reset']:
+            reset_stats()
@@ -80,6 +80,9 @@ class PatientDoctor(models.Model):
         verbose_name_plural = _('Relations Patient-Médecin')
         unique_together = ['patient', 'doctor']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['doctor', '-created_at'], name='patientdoctor_doctor_idx'),
+        ]
 
     def __str__(self):
         return f"{self.patient} - {self.doctor}"
@@ -117,6 +120,11 @@ class Appointment(models.Model):
         verbose_name = _('Rendez-vous')
         verbose_name_plural = _('Rendez-vous')
         ordering = ['-date']
+        indexes = [
+            # Listes filtrées par rôle, triées par date décroissante
+            models.Index(fields=['doctor', '-date', '-id'], name='appointment_doctor_date_idx'),
+            models.Index(fields=['patient', '-date', '-id'], name='appointment_patient_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.patient} - {self.doctor} - {self.date}"
@@ -147,6 +155,21 @@ class MedicalRecord(models.Model):
         verbose_name = _('Dossier médical')
         verbose_name_plural = _('Dossiers médicaux')
         ordering = ['-record_date']
+        indexes = [
+            models.Index(fields=['doctor', '-record_date', '-id'], name='record_doctor_date_idx'),
+            models.Index(fields=['patient', '-record_date', '-id'], name='record_patient_date_idx'),
+            # ?is_active=true : index partiel, limité aux dossiers actifs
+            models.Index(
+                fields=['doctor', '-record_date', '-id'],
+                name='record_doctor_active_idx',
+                condition=models.Q(is_active=True)
+            ),
+            models.Index(
+                fields=['patient', '-record_date', '-id'],
+                name='record_patient_active_idx',
+                condition=models.Q(is_active=True)
+            ),
+        ]
 
     def __str__(self):
         return f"Dossier de {self.patient} - {self.record_date}"
@@ -170,6 +193,9 @@ class MedicalHistory(models.Model):
         verbose_name = _('Antécédent médical')
         verbose_name_plural = _('Antécédents médicaux')
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['medical_record', '-start_date', '-id'], name='history_record_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.condition} - {self.medical_record.patient}"
@@ -195,6 +221,15 @@ class Treatment(models.Model):
         verbose_name = _('Traitement')
         verbose_name_plural = _('Traitements')
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['medical_record', '-start_date', '-id'], name='treatment_record_date_idx'),
+            # Traitements en cours
+            models.Index(
+                fields=['medical_record', '-start_date', '-id'],
+                name='treatment_active_idx',
+                condition=models.Q(is_active=True)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.medication} - {self.medical_record.patient}"
@@ -218,6 +253,9 @@ class Examination(models.Model):
         verbose_name = _('Examen')
         verbose_name_plural = _('Examens')
         ordering = ['-exam_date']
+        indexes = [
+            models.Index(fields=['medical_record', '-exam_date', '-id'], name='exam_record_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.exam_type} - {self.medical_record.patient}"
@@ -0,0 +1,151 @@
+import datetime
+import json
+from collections import OrderedDict
+from decimal import Decimal
+from uuid import UUID
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Pagination par clé (keyset) pour les listes volumineuses.
+
+    Le curseur contient les valeurs de tous les champs de tri de la dernière
+    ligne de la page, plus l'id qui départage les égalités : la page suivante
+    est lue par `WHERE (tri) > (curseur) ORDER BY tri LIMIT n`, sans OFFSET,
+    dans un index composite. La page 10 000 coûte donc autant que la première.
+
+    Le tri est celui de la vue (?ordering= via OrderingFilter, puis `ordering`),
+    sinon `ordering` de la pagination, sinon celui du modèle. Les champs de
+    tri ne doivent pas être nuls.
+
+    ?page_size=n choisit la taille de page (au plus `max_page_size`) et
+    ?count=false supprime le total, qui reste un COUNT(*) sur le filtre.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+    ordering = None
+    tiebreaker = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [self.get_field(queryset.model, name) for name in self.ordering]
+        self.count = queryset.count() if self.include_count(request) else None
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor.reverse if cursor else False
+        order = [self.flip(name) for name in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*order)
+        if cursor and cursor.position is not None:
+            queryset = queryset.filter(self.after(self.decode_position(cursor.position), reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', ()):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        ordering = list(
+            ordering or type(self).ordering or getattr(view, 'ordering', None)
+            or queryset.model._meta.ordering or ['-' + self.tiebreaker]
+        )
+        assert not any('__' in name for name in ordering), (
+            "La pagination par clé ne gère pas le tri sur une relation."
+        )
+        # Départage des égalités sur l'id, dans le sens du dernier champ
+        if not {name.lstrip('-') for name in ordering} & {self.tiebreaker, 'pk'}:
+            ordering.append(('-' if ordering[-1].startswith('-') else '') + self.tiebreaker)
+        return tuple(ordering)
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, 'true').lower() not in ('false', '0', 'no')
+
+    @staticmethod
+    def flip(name):
+        return name[1:] if name.startswith('-') else '-' + name
+
+    @staticmethod
+    def get_field(model, name):
+        name = name.lstrip('-')
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+    def after(self, position, reverse):
+        """Lignes situées après `position` dans l'ordre de lecture."""
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, position):
+            descending = name.startswith('-') != reverse
+            field = name.lstrip('-')
+            condition |= equal & Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def encode_value(self, value):
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, (Decimal, UUID)):
+            return str(value)
+        return value
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position)
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def position_of(self, obj):
+        return json.dumps([self.encode_value(getattr(obj, field.attname)) for field in self.fields])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.position_of(self.page[-1]) if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.position_of(self.page[0]) if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties'] = {
+            'count': {'type': 'integer', 'example': 123},
+            **schema['properties'],
+        }
+        return schema
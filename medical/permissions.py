@@ -1,5 +1,14 @@
 from rest_framework import permissions
-from medical.models import PatientDoctor
+from .relations import filter_by_doctor_patients, is_doctor_of
+
+
+def get_patient_id(obj):
+    """Patient d'un dossier, d'un élément de dossier, d'un rendez-vous ou d'une relation."""
+    if hasattr(obj, 'medical_record_id'):
+        # Antécédent, traitement ou examen
+        obj = obj.medical_record
+    return obj.patient_id
+
 
 class IsSuperAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -27,14 +36,45 @@ class IsSameHospital(permissions.BasePermission):
             return False
         return obj.hospital == request.user.hospital
 
-class IsPatientDoctor(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
+class PatientRelationPermission(permissions.BasePermission):
+    """
+    Accès aux objets d'un patient : le patient lui-même ou un médecin lié.
+    Les patients du médecin sont chargés une fois par requête (medical.relations),
+    chaque contrôle est ensuite une recherche dans un ensemble.
+    """
+    def get_patient_id(self, obj):
+        return get_patient_id(obj)
+
+    def has_patient_permission(self, request, patient_id):
+        if request.user.role == 'PATIENT':
+            return patient_id == request.user.pk
         if request.user.role == 'DOCTOR':
-            return obj.patient in request.user.patients.all()
-        elif request.user.role == 'PATIENT':
-            return obj.patient == request.user
+            return is_doctor_of(request.user, patient_id)
         return False
 
+    def has_object_permission(self, request, view, obj):
+        return self.has_patient_permission(request, self.get_patient_id(obj))
+
+    def filter_objects(self, request, view, objects):
+        """Contrôle groupé : objets de `objects` autorisés, sans requête par objet."""
+        return [obj for obj in objects if self.has_object_permission(request, view, obj)]
+
+    def filter_queryset(self, request, queryset, patient_field='patient', doctor_field='doctor'):
+        """
+        Contrôle groupé sur un queryset (get_queryset des vues) : le patient
+        voit ses objets, le médecin ceux dont il est l'auteur (`doctor_field`)
+        et dont le patient (`patient_field`) lui est lié.
+        """
+        user = request.user
+        if user.role == 'PATIENT' and self.has_patient_permission(request, user.pk):
+            return queryset.filter(**{patient_field: user})
+        if user.role == 'DOCTOR':
+            return filter_by_doctor_patients(queryset.filter(**{doctor_field: user}), user, patient_field)
+        return queryset.none()
+
+class IsPatientDoctor(PatientRelationPermission):
+    pass
+
 class IsAppointmentParticipant(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.role == 'DOCTOR':
@@ -45,29 +85,14 @@ class IsAppointmentParticipant(permissions.BasePermission):
             return obj.doctor.hospital == request.user.hospital
         return False
 
-class IsMedicalRecordParticipant(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        # Le patient peut voir son propre dossier
-        if request.user.role == 'PATIENT':
-            return obj.patient == request.user
-        
-        # Le médecin peut voir les dossiers de ses patients
-        if request.user.role == 'DOCTOR':
-            return PatientDoctor.objects.filter(
-                patient=obj.patient,
-                doctor=request.user
-            ).exists()
-        
-        # Les secrétaires n'ont pas accès aux dossiers médicaux
-        return False
+class IsMedicalRecordParticipant(PatientRelationPermission):
+    # Le patient voit son propre dossier, le médecin ceux de ses patients ;
+    # les secrétaires n'ont pas accès aux dossiers médicaux
+    pass
 
-class CanEditMedicalRecord(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
+class CanEditMedicalRecord(PatientRelationPermission):
+    def has_patient_permission(self, request, patient_id):
         # Seuls les médecins liés au patient peuvent modifier le dossier
         if request.user.role == 'DOCTOR':
-            return PatientDoctor.objects.filter(
-                patient=obj.patient,
-                doctor=request.user
-            ).exists()
-        
-        return False 
\ No newline at end of file
+            return is_doctor_of(request.user, patient_id)
+        return False
@@ -0,0 +1,53 @@
+"""Résolution des relations patient-médecin pour les contrôles d'accès.
+
+Les permissions vérifiaient chaque objet par une requête
+`PatientDoctor.objects.filter(...).exists()`. Ici l'ensemble des patients
+d'un médecin est chargé une seule fois :
+- mémorisé sur l'objet utilisateur, donc pour toute la requête HTTP
+  (comme le cache des permissions de ModelBackend) ;
+- conservé dans le cache Django entre les requêtes, et invalidé à chaque
+  création ou suppression de PatientDoctor (medical.signals).
+
+Les créations groupées (bulk_create) et les update() n'émettent pas de
+signal : appeler invalidate_doctor_patients() après coup. Avec plusieurs
+processus, le cache doit être partagé (Redis, Memcached...) ; sinon
+PATIENT_DOCTOR_CACHE_TIMEOUT borne la durée pendant laquelle un autre
+processus peut voir une relation supprimée.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import PatientDoctor
+
+CACHE_KEY = 'medical:doctor-patients:{}'
+USER_CACHE_ATTRIBUTE = '_patient_ids_cache'
+
+
+def doctor_patient_ids(doctor):
+    """Identifiants des patients liés au médecin `doctor` (frozenset)."""
+    patient_ids = getattr(doctor, USER_CACHE_ATTRIBUTE, None)
+    if patient_ids is None:
+        key = CACHE_KEY.format(doctor.pk)
+        patient_ids = cache.get(key)
+        if patient_ids is None:
+            patient_ids = frozenset(
+                PatientDoctor.objects.filter(doctor_id=doctor.pk).values_list('patient_id', flat=True)
+            )
+            cache.set(key, patient_ids, settings.PATIENT_DOCTOR_CACHE_TIMEOUT)
+        setattr(doctor, USER_CACHE_ATTRIBUTE, patient_ids)
+    return patient_ids
+
+
+def is_doctor_of(doctor, patient_id):
+    return patient_id in doctor_patient_ids(doctor)
+
+
+def filter_by_doctor_patients(queryset, doctor, patient_field='patient'):
+    """Restreint `queryset` aux lignes dont `patient_field` est un patient du médecin."""
+    return queryset.filter(**{f'{patient_field}__in': doctor_patient_ids(doctor)})
+
+
+def invalidate_doctor_patients(doctor_id):
+    """Oublie les patients en cache du médecin, une fois la transaction validée."""
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY.format(doctor_id)))
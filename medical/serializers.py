@@ -1,9 +1,29 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from pycrafted.metrics import SERIALIZER_DURATION, timer
 from .models import Hospital, PatientDoctor, Appointment, Examination, Treatment, MedicalHistory, MedicalRecord
 
 User = get_user_model()
 
+class TimedListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if self.parent is not None:
+            return super().to_representation(data)
+        with timer(SERIALIZER_DURATION, serializer=type(self.child).__name__):
+            return super().to_representation(data)
+
+class TimedSerializerMixin:
+    """
+    Mesure le temps de sérialisation de la réponse (serializer_duration_seconds),
+    relations imbriquées et requêtes SQL différées comprises. Seul le
+    serializer racine est mesuré ; penser à Meta.list_serializer_class.
+    """
+    def to_representation(self, instance):
+        if self.parent is not None:
+            return super().to_representation(instance)
+        with timer(SERIALIZER_DURATION, serializer=type(self).__name__):
+            return super().to_representation(instance)
+
 class HospitalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hospital
@@ -83,7 +103,7 @@ class MedicalHistorySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+class MedicalRecordSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     patient_details = UserSerializer(source='patient', read_only=True)
     doctor_details = UserSerializer(source='doctor', read_only=True)
     medical_histories = MedicalHistorySerializer(many=True, read_only=True)
@@ -102,4 +122,5 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
             'examinations', 'history_count', 'treatment_count',
             'examination_count', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at'] 
\ No newline at end of file
+        read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = TimedListSerializer 
\ No newline at end of file
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache as response_cache
+from .models import Hospital, PatientDoctor, User
+from .relations import invalidate_doctor_patients
+
+
+@receiver(post_save, sender=PatientDoctor)
+@receiver(post_delete, sender=PatientDoctor)
+def patient_doctor_changed(sender, instance, **kwargs):
+    invalidate_doctor_patients(instance.doctor_id)
+    response_cache.invalidate('patient_doctors')
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+def hospital_changed(sender, instance, **kwargs):
+    response_cache.invalidate('hospitals')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    response_cache.invalidate('users')
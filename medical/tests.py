@@ -1,3 +1,108 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import Appointment, Hospital, PatientDoctor, User
+
+
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital.objects.create(name='Hôpital A', address='-', phone='-', email='a@example.org')
+        cls.doctor = User.objects.create(username='doctor', role=User.Role.DOCTOR, hospital=cls.hospital)
+        cls.patient = User.objects.create(username='patient', role=User.Role.PATIENT)
+        PatientDoctor.objects.create(patient=cls.patient, doctor=cls.doctor)
+
+    def setUp(self):
+        cache.clear()
+        self.client = self.client_for(self.doctor)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+
+class KeysetPaginationTests(ApiTestCase):
+    url = '/api/appointments/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now().replace(microsecond=0)
+        # Dates en double : l'id départage les égalités du tri
+        Appointment.objects.bulk_create([
+            Appointment(patient=cls.patient, doctor=cls.doctor, date=now - timedelta(days=n // 3))
+            for n in range(25)
+        ])
+        cls.expected = list(Appointment.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+    def walk(self, url, link):
+        ids, pages = [], 0
+        while url:
+            body = self.client.get(url).json()
+            ids.extend(item['id'] for item in body['results'])
+            url = body[link]
+            pages += 1
+        return ids, pages, body
+
+    def test_next_links_cover_every_row_once(self):
+        ids, pages, _ = self.walk(f'{self.url}?page_size=10', 'next')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, 3)
+
+    def test_previous_links_lead_back(self):
+        _, _, last = self.walk(f'{self.url}?page_size=10', 'next')
+        ids, _, _ = self.walk(last['previous'], 'previous')
+        self.assertEqual(ids, self.expected[10:20] + self.expected[:10])
+
+    def test_count_and_invalid_cursor(self):
+        body = self.client.get(f'{self.url}?page_size=5').json()
+        self.assertEqual(body['count'], 25)
+        self.assertIsNone(body['previous'])
+        self.assertNotIn('count', self.client.get(f'{self.url}?page_size=5&count=false').json())
+        self.assertEqual(self.client.get(f'{self.url}?cursor=invalide').status_code, 404)
+
+
+class ResponseCacheTests(ApiTestCase):
+    url = '/api/hospitals/'
+
+    def test_matching_etag_returns_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"autre"').status_code, 200)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Hospital.objects.create(name='Hôpital B', address='-', phone='-', email='b@example.org')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_disabled_without_token(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_requires_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer autre').status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
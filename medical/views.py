@@ -1,3 +1,5 @@
+import logging
+
 from django.shortcuts import render
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
@@ -13,6 +15,8 @@ from .serializers import (
     AppointmentSerializer, MedicalRecordSerializer, MedicalHistorySerializer,
     TreatmentSerializer, ExaminationSerializer
 )
+from .cache import cache_response
+from .pagination import KeysetPagination
 from .permissions import (
     IsSuperAdmin, IsHospitalAdmin, IsDoctor, IsSecretary,
     IsPatient, IsSameHospital, IsPatientDoctor, IsAppointmentParticipant,
@@ -21,6 +25,17 @@ from .permissions import (
 from django_filters.rest_framework import DjangoFilterBackend
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+def hospital_scope(request):
+    # Un administrateur d'hôpital ne voit que le sien, les autres rôles voient tout
+    user = request.user
+    return (user.role, user.hospital_id if user.role == 'HOSPITAL_ADMIN' else None)
+
+def user_list_scope(request):
+    # Médecins et secrétaires se voient eux-mêmes dans la liste : réponse propre à chacun
+    user = request.user
+    return (user.role, user.hospital_id, user.pk if user.role in ('DOCTOR', 'SECRETARY') else None)
 
 class HospitalViewSet(viewsets.ModelViewSet):
     """
@@ -46,6 +61,10 @@ class HospitalViewSet(viewsets.ModelViewSet):
         # TOUS les autres rôles (patients, secrétaires, etc.) voient tous les hôpitaux
         return Hospital.objects.all()
 
+    @cache_response('hospitals-list', depends_on=['hospitals'], scope=hospital_scope)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_object(self):
         obj = super().get_object()
         if self.request.user.role == 'HOSPITAL_ADMIN' and obj.id != self.request.user.hospital.id:
@@ -63,16 +82,11 @@ class UserViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        print(f"User role: {user.role}")
-        print(f"User hospital: {user.hospital}")
-        
         queryset = None
         if user.role == 'SUPER_ADMIN':
             queryset = User.objects.all()
         elif user.role == 'HOSPITAL_ADMIN':
             queryset = User.objects.filter(hospital=user.hospital)
-            print(f"Filtering users for hospital {user.hospital.id}")
-            print(f"Found {queryset.count()} users")
         elif user.role == 'DOCTOR':
             queryset = User.objects.filter(
                 Q(role='PATIENT', doctors__doctor=user) |
@@ -93,13 +107,14 @@ class UserViewSet(viewsets.ModelViewSet):
         hospital = self.request.query_params.get('hospital', None)
         
         if role:
-            print(f"Filtering by role: {role}")
             queryset = queryset.filter(role=role)
         if hospital:
-            print(f"Filtering by hospital: {hospital}")
             queryset = queryset.filter(hospital=hospital)
-            
-        print(f"Final queryset count: {queryset.count()}")
+
+        logger.debug(
+            "Utilisateurs visibles par %s (rôle %s), filtres role=%s hospital=%s",
+            user.pk, user.role, role, hospital
+        )
         return queryset
 
     def get_permissions(self):
@@ -126,6 +141,7 @@ class UserViewSet(viewsets.ModelViewSet):
             403: "Permission refusée"
         }
     )
+    @cache_response('users-list', depends_on=['users', 'hospitals', 'patient_doctors'], scope=user_list_scope)
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
@@ -142,6 +158,7 @@ class UserViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
     @action(detail=False, methods=['get'])
+    @cache_response('users-me', depends_on=['users', 'hospitals'], scope=lambda request: request.user.pk)
     def me(self, request):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
@@ -162,6 +179,7 @@ class PatientDoctorViewSet(viewsets.ModelViewSet):
 class AppointmentViewSet(viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsAppointmentParticipant]
 
     def get_queryset(self):
@@ -214,6 +232,7 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
     """
     queryset = MedicalRecord.objects.all()
     serializer_class = MedicalRecordSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsMedicalRecordParticipant]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['patient', 'doctor', 'record_date', 'is_active']
@@ -222,13 +241,9 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
     ordering = ['-record_date']
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return MedicalRecord.objects.filter(patient=user)
-        elif user.role == 'DOCTOR':
-            return MedicalRecord.objects.filter(doctor=user)
-        # Les secrétaires n'ont pas accès aux dossiers médicaux
-        return MedicalRecord.objects.none()
+        # Patient : ses dossiers ; médecin : ceux qu'il a rédigés pour ses
+        # patients ; les secrétaires n'ont pas accès aux dossiers médicaux
+        return IsMedicalRecordParticipant().filter_queryset(self.request, MedicalRecord.objects.all())
 
     def perform_create(self, serializer):
         medical_record = serializer.save()
@@ -263,6 +278,7 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
 class MedicalHistoryViewSet(viewsets.ModelViewSet):
     queryset = MedicalHistory.objects.all()
     serializer_class = MedicalHistorySerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsMedicalRecordParticipant]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['medical_record', 'condition', 'is_active']
@@ -271,17 +287,15 @@ class MedicalHistoryViewSet(viewsets.ModelViewSet):
     ordering = ['-start_date']
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return MedicalHistory.objects.filter(medical_record__patient=user)
-        elif user.role == 'DOCTOR':
-            return MedicalHistory.objects.filter(medical_record__doctor=user)
         # Les secrétaires n'ont pas accès aux antécédents médicaux
-        return MedicalHistory.objects.none()
+        return IsMedicalRecordParticipant().filter_queryset(
+            self.request, MedicalHistory.objects.all(), 'medical_record__patient', 'medical_record__doctor'
+        )
 
 class TreatmentViewSet(viewsets.ModelViewSet):
     queryset = Treatment.objects.all()
     serializer_class = TreatmentSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsMedicalRecordParticipant]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['medical_record', 'medication', 'is_active']
@@ -290,17 +304,15 @@ class TreatmentViewSet(viewsets.ModelViewSet):
     ordering = ['-start_date']
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return Treatment.objects.filter(medical_record__patient=user)
-        elif user.role == 'DOCTOR':
-            return Treatment.objects.filter(medical_record__doctor=user)
         # Les secrétaires n'ont pas accès aux traitements
-        return Treatment.objects.none()
+        return IsMedicalRecordParticipant().filter_queryset(
+            self.request, Treatment.objects.all(), 'medical_record__patient', 'medical_record__doctor'
+        )
 
 class ExaminationViewSet(viewsets.ModelViewSet):
     queryset = Examination.objects.all()
     serializer_class = ExaminationSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsMedicalRecordParticipant]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['medical_record', 'exam_type', 'is_active']
@@ -309,10 +321,7 @@ class ExaminationViewSet(viewsets.ModelViewSet):
     ordering = ['-exam_date']
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return Examination.objects.filter(medical_record__patient=user)
-        elif user.role == 'DOCTOR':
-            return Examination.objects.filter(medical_record__doctor=user)
         # Les secrétaires n'ont pas accès aux examens
-        return Examination.objects.none()
+        return IsMedicalRecordParticipant().filter_queryset(
+            self.request, Examination.objects.all(), 'medical_record__patient', 'medical_record__doctor'
+        )
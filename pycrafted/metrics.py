@@ -0,0 +1,161 @@
+"""Métriques de performance au format texte Prometheus, exposées sur /metrics.
+
+Histogrammes en mémoire, par processus (comme OrthancCallStats) : avec
+plusieurs workers, chaque processus expose ses propres valeurs et
+Prometheus les agrège par instance.
+
+Les temps passés hors de la vue pendant une requête (appels Orthanc) sont
+attribués à la requête en cours via un ContextVar positionné par
+RequestTimingMiddleware ; timer() mesure n'importe quel bloc de code
+(analyse pydicom, sérialisation...).
+"""
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Latences (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REGISTRY = []
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._series = {}
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: ([*counts], total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(pairs + [('le', format_number(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(pairs)} {format_number(total)}')
+            lines.append(f'{self.name}_count{format_labels(pairs)} {count}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUEST_LABELS = ('route', 'method', 'status')
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', "Durée totale des requêtes HTTP.", REQUEST_LABELS)
+REQUEST_SQL_QUERIES = Histogram(
+    'http_request_sql_queries', "Nombre de requêtes SQL par requête HTTP.", REQUEST_LABELS, COUNT_BUCKETS)
+REQUEST_SQL_DURATION = Histogram(
+    'http_request_sql_duration_seconds', "Temps SQL cumulé par requête HTTP.", REQUEST_LABELS)
+REQUEST_EXTERNAL_DURATION = Histogram(
+    'http_request_external_duration_seconds', "Temps cumulé des appels externes (Orthanc) par requête HTTP.",
+    REQUEST_LABELS)
+RESPONSE_BYTES = Histogram(
+    'http_response_bytes', "Taille du corps des réponses HTTP (hors réponses en flux).", REQUEST_LABELS,
+    BYTES_BUCKETS)
+ORTHANC_DURATION = Histogram(
+    'orthanc_request_duration_seconds', "Latence des appels à Orthanc.", ('method', 'resource', 'status'))
+DICOM_PARSE_DURATION = Histogram(
+    'dicom_parse_duration_seconds', "Temps de lecture des en-têtes DICOM (pydicom).")
+DICOM_RENDER_DURATION = Histogram(
+    'dicom_render_duration_seconds', "Temps de rendu JPEG/PNG d'une frame DICOM (hors cache).")
+SERIALIZER_DURATION = Histogram(
+    'serializer_duration_seconds', "Temps de sérialisation des réponses, par serializer.", ('serializer',))
+
+
+class RequestMetrics:
+    """Temps externes cumulés pendant la requête en cours."""
+
+    def __init__(self):
+        self.external_seconds = 0.0
+
+
+current_request = contextvars.ContextVar('current_request_metrics', default=None)
+
+
+def record_external(seconds):
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.external_seconds += seconds
+
+
+@contextmanager
+def timer(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def render_metrics():
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    for histogram in REGISTRY:
+        histogram.reset()
+
+
+def metrics_view(request):
+    """GET /metrics : exige `Authorization: Bearer <METRICS_TOKEN>`.
+
+    Sans METRICS_TOKEN, l'URL n'est pas exposée (404) : les métriques
+    révèlent les routes et le trafic de l'application.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        raise Http404
+    provided = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(provided, token):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,174 @@
+"""Mesure de la durée et du nombre de requêtes SQL de chaque requête HTTP.
+
+Pour chaque requête :
+- histogrammes Prometheus par route (nom de la vue, qui inclut l'action
+  DRF), méthode et statut : durée totale, nombre et durée des requêtes SQL,
+  temps des appels Orthanc, taille de la réponse (pycrafted.metrics) ;
+- une ligne sur le logger `pycrafted.requests` (niveau INFO) ;
+- avec REQUEST_TIMING_HEADERS, un en-tête Server-Timing.
+
+Le comptage SQL passe par connection.execute_wrapper et ne dépend donc pas
+de DEBUG. Si rien de tout cela n'est activé, la requête n'est pas
+instrumentée du tout.
+
+Avec REQUEST_PROFILE_DIR, une fraction des requêtes
+(REQUEST_PROFILE_SAMPLE_RATE) est exécutée sous cProfile ; le profil est
+écrit dans ce répertoire si la requête a duré plus de
+REQUEST_PROFILE_SLOW_MS (lisible avec `python -m pstats` ou snakeviz).
+
+Les vues asynchrones exécutent l'ORM dans un autre thread que la requête :
+leurs requêtes SQL ne sont pas comptées et elles ne sont pas profilées.
+"""
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+logger = logging.getLogger('pycrafted.requests')
+
+# cProfile ne profile qu'un thread à la fois de façon fiable
+_profile_lock = threading.Lock()
+
+
+class QueryCounter:
+    """Wrapper d'exécution SQL : nombre de requêtes et temps cumulé."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.headers = getattr(settings, 'REQUEST_TIMING_HEADERS', False)
+        self.metrics = getattr(settings, 'METRICS_ENABLED', True)
+        self.profile_dir = getattr(settings, 'REQUEST_PROFILE_DIR', None)
+        self.profile_rate = getattr(settings, 'REQUEST_PROFILE_SAMPLE_RATE', 0.01)
+        self.profile_slow = getattr(settings, 'REQUEST_PROFILE_SLOW_MS', 500) / 1000
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def enabled(self):
+        return self.metrics or self.headers or logger.isEnabledFor(logging.INFO)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled():
+            return self.get_response(request)
+        counter = QueryCounter()
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        profiler = self.start_profiler()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            metrics.current_request.reset(token)
+            if profiler is not None:
+                self.stop_profiler(profiler, request, duration)
+        self.report(request, response, duration, counter, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled():
+            return await self.get_response(request)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self.report(request, response, time.perf_counter() - start, None, request_metrics)
+        return response
+
+    def start_profiler(self):
+        if not self.profile_dir or random.random() >= self.profile_rate:
+            return None
+        if not _profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler, request, duration):
+        try:
+            profiler.disable()
+            if duration >= self.profile_slow:
+                name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(duration * 1000)}ms-{uuid.uuid4().hex[:8]}.prof"
+                path = os.path.join(self.profile_dir, name)
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(path)
+                logger.warning("Requête lente %s %s (%.1f ms) profilée dans %s",
+                               request.method, request.path, duration * 1000, path)
+        except OSError as e:
+            # Le profilage ne doit jamais faire échouer la requête
+            logger.warning("Écriture du profil impossible: %s", e)
+        finally:
+            _profile_lock.release()
+
+    def report(self, request, response, duration, counter, request_metrics):
+        match = getattr(request, 'resolver_match', None)
+        # Nom de la vue plutôt que le chemin : nombre de séries borné
+        endpoint = match.view_name if match else '<unmatched>'
+        external = request_metrics.external_seconds
+        if self.metrics:
+            labels = {'route': endpoint, 'method': request.method, 'status': response.status_code}
+            metrics.REQUEST_DURATION.observe(duration, **labels)
+            metrics.REQUEST_EXTERNAL_DURATION.observe(external, **labels)
+            if counter is not None:
+                metrics.REQUEST_SQL_QUERIES.observe(counter.count, **labels)
+                metrics.REQUEST_SQL_DURATION.observe(counter.duration, **labels)
+            if not response.streaming:
+                metrics.RESPONSE_BYTES.observe(len(response.content), **labels)
+
+        if counter is not None:
+            logger.info(
+                "%s %s %s %.1f ms, %d requêtes SQL (%.1f ms), Orthanc %.1f ms",
+                request.method, endpoint, response.status_code, duration * 1000,
+                counter.count, counter.duration * 1000, external * 1000,
+                extra={
+                    'endpoint': endpoint, 'status_code': response.status_code,
+                    'duration_ms': duration * 1000, 'sql_queries': counter.count,
+                    'sql_ms': counter.duration * 1000, 'external_ms': external * 1000,
+                },
+            )
+        else:
+            logger.info(
+                "%s %s %s %.1f ms, Orthanc %.1f ms",
+                request.method, endpoint, response.status_code, duration * 1000, external * 1000,
+                extra={
+                    'endpoint': endpoint, 'status_code': response.status_code,
+                    'duration_ms': duration * 1000, 'external_ms': external * 1000,
+                },
+            )
+        if self.headers:
+            timings = [f'app;dur={duration * 1000:.1f}']
+            if counter is not None:
+                timings.append(f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"')
+            timings.append(f'orthanc;dur={external * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(timings)
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pycrafted.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -171,6 +172,111 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# Journalisation : une ligne par requête HTTP (durée, requêtes SQL) sur
+# pycrafted.requests, messages applicatifs sur medical et dicom_app
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+REQUEST_LOG_LEVEL = os.getenv('REQUEST_LOG_LEVEL', 'INFO')
+# En-têtes Server-Timing (durée totale et SQL) visibles dans le navigateur
+REQUEST_TIMING_HEADERS = os.getenv('REQUEST_TIMING_HEADERS', str(DEBUG)) == 'True'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        # Remplace la configuration par défaut de Django (évite les doublons)
+        'django': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'pycrafted.requests': {'level': REQUEST_LOG_LEVEL},
+        'medical': {'level': LOG_LEVEL},
+        'dicom_app': {'level': LOG_LEVEL},
+    },
+}
+
+# Métriques Prometheus (pycrafted.metrics), collectées si METRICS_ENABLED.
+# /metrics n'est servi qu'avec METRICS_TOKEN (404 sinon), que le collecteur
+# présente dans `Authorization: Bearer <jeton>`
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Profils cProfile des requêtes lentes : désactivé si REQUEST_PROFILE_DIR est vide
+REQUEST_PROFILE_DIR = os.getenv('REQUEST_PROFILE_DIR', '')
+REQUEST_PROFILE_SAMPLE_RATE = float(os.getenv('REQUEST_PROFILE_SAMPLE_RATE', '0.01'))
+REQUEST_PROFILE_SLOW_MS = int(os.getenv('REQUEST_PROFILE_SLOW_MS', '500'))
+
+# Cache partagé : Redis si REDIS_URL est défini (recommandé avec plusieurs
+# processus), sinon mémoire locale du processus
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('LOCMEM_CACHE_MAX_ENTRIES', '10000'))},
+        }
+    }
+# Durée de vie des réponses en cache (medical.cache)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '60'))
+
+# Patients de chaque médecin, en cache pour les contrôles d'accès (medical.relations)
+PATIENT_DOCTOR_CACHE_TIMEOUT = int(os.getenv('PATIENT_DOCTOR_CACHE_TIMEOUT', '300'))
+
 # DICOM Web configuration
 DICOM_WEB_URL = os.getenv('DICOM_WEB_URL', 'http://localhost:8000/api/dicom')
 OHIF_VIEWER_URL = os.getenv('OHIF_VIEWER_URL', 'http://localhost:3000/viewer')
+
+# Orthanc configuration
+ORTHANC_URL = os.getenv('ORTHANC_URL', 'http://localhost:8042')
+ORTHANC_USERNAME = os.getenv('ORTHANC_USERNAME', '')
+ORTHANC_PASSWORD = os.getenv('ORTHANC_PASSWORD', '')
+ORTHANC_POOL_SIZE = int(os.getenv('ORTHANC_POOL_SIZE', '10'))
+ORTHANC_CONNECT_TIMEOUT = float(os.getenv('ORTHANC_CONNECT_TIMEOUT', '3'))
+ORTHANC_READ_TIMEOUT = float(os.getenv('ORTHANC_READ_TIMEOUT', '30'))
+ORTHANC_MAX_RETRIES = int(os.getenv('ORTHANC_MAX_RETRIES', '2'))
+# Taille du pool de connexions des vues DICOMweb asynchrones (une boucle d'événements par processus)
+ORTHANC_ASYNC_POOL_SIZE = int(os.getenv('ORTHANC_ASYNC_POOL_SIZE', '100'))
+# Correspondances UID DICOM -> identifiant Orthanc gardées en mémoire (LRU)
+ORTHANC_ID_CACHE_SIZE = int(os.getenv('ORTHANC_ID_CACHE_SIZE', '10000'))
+# Suppressions envoyées en parallèle à Orthanc, et nombre maximal d'études par suppression groupée
+DICOM_DELETE_WORKERS = int(os.getenv('DICOM_DELETE_WORKERS', '8'))
+DICOM_BULK_DELETE_MAX = int(os.getenv('DICOM_BULK_DELETE_MAX', '500'))
+
+# DICOM storage and ingestion
+DICOM_STORAGE_ROOT = os.getenv('DICOM_STORAGE_ROOT', os.path.join(MEDIA_ROOT, 'dicom'))
+DICOM_INGEST_WORKERS = int(os.getenv('DICOM_INGEST_WORKERS', '4'))
+# Stockage adressé par contenu : 'local' (sous DICOM_STORAGE_ROOT) ou 's3' (MinIO)
+DICOM_STORAGE_BACKEND = os.getenv('DICOM_STORAGE_BACKEND', 'local')
+DICOM_S3_ENDPOINT = os.getenv('DICOM_S3_ENDPOINT', 'localhost:9000')
+DICOM_S3_ACCESS_KEY = os.getenv('DICOM_S3_ACCESS_KEY', '')
+DICOM_S3_SECRET_KEY = os.getenv('DICOM_S3_SECRET_KEY', '')
+DICOM_S3_BUCKET = os.getenv('DICOM_S3_BUCKET', 'dicom')
+DICOM_S3_SECURE = os.getenv('DICOM_S3_SECURE', 'False') == 'True'
+# Ingestion différée (commande run_ingest_worker)
+DICOM_INGEST_SPOOL_ROOT = os.getenv('DICOM_INGEST_SPOOL_ROOT', os.path.join(MEDIA_ROOT, 'dicom_spool'))
+DICOM_INGEST_LEASE_SECONDS = int(os.getenv('DICOM_INGEST_LEASE_SECONDS', '600'))
+DICOM_FORWARD_MAX_ATTEMPTS = int(os.getenv('DICOM_FORWARD_MAX_ATTEMPTS', '5'))
+DICOM_FORWARD_BACKOFF_SECONDS = int(os.getenv('DICOM_FORWARD_BACKOFF_SECONDS', '30'))
+# Rendu des images (endpoints rendered/thumbnail) : cache disque LRU borné en taille
+DICOM_RENDER_CACHE_DIR = os.getenv('DICOM_RENDER_CACHE_DIR', os.path.join(MEDIA_ROOT, 'dicom_rendered'))
+DICOM_RENDER_CACHE_MAX_BYTES = int(os.getenv('DICOM_RENDER_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+DICOM_RENDER_MAX_SIZE = int(os.getenv('DICOM_RENDER_MAX_SIZE', '2048'))
+DICOM_THUMBNAIL_SIZE = int(os.getenv('DICOM_THUMBNAIL_SIZE', '128'))
+# Vignettes calculées dès l'ingestion, en tâche de fond
+DICOM_THUMBNAIL_PREWARM = os.getenv('DICOM_THUMBNAIL_PREWARM', 'True') == 'True'
+DICOM_RENDER_PREWARM_WORKERS = int(os.getenv('DICOM_RENDER_PREWARM_WORKERS', '2'))